@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+
+class ActionStats:
+    __slots__ = ("count", "failures", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class ActionDispatcher:
+    # Moderation actions are handed to a bounded queue drained by a few background
+    # workers, so on_message only classifies and returns. The actions of one verdict
+    # run concurrently; anything that has to happen in order belongs inside one action.
+    def __init__(self, workers=4, maxsize=1000):
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue = None
+        self._tasks = []
+        self.actions = {}
+        self.dropped = 0
+
+    def _start(self):
+        self._queue = asyncio.Queue(self.maxsize)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    @property
+    def depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def submit(self, *actions):
+        # Each action is a (name, coroutine function) pair. Returns False when the queue
+        # is full and the verdict had to be dropped.
+        if self._queue is None:
+            self._start()
+        try:
+            self._queue.put_nowait(actions)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"Action queue full, dropped: {', '.join(name for name, _ in actions)}")
+            return False
+        return True
+
+    async def _worker(self):
+        while True:
+            actions = await self._queue.get()
+            try:
+                await asyncio.gather(*(self._run(name, action) for name, action in actions))
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, name, action):
+        stats = self.actions.get(name)
+        if stats is None:
+            stats = self.actions[name] = ActionStats()
+        start = time.perf_counter()
+        try:
+            await action()
+        except Exception as e:
+            stats.failures += 1
+            print(f"Moderation action '{name}' failed: {e}")
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.count += 1
+            stats.total += elapsed
+            if elapsed > stats.max:
+                stats.max = elapsed
+
+    async def join(self):
+        if self._queue is not None:
+            await self._queue.join()
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "dropped": self.dropped,
+            "actions": {
+                name: {"count": s.count, "failures": s.failures, "avg_ms": s.average * 1000, "max_ms": s.max * 1000}
+                for name, s in self.actions.items()
+            },
+        }
+
+
+action_dispatcher = ActionDispatcher()
@@ -0,0 +1,128 @@
+import functools
+import io
+import os
+import time
+from urllib.parse import parse_qs, urlparse
+import discord
+import PIL.ImageFont
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+# Discord signs attachment URLs with an expiry (the ex parameter); stop reusing one a
+# while before that, and cap how long one without an expiry is trusted
+URL_MARGIN = 3600
+URL_MAX_AGE = 12 * 3600
+
+
+def read_asset(filename):
+    with open(os.path.join(ASSET_DIR, filename), "rb") as f:
+        return f.read()
+
+
+class ImageAsset:
+    # A static image read into memory once. Every upload gets its own discord.File over
+    # the same bytes (BytesIO shares an unmodified bytes object instead of copying it).
+    # The CDN URL Discord assigns to an upload is reused for embed thumbnails until its
+    # signature is about to expire, so most responses carry no attachment at all.
+    def __init__(self, filename):
+        self.filename = filename
+        self.data = read_asset(filename)
+        self._url = None
+        self._url_expires = 0.0
+        self._source = None
+        self.uploads = 0
+        self.reused = 0
+
+    def file(self):
+        return discord.File(io.BytesIO(self.data), filename=self.filename)
+
+    @property
+    def url(self):
+        if self._url is not None and time.time() < self._url_expires - URL_MARGIN:
+            return self._url
+        return None
+
+    def thumbnail(self, embed):
+        # Sets the image as the embed's thumbnail and returns the extra send arguments
+        # that takes: nothing while a CDN URL is cached, otherwise the file itself
+        url = self.url
+        if url is not None:
+            self.reused += 1
+            embed.set_thumbnail(url=url)
+            return {}
+        self.uploads += 1
+        embed.set_thumbnail(url=f"attachment://{self.filename}")
+        return {"file": self.file()}
+
+    def remember(self, message):
+        for embed in message.embeds:
+            url = embed.thumbnail.url if embed.thumbnail else None
+            if url and urlparse(url).path.endswith(f"/{self.filename}"):
+                expires = parse_qs(urlparse(url).query).get("ex")
+                now = time.time()
+                self._url = url
+                self._url_expires = min(int(expires[0], 16), now + URL_MAX_AGE) if expires else now + URL_MAX_AGE
+                self._source = (message.channel.id, message.id)
+                return True
+        return False
+
+    def forget(self, channel_id, message_ids=None):
+        # The URL dies with the message that uploaded it, so stop lending it out once that
+        # message (or its whole channel) is deleted
+        if self._source is None or self._source[0] != channel_id:
+            return
+        if message_ids is None or self._source[1] in message_ids:
+            self._url = None
+            self._source = None
+
+    def stats(self):
+        return {
+            "bytes": len(self.data),
+            "uploads": self.uploads,
+            "reused": self.reused,
+            "url_cached": int(self.url is not None),
+        }
+
+
+class FontAsset:
+    def __init__(self, filename):
+        self.filename = filename
+        self.data = read_asset(filename)
+
+    @functools.lru_cache(maxsize=8)
+    def font(self, size):
+        return PIL.ImageFont.truetype(io.BytesIO(self.data), size)
+
+
+logo = ImageAsset("PeaceKeeper.png")
+arial = FontAsset("arial.ttf")
+
+
+async def respond_with_logo(ctx, embed, **kwargs):
+    kwargs.update(logo.thumbnail(embed))
+    response = await ctx.respond(embed=embed, **kwargs)
+    # Only a message that stays around can lend its upload's URL to later responses
+    if "file" in kwargs and not kwargs.get("delete_after") and not kwargs.get("ephemeral"):
+        try:
+            message = response if isinstance(response, discord.Message) else await response.original_response()
+            logo.remember(message)
+        except discord.HTTPException as e:
+            print(f"Couldn't read back the uploaded logo URL: {e}")
+    return response
+
+
+def setup_assets(bot):
+    @bot.listen("on_raw_message_delete")
+    async def forget_deleted_logo(payload):
+        logo.forget(payload.channel_id, (payload.message_id,))
+
+    @bot.listen("on_raw_bulk_message_delete")
+    async def forget_bulk_deleted_logo(payload):
+        logo.forget(payload.channel_id, payload.message_ids)
+
+    @bot.listen("on_guild_channel_delete")
+    async def forget_channel_logo(channel):
+        logo.forget(channel.id)
+
+    @bot.listen("on_raw_thread_delete")
+    async def forget_thread_logo(payload):
+        logo.forget(payload.thread_id)
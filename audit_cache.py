@@ -0,0 +1,155 @@
+import asyncio
+import datetime
+import time
+import discord
+
+TRACKED_ACTIONS = (discord.AuditLogAction.kick, discord.AuditLogAction.ban)
+
+
+class AuditRecord:
+    __slots__ = ("entry_id", "action", "reason", "moderator_id", "created_at")
+
+    def __init__(self, entry_id, action, reason, moderator_id):
+        self.entry_id = entry_id
+        self.action = action
+        self.reason = reason
+        self.moderator_id = moderator_id
+        self.created_at = discord.utils.snowflake_time(entry_id)
+
+
+class AuditCorrelator:
+    # Kick and ban audit log entries are kept per guild, keyed by target, for a short
+    # window so member removals can be classified from memory. The entry can arrive
+    # shortly after the removal, so a miss waits briefly for it and is then logged as a
+    # leave. Departures are remembered for the window: if an entry for one turns up
+    # later, from the gateway or from a background audit log fetch (at most one per
+    # guild per fallback_interval), a member_removal_corrected event is dispatched.
+    def __init__(self, window=30.0, wait=0.5, fallback_interval=5.0, fallback_limit=100, max_fallbacks=2, max_departures=10000):
+        self.window = datetime.timedelta(seconds=window)
+        self.wait = wait
+        self.fallback_interval = fallback_interval
+        self.fallback_limit = fallback_limit
+        self.max_departures = max_departures
+        self.dispatch = None
+        self._entries = {}
+        self._waiters = {}
+        self._departures = {}
+        self._fetches = {}
+        self._last_fetch = {}
+        self._fallbacks = asyncio.Semaphore(max_fallbacks)
+        self.hits = 0
+        self.waited = 0
+        self.fallbacks = 0
+        self.misses = 0
+        self.corrected = 0
+
+    def record(self, guild_id, entry_id, action, target_id, reason, moderator_id):
+        if action not in TRACKED_ACTIONS or target_id is None:
+            return
+        entries = self._entries.setdefault(guild_id, {})
+        current = entries.get(target_id)
+        if current is not None and current.entry_id >= entry_id:
+            return
+        record = entries[target_id] = AuditRecord(entry_id, action, reason, moderator_id)
+        self._prune(guild_id)
+        waiter = self._waiters.pop((guild_id, target_id), None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(record)
+            return
+        departed = self._departures.pop((guild_id, target_id), None)
+        if departed is not None and time.monotonic() - departed < self.window.total_seconds() and record.created_at >= discord.utils.utcnow() - self.window:
+            self.corrected += 1
+            if self.dispatch is not None:
+                self.dispatch("member_removal_corrected", guild_id, target_id, record)
+
+    def _prune(self, guild_id):
+        entries = self._entries[guild_id]
+        cutoff = discord.utils.utcnow() - self.window
+        for target_id in [t for t, record in entries.items() if record.created_at < cutoff]:
+            del entries[target_id]
+        if not entries:
+            del self._entries[guild_id]
+
+    def _lookup(self, guild_id, target_id):
+        record = self._entries.get(guild_id, {}).get(target_id)
+        if record is not None and record.created_at >= discord.utils.utcnow() - self.window:
+            return record
+        return None
+
+    async def resolve(self, guild, target_id):
+        # Returns the kick or ban record behind a member's removal, or None for a leave
+        record = self._lookup(guild.id, target_id)
+        if record is not None:
+            self.hits += 1
+            return record
+
+        key = (guild.id, target_id)
+        waiter = self._waiters.get(key)
+        if waiter is None:
+            waiter = self._waiters[key] = asyncio.get_running_loop().create_future()
+        try:
+            record = await asyncio.wait_for(asyncio.shield(waiter), self.wait)
+            self.waited += 1
+            return record
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if self._waiters.get(key) is waiter and not waiter.done():
+                del self._waiters[key]
+
+        self.misses += 1
+        self._departures[key] = time.monotonic()
+        if len(self._departures) > self.max_departures:
+            del self._departures[next(iter(self._departures))]
+        # The gateway may have dropped the entry; look for it without holding up the log
+        me = guild.me
+        if me is not None and me.guild_permissions.view_audit_log:
+            asyncio.ensure_future(self._fallback(guild))
+        return None
+
+    async def _fallback(self, guild):
+        task = self._fetches.get(guild.id)
+        if task is None:
+            last = self._last_fetch.get(guild.id)
+            if last is not None and time.monotonic() - last < self.fallback_interval:
+                return
+            self._last_fetch[guild.id] = time.monotonic()
+            task = self._fetches[guild.id] = asyncio.ensure_future(self._fetch(guild))
+        await asyncio.shield(task)
+
+    async def _fetch(self, guild):
+        try:
+            async with self._fallbacks:
+                self.fallbacks += 1
+                async for entry in guild.audit_logs(limit=self.fallback_limit):
+                    target_id = entry.target.id if entry.target else None
+                    self.record(guild.id, entry.id, entry.action, target_id, entry.reason, entry.user.id if entry.user else None)
+        except discord.HTTPException as e:
+            print(f"Failed to fetch audit logs for {guild.id}: {e}")
+        finally:
+            del self._fetches[guild.id]
+            if len(self._last_fetch) > 1000:
+                cutoff = time.monotonic() - self.fallback_interval
+                self._last_fetch = {g: t for g, t in self._last_fetch.items() if t >= cutoff}
+
+    def stats(self):
+        return {
+            "guilds": len(self._entries),
+            "hits": self.hits,
+            "waited": self.waited,
+            "fallbacks": self.fallbacks,
+            "misses": self.misses,
+            "corrected": self.corrected,
+            "departures": len(self._departures),
+        }
+
+
+audit_correlator = AuditCorrelator()
+
+
+def setup_audit_cache(bot):
+    audit_correlator.dispatch = bot.dispatch
+
+    @bot.listen("on_raw_audit_log_entry")
+    async def record_audit_entry(payload):
+        audit_correlator.record(payload.guild_id, payload.id, payload.action_type, payload.target_id, payload.reason, payload.user_id)
@@ -0,0 +1,56 @@
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from block_filter import block_list, block_patterns, get_block_matcher
+
+MESSAGES = [
+    "hey everyone, how's it going?",
+    "lol that was so funny i can't even",
+    "check this out https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "join my server discord.gg/abcdef",
+    "look at my cat <:catjam:123456789012345678> <:catjam:123456789012345678>",
+    "@everyone free nitro at https://example.com/nitro",
+    "can someone help me with `print()` in python?",
+    "```py\nfor i in range(10):\n    print(i)\n```",
+    "> quoting someone here",
+    "**important** announcement, __please__ read *carefully*",
+    "ping <@123456789012345678> and <@&876543210987654321> in <#111111111111111111>",
+    "no markup at all, just a fairly ordinary sentence that keeps going for a while " * 4,
+    "||spoiler alert|| the ending is great",
+    "download report.pdf and image.png from the share",
+]
+
+
+def loop_search(block_types, content):
+    for block_type in block_types:
+        if re.search(block_patterns[block_type], content):
+            return block_type
+    return None
+
+
+def run(enabled, number):
+    matcher = get_block_matcher(enabled)
+    for content in MESSAGES:
+        assert (loop_search(enabled, content) is None) == (matcher.search(content) is None), content
+
+    loop_time = timeit.timeit(lambda: [loop_search(enabled, content) for content in MESSAGES], number=number)
+    fused_time = timeit.timeit(lambda: [matcher.search(content) for content in MESSAGES], number=number)
+    per_message = number * len(MESSAGES)
+    return loop_time / per_message * 1e6, fused_time / per_message * 1e6
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{'enabled types':>14} {'loop us/msg':>12} {'fused us/msg':>13} {'speedup':>8}")
+    for count in (1, 4, 8, 16, len(block_list)):
+        enabled = block_list[:count]
+        loop_us, fused_us = run(enabled, number)
+        print(f"{count:>14} {loop_us:>12.2f} {fused_us:>13.2f} {loop_us / fused_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from content_analysis import SETTING_FEATURES, analyze
+
+SETTINGS = {"caps_percent": 70, "repeated_chars": 10, "emoji_limit": 5, "max_lines": 10, "max_words": 200, "zalgo_text": 1}
+WORDS = "the quick brown fox jumps over the lazy dog while moderators keep the server calm and friendly".split()
+
+
+def prose(length, rng):
+    parts = []
+    while sum(map(len, parts)) + len(parts) < length:
+        word = rng.choice(WORDS)
+        roll = rng.random()
+        if roll < 0.08:
+            word = word.upper()
+        elif roll < 0.11:
+            word = "<:pepe:123456789012345678>"
+        elif roll < 0.14:
+            word += "\n"
+        parts.append(word)
+    return " ".join(parts)[:length]
+
+
+def corpus(length):
+    rng = random.Random(length)
+    return {
+        "prose": prose(length, rng),
+        "caps": prose(length, rng).upper(),
+        "emoji": "<:pepe:123456789012345678>" * (length // 26),
+        "cjk": "".join(chr(0x4E00 + rng.randrange(3000)) for _ in range(length)),
+        "zalgo": "".join(rng.choice("moderation") + chr(0x300 + rng.randrange(0x70)) for _ in range(length // 2)),
+    }
+
+
+def old_checks(content):
+    # The checks as filter.on_message used to run them
+    violations = []
+    caps_count = sum(1 for c in content if c.isupper())
+    if len(content) > 0 and (caps_count / len(content)) * 100 > SETTINGS["caps_percent"]:
+        violations.append("excessive caps")
+    if any(char * SETTINGS["repeated_chars"] in content for char in set(content)):
+        violations.append("repeated characters")
+    if len(re.findall(r'<:[a-zA-Z0-9_]+:\d+>', content)) > SETTINGS["emoji_limit"]:
+        violations.append("excessive emojis")
+    if len(content.split('\n')) > SETTINGS["max_lines"]:
+        violations.append("too many lines")
+    if len(content.split()) > SETTINGS["max_words"]:
+        violations.append("too many words")
+    if re.search(r'[̀-ͯ҉]', content):
+        violations.append("Zalgo text")
+    return violations
+
+
+def new_checks(content, wanted=frozenset(SETTING_FEATURES.values())):
+    features = analyze(content, wanted)
+    violations = []
+    if features.caps_percent > SETTINGS["caps_percent"]:
+        violations.append("excessive caps")
+    if features.longest_run >= SETTINGS["repeated_chars"]:
+        violations.append("repeated characters")
+    if features.custom_emojis > SETTINGS["emoji_limit"]:
+        violations.append("excessive emojis")
+    if features.lines > SETTINGS["max_lines"]:
+        violations.append("too many lines")
+    if features.words > SETTINGS["max_words"]:
+        violations.append("too many words")
+    if features.combining_marks > 0:
+        violations.append("Zalgo text")
+    return violations
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"{'length':>6} {'message':>8} {'old us':>9} {'new us':>9} {'speedup':>8}")
+    for length in (2000, 4000):
+        for name, content in corpus(length).items():
+            assert old_checks(content) == new_checks(content), name
+            old_us = timeit.timeit(lambda: old_checks(content), number=number) / number * 1e6
+            new_us = timeit.timeit(lambda: new_checks(content), number=number) / number * 1e6
+            print(f"{length:>6} {name:>8} {old_us:>9.1f} {new_us:>9.1f} {old_us / new_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
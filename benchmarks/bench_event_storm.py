@@ -0,0 +1,226 @@
+import asyncio
+import os
+import random
+import re
+import resource
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import Channel, Emoji, FakeHTTP, Guild, Member, Role, db_queries, make_bot, percentile
+
+from db_utils import db
+from membership import setup_membership
+from audit_cache import setup_audit_cache, audit_correlator
+from log_archive import setup_log_archive, event_archive
+from logs import setup_logs
+from stats import setup_stats
+from log_buffer import log_buffer
+from metrics import metrics
+
+# Events per second of each storm, overridable as name=rate on the command line
+STORMS = {"role_assign": 500, "channel_edit": 50, "emoji_swap": 5, "join": 200, "leave": 100}
+EMOJI_PACK = 10
+TICK = 0.01
+DRAIN_TIMEOUT = 30
+SUMMARY_TITLE = re.compile(r"^(.*) \(x(\d+)\)$")
+
+
+class LogChannel(Channel):
+    # Matches each log message that goes out with the events waiting for it, oldest first.
+    # The log buffer keeps the order within a title, and a summary embed accounts for as
+    # many events as its (xN) suffix says.
+    def __init__(self, guild, waiting, latencies):
+        super().__init__(guild, "logs")
+        self.waiting = waiting
+        self.latencies = latencies
+
+    async def send(self, content=None, embeds=(), **kwargs):
+        now = time.perf_counter()
+        for embed in embeds:
+            match = SUMMARY_TITLE.match(embed.title)
+            title, count = (match.group(1), int(match.group(2))) if match else (embed.title, 1)
+            pending = self.waiting.get((self.guild.id, title))
+            for _ in range(min(count, len(pending) if pending else 0)):
+                self.latencies.append(now - pending.popleft())
+        return await super().send(content, **kwargs)
+
+
+class Storm:
+    def __init__(self, bot, guilds, members_per_guild, rng):
+        self.bot = bot
+        self.rng = rng
+        self.http = FakeHTTP()
+        self.waiting = {}
+        self.latencies = []
+        self.dispatched = 0
+        self.guilds = []
+        for _ in range(guilds):
+            guild = Guild(self.http, channels=20)
+            guild.log_channel = LogChannel(guild, self.waiting, self.latencies)
+            guild._channels[guild.log_channel.id] = guild.log_channel
+            guild.roles = [Role(guild, f"role{i}") for i in range(50)]
+            guild.emojis = [Emoji(f"emoji{i}") for i in range(EMOJI_PACK)]
+            for _ in range(members_per_guild):
+                guild.add_member(Member(guild))
+            self.guilds.append(guild)
+
+    def expect(self, guild, title, count=1):
+        pending = self.waiting.get((guild.id, title))
+        if pending is None:
+            pending = self.waiting[(guild.id, title)] = deque()
+        now = time.perf_counter()
+        for _ in range(count):
+            pending.append(now)
+
+    @property
+    def undelivered(self):
+        return sum(len(pending) for pending in self.waiting.values())
+
+    def role_assign(self, guild):
+        member = self.rng.choice(guild.members)
+        role = self.rng.choice(guild.roles)
+        after = member.copy(roles=member.roles + [role]) if role not in member.roles else member.copy(roles=[r for r in member.roles if r != role])
+        self.expect(guild, "Role Added" if len(after.roles) > len(member.roles) else "Role Removed")
+        guild._members[member.id] = after
+        guild.members[guild.members.index(member)] = after
+        self.bot.dispatch("member_update", member, after)
+
+    def channel_edit(self, guild):
+        before = self.rng.choice(guild.channels)
+        after = before.copy(name=f"{before.name.split('-')[0]}-{self.rng.randrange(10**6)}")
+        guild.channels[guild.channels.index(before)] = after
+        guild._channels[after.id] = after
+        self.expect(guild, "Channel Updated")
+        self.bot.dispatch("guild_channel_update", before, after)
+
+    def emoji_swap(self, guild):
+        before = guild.emojis
+        guild.emojis = [Emoji(f"emoji{i}") for i in range(EMOJI_PACK)]
+        self.expect(guild, "Emoji Added", len(guild.emojis))
+        self.expect(guild, "Emoji Removed", len(before))
+        self.bot.dispatch("guild_emojis_update", guild, before, guild.emojis)
+
+    def join(self, guild):
+        member = Member(guild)
+        guild.add_member(member)
+        self.expect(guild, "Member Joined")
+        self.bot.dispatch("member_join", member)
+
+    def leave(self, guild):
+        if len(guild.members) < 2:
+            return
+        member = guild.members.pop(self.rng.randrange(len(guild.members)))
+        del guild._members[member.id]
+        self.expect(guild, "Member Left")
+        self.bot.dispatch("member_remove", member)
+
+    async def run(self, rates, duration):
+        # Events are spread over the guilds round robin, each storm at its own rate
+        credit = dict.fromkeys(rates, 0.0)
+        turn = 0
+        start = time.perf_counter()
+        last = start
+        while last - start < duration:
+            await asyncio.sleep(TICK)
+            now = time.perf_counter()
+            for name, rate in rates.items():
+                credit[name] += rate * (now - last)
+                while credit[name] >= 1:
+                    credit[name] -= 1
+                    getattr(self, name)(self.guilds[turn % len(self.guilds)])
+                    turn += 1
+                    self.dispatched += 1
+            last = now
+
+
+async def measure_lag(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+def rss_mib():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def configure(guild):
+    async with db.transaction() as tx:
+        await tx.execute("INSERT OR REPLACE INTO log_channels VALUES (?, ?)", (guild.id, guild.log_channel.id))
+        await tx.executemany("INSERT OR REPLACE INTO log_settings VALUES (?, ?, 1)", [(guild.id, aspect) for aspect in
+                             ("join", "leave", "channel_update", "role_add", "role_remove", "emoji_add", "emoji_remove")])
+
+
+async def run(rates, duration, guilds, members, rest_latency):
+    bot = make_bot(setup_membership, setup_audit_cache, setup_log_archive, setup_logs, setup_stats)
+    storm = Storm(bot, guilds, members, random.Random(0))
+    storm.http.latency = rest_latency
+    for guild in storm.guilds:
+        await configure(guild)
+
+    print(f"{guilds} guilds, {members:,} members each, {duration}s at " + ", ".join(f"{name} {rate}/s" for name, rate in rates.items()))
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.ensure_future(measure_lag(lags, stop))
+    rss_before = rss_mib()
+    queries = db_queries()
+    start = time.perf_counter()
+    await storm.run(rates, duration)
+    generated = time.perf_counter() - start
+    rss_storm = rss_mib()
+
+    # Leaves wait briefly for a matching audit log entry before they are logged, so the
+    # tail needs at least that long to arrive
+    deadline = time.perf_counter() + DRAIN_TIMEOUT
+    while storm.undelivered and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+    drained = time.perf_counter() - start
+    stop.set()
+    await monitor
+    await event_archive.flush()
+
+    latencies = sorted(storm.latencies)
+    lags.sort()
+    print(f"events dispatched:  {storm.dispatched:,} ({storm.dispatched / generated:,.0f}/s), all logged after {drained:.1f}s")
+    print(f"log entries:        {len(latencies):,} delivered, {storm.undelivered:,} undelivered, {log_buffer.merged:,} merged, {log_buffer.dropped:,} dropped")
+    print(f"log latency:        p50 {percentile(latencies, 0.5) * 1000:.0f}ms, p99 {percentile(latencies, 0.99) * 1000:.0f}ms, max {(latencies[-1] if latencies else 0) * 1000:.0f}ms")
+    print(f"event loop lag:     p50 {percentile(lags, 0.5) * 1000:.1f}ms, p99 {percentile(lags, 0.99) * 1000:.1f}ms, max {(lags[-1] if lags else 0) * 1000:.1f}ms")
+    print(f"memory:             {rss_before:.0f} MiB before, {rss_storm:.0f} MiB after the storm, {rss_mib():.0f} MiB drained")
+    print(f"REST calls:         {storm.http.total:,} ({storm.http.total / max(storm.dispatched, 1):.3f}/event)")
+    for route, count in storm.http.calls.most_common():
+        print(f"  {route:<48}{count:>8,}")
+    print(f"DB queries:         {db_queries() - queries:,}, {event_archive.archived:,} events archived, audit log fallbacks {audit_correlator.fallbacks:,}")
+    print("handlers:")
+    for labels, histogram in sorted(metrics.collect("event_seconds"), key=lambda item: item[1].sum, reverse=True):
+        if histogram.count:
+            print(f"  {labels['event']:<28}{histogram.count:>8,}x  avg {histogram.average * 1e6:>7.0f}us  p99 <={histogram.quantile(0.99) * 1000:.1f}ms")
+
+
+def main():
+    rates = dict(STORMS)
+    options = {"duration": 10, "guilds": 5, "members": 2000, "rest-latency": 0.05}
+    for arg in sys.argv[1:]:
+        name, _, value = arg.lstrip("-").partition("=")
+        if name in rates:
+            rates[name] = float(value)
+        elif name in options:
+            options[name] = type(options[name])(value)
+        else:
+            sys.exit(f"usage: {sys.argv[0]} [{'|'.join(STORMS)}=RATE ...] [--duration=S] [--guilds=N] [--members=N] [--rest-latency=S]")
+    rates = {name: rate for name, rate in rates.items() if rate > 0}
+    try:
+        asyncio.run(run(rates, options["duration"], options["guilds"], options["members"], options["rest-latency"]))
+    finally:
+        event_archive.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
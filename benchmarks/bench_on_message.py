@@ -0,0 +1,197 @@
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import FakeHTTP, Guild, Member, Message, db_queries, make_bot, percentile
+
+from db_utils import db
+from block_filter import block_list
+from filter import setup_filter
+from actions import action_dispatcher
+from deletions import message_deleter
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_on_message.json")
+# Throughput and latency may drift this much from the baseline before --check fails;
+# DB queries and REST calls per message are deterministic and must not grow at all
+TOLERANCE = 0.25
+# Tail latencies of a few microseconds are mostly scheduler noise
+P99_SLACK_US = 50
+# Messages replayed between draining the action queue and the pending deletions, which
+# stands in for the deletion window of a real server
+DRAIN_EVERY = 100
+MESSAGES_PER_AUTHOR = 8
+# With bursts on, every BURST_EVERY messages one author sends BURST_LENGTH in a row in
+# one channel, far enough past the default limit of 10 to be warned and then timed out
+BURST_EVERY = 500
+BURST_LENGTH = 30
+
+AUTOMOD = {"caps_percent": 70, "repeated_chars": 10, "mention_limit": 5, "emoji_limit": 5, "max_lines": 15, "max_words": 300, "zalgo_text": 1}
+CONFIGS = {
+    "empty": {"words": 0, "blocks": (), "automod": {}},
+    "automod": {"words": 0, "blocks": (), "automod": AUTOMOD},
+    "words_100": {"words": 100, "blocks": (), "automod": AUTOMOD},
+    "links": {"words": 0, "blocks": [b for b in block_list if b.endswith("_url") or b == "invite"], "automod": AUTOMOD},
+    "words_10k_all_blocks": {"words": 10_000, "blocks": block_list, "automod": AUTOMOD},
+    "spam_bursts": {"words": 0, "blocks": (), "automod": AUTOMOD, "bursts": True},
+}
+
+VOCABULARY = ("the a to and of is it you that in for on with this was are have but not be we they what just so "
+              "like can when will get one all about if out up do your time good people know there some game "
+              "server today really think would could yeah thanks anyone help going still make new play right").split()
+FILTERED = ["frack", "gorramit", "smeghead", "zarquon"]
+LINKS = ["https://discord.gg/abc123", "t.me/somechannel", "https://www.twitch.tv/streamer", "https://youtube.com/watch?v=dQw4w9WgXcQ",
+         "https://github.com/someone", "reddit.com/r/pics", "https://cdn.discordapp.com/attachments/1/2/cat.png", "http://example.org/page"]
+KINDS = [("clean", 60), ("filtered", 8), ("link", 8), ("caps", 6), ("emoji", 6), ("zalgo", 4), ("long", 8)]
+
+
+def filter_words(count, rng):
+    words = list(FILTERED)
+    while len(words) < count:
+        words.append("".join(rng.choice("bcdfghjklmnpqrstvwxz") for _ in range(rng.randint(6, 9))))
+    return words[:count] if count else []
+
+
+def sentence(rng, low=4, high=16):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(low, high)))
+
+
+def make_content(kind, rng):
+    if kind == "clean":
+        return sentence(rng)
+    if kind == "filtered":
+        words = sentence(rng).split()
+        words.insert(rng.randrange(len(words) + 1), rng.choice(FILTERED))
+        return " ".join(words)
+    if kind == "link":
+        return f"{sentence(rng, 2, 8)} {rng.choice(LINKS)}"
+    if kind == "caps":
+        return sentence(rng).upper() + "!!!!!!!!!!!!"
+    if kind == "emoji":
+        return " ".join(f"<:pog{i}:{100000000000000000 + i}>" for i in range(rng.randint(6, 12)))
+    if kind == "zalgo":
+        return "".join(c + chr(0x300 + rng.randrange(0x70)) * rng.randint(1, 4) for c in sentence(rng, 2, 5))
+    return "\n".join(sentence(rng, 8, 20) for _ in range(rng.randint(20, 40)))
+
+
+def corpus(size, seed=0):
+    rng = random.Random(seed)
+    kinds = [kind for kind, weight in KINDS for _ in range(weight)]
+    return [(kind, make_content(kind, rng)) for kind in (rng.choice(kinds) for _ in range(size))]
+
+
+async def configure(guild, config, rng):
+    words = filter_words(config["words"], rng)
+    async with db.transaction() as tx:
+        await tx.executemany("INSERT OR IGNORE INTO filter VALUES (?, ?)", [(guild.id, word) for word in words])
+        await tx.executemany("INSERT OR REPLACE INTO block_filter VALUES (?, ?, 1)", [(guild.id, block_type) for block_type in config["blocks"]])
+        await tx.executemany("INSERT OR REPLACE INTO automod_settings VALUES (?, ?, ?)", [(guild.id, setting, value) for setting, value in config["automod"].items()])
+
+
+async def drain():
+    await action_dispatcher.join()
+    while message_deleter.depth:
+        await asyncio.sleep(0)
+
+
+async def replay(bot, name, config, messages):
+    http = FakeHTTP()
+    guild = Guild(http, channels=4)
+    await configure(guild, config, random.Random(name))
+    authors = [Member(guild) for _ in range(len(messages) // MESSAGES_PER_AUTHOR + 1)]
+
+    queries = db_queries()
+    # Messages are built up front so only the handler is timed; authors take turns so
+    # the spam limiter stays quiet and every message reaches the later checks, apart
+    # from the bursts, each sent by a new author
+    stream = []
+    for i, (_, content) in enumerate(messages):
+        if config.get("bursts") and i % BURST_EVERY < BURST_LENGTH:
+            if i % BURST_EVERY == 0:
+                spammer = Member(guild)
+            stream.append(Message(guild, guild.channels[0], spammer, content))
+        else:
+            stream.append(Message(guild, guild.channels[i % len(guild.channels)], authors[i % len(authors)], content))
+    latencies = []
+    for i, message in enumerate(stream):
+        start = time.perf_counter()
+        await bot.on_message(message)
+        latencies.append(time.perf_counter() - start)
+        if (i + 1) % DRAIN_EVERY == 0:
+            await drain()
+    await drain()
+
+    latencies.sort()
+    return {
+        "msgs_per_sec": round(len(stream) / sum(latencies)),
+        "p50_us": round(percentile(latencies, 0.50) * 1e6, 1),
+        "p99_us": round(percentile(latencies, 0.99) * 1e6, 1),
+        "db_per_msg": round((db_queries() - queries) / len(stream), 4),
+        "rest_per_msg": round(http.total / len(stream), 4),
+    }
+
+
+def regressions(results, baseline):
+    problems = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result["msgs_per_sec"] < expected["msgs_per_sec"] * (1 - TOLERANCE):
+            problems.append(f"{name}: {result['msgs_per_sec']:,} msgs/s, baseline {expected['msgs_per_sec']:,}")
+        if result["p99_us"] > max(expected["p99_us"] * (1 + TOLERANCE), expected["p99_us"] + P99_SLACK_US):
+            problems.append(f"{name}: p99 {result['p99_us']}us, baseline {expected['p99_us']}us")
+        for key in ("db_per_msg", "rest_per_msg"):
+            if result[key] > expected[key] + 1e-4:
+                problems.append(f"{name}: {key} {result[key]}, baseline {expected[key]}")
+    return problems
+
+
+async def run(size):
+    bot = make_bot(setup_filter)
+    message_deleter.window = 0
+    messages = corpus(size)
+    # One untimed pass warms the interpreter, the regex caches and the action workers
+    await replay(bot, "warmup", CONFIGS["automod"], messages[:2000])
+    print(f"corpus: {size:,} messages, " + ", ".join(f"{kind} {sum(1 for k, _ in messages if k == kind)}" for kind, _ in KINDS))
+    print(f"{'config':<22}{'msgs/s':>10}{'p50 us':>10}{'p99 us':>10}{'db/msg':>10}{'rest/msg':>10}")
+    results = {}
+    for name, config in CONFIGS.items():
+        result = results[name] = await replay(bot, name, config, messages)
+        print(f"{name:<22}{result['msgs_per_sec']:>10,}{result['p50_us']:>10}{result['p99_us']:>10}{result['db_per_msg']:>10}{result['rest_per_msg']:>10}")
+    return results
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    size = int(args[0]) if args else 20_000
+    try:
+        results = asyncio.run(run(size))
+    finally:
+        db.close()
+
+    if "--save-baseline" in sys.argv:
+        with open(BASELINE, "w") as f:
+            json.dump({"messages": size, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {BASELINE}")
+    elif "--check" in sys.argv:
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+        if baseline["messages"] != size:
+            print(f"baseline was recorded with {baseline['messages']:,} messages; rerun with that size")
+            sys.exit(2)
+        problems = regressions(results, baseline["results"])
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+        print("no regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
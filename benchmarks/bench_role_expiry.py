@@ -0,0 +1,95 @@
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import FakeHTTP, Guild, Member, Role, percentile
+
+from db_utils import db
+from migrations import run_migrations
+from role_expiry import RoleExpiryScheduler
+
+GUILDS = 20
+
+
+class Bot:
+    def __init__(self, guilds):
+        self.guilds = {guild.id: guild for guild in guilds}
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+
+async def run(pending, firing):
+    rng = random.Random(0)
+    http = FakeHTTP(latency=0.005)
+    guilds = [Guild(http) for _ in range(GUILDS)]
+    for guild in guilds:
+        guild.roles = [Role(guild, f"role{i}") for i in range(10)]
+
+    # Backlog spread over the next week, a few already overdue but for guilds the bot left
+    now = time.time()
+    rows = [(rng.randrange(10**17, 10**18), rng.randrange(10**17, 10**18), rng.randrange(10**17, 10**18), now + rng.uniform(-60, 7 * 86400)) for _ in range(pending)]
+    await db.executemany("INSERT INTO temporary_roles (guild_id, user_id, role_id, expires_at) VALUES (?, ?, ?, ?)", rows)
+
+    scheduler = RoleExpiryScheduler()
+    tracemalloc.start()
+    start = time.perf_counter()
+    await scheduler._load(now + scheduler.window)
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"backlog:            {pending:,} rows, {len(scheduler._heap):,} due within the window loaded in {elapsed * 1000:.1f}ms ({memory / 2**20:.1f} MiB)")
+
+    scheduler.start(Bot(guilds))
+    await asyncio.sleep(0.5)
+    print(f"overdue, no guild:  {scheduler.postponed:,} postponed until the guild is available")
+
+    # Roles that expire over the next few seconds; lateness is taken when the removal starts
+    expires = {}
+    removed_at = {}
+    start = time.perf_counter()
+    for i in range(firing):
+        guild = guilds[i % GUILDS]
+        member = Member(guild)
+        member.roles = [rng.choice(guild.roles)]
+        remove_roles = member.remove_roles
+
+        async def timed_remove(*roles, reason=None, member=member, remove_roles=remove_roles):
+            removed_at[member.id] = time.time()
+            await remove_roles(*roles, reason=reason)
+
+        member.remove_roles = timed_remove
+        guild.add_member(member)
+        expires[member.id] = time.time() + 1 + rng.uniform(0, 2)
+        await scheduler.add(guild.id, member.id, member.roles[0].id, expires[member.id])
+    elapsed = time.perf_counter() - start
+    print(f"add:                {firing:,} roles in {elapsed:.2f}s ({firing / elapsed:,.0f}/s)")
+
+    deadline = time.time() + 30
+    while len(removed_at) < firing and time.time() < deadline:
+        await asyncio.sleep(0.1)
+    lateness = sorted(removed_at[member_id] - expires[member_id] for member_id in removed_at)
+    print(f"removals:           {len(removed_at):,} of {firing:,}, {http.calls['PATCH /guilds/{guild_id}/members/{user_id}']:,} REST calls")
+    print(f"lateness:           p50 {percentile(lateness, 0.5) * 1000:.1f}ms, p99 {percentile(lateness, 0.99) * 1000:.1f}ms, max {(lateness[-1] if lateness else 0) * 1000:.1f}ms")
+    await asyncio.sleep(0.2)
+    left = (await db.fetchone("SELECT COUNT(*) FROM temporary_roles"))[0]
+    print(f"table:              {left:,} rows left, {scheduler.stats()}")
+
+
+def main():
+    pending = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    firing = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    run_migrations()
+    try:
+        asyncio.run(run(pending, firing))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import asyncio
+import datetime
+import itertools
+import os
+import sys
+import tempfile
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The bot keeps its databases and stores relative to the working directory, so every
+# benchmark runs in a scratch directory of its own
+os.chdir(tempfile.mkdtemp(prefix="peacekeeper-bench-"))
+
+import discord
+
+_ids = itertools.count(10**17)
+
+
+def snowflake():
+    # Real-looking ids, so anything that reads a timestamp out of them gets "now"
+    return discord.utils.time_snowflake(discord.utils.utcnow()) + next(_ids) % 4096
+
+
+class FakeHTTP:
+    # Stands in for Discord's REST API: every call the stand-ins make is counted by route
+    # and can be given a simulated round-trip time
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+
+    async def request(self, method, route):
+        self.calls[f"{method} {route}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    @property
+    def total(self):
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
+
+
+class Stub:
+    def copy(self, **changes):
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone.__dict__.update(changes)
+        return clone
+
+
+class Role:
+    def __init__(self, guild, name):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.mention = f"<@&{self.id}>"
+        self.color = discord.Color.default()
+        self.permissions = discord.Permissions.none()
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, Role) and other.id == self.id
+
+
+class Emoji:
+    def __init__(self, name):
+        self.id = snowflake()
+        self.name = name
+        self.url = f"https://cdn.discordapp.com/emojis/{self.id}.png"
+
+    def __str__(self):
+        return f"<:{self.name}:{self.id}>"
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, Emoji) and other.id == self.id
+
+
+class Channel(Stub):
+    def __init__(self, guild, name="general"):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.mention = f"<#{self.id}>"
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.http.request("POST", "/channels/{channel_id}/messages")
+        return Message(self.guild, self, self.guild.bot_member, content or "")
+
+    async def delete_messages(self, messages, reason=None):
+        await self.guild.http.request("POST", "/channels/{channel_id}/messages/bulk-delete")
+
+
+class Member(Stub):
+    def __init__(self, guild, name=None, bot=False):
+        self.id = snowflake()
+        self.guild = guild
+        self.bot = bot
+        self.name = name or f"user{self.id % 100000}"
+        self.discriminator = "0"
+        self.nick = None
+        self.mention = f"<@{self.id}>"
+        self.roles = []
+        self.avatar = None
+        self.default_avatar = Emoji("avatar")
+        self.created_at = discord.utils.utcnow() - datetime.timedelta(days=365)
+        self.communication_disabled_until = None
+
+    async def timeout_for(self, duration, reason=None):
+        await self.guild.http.request("PATCH", "/guilds/{guild_id}/members/{user_id}")
+
+    async def remove_roles(self, *roles, reason=None):
+        await self.guild.http.request("PATCH", "/guilds/{guild_id}/members/{user_id}")
+        self.roles = [role for role in self.roles if role not in roles]
+
+    async def kick(self, reason=None):
+        await self.guild.http.request("DELETE", "/guilds/{guild_id}/members/{user_id}")
+
+
+class Guild:
+    def __init__(self, http, channels=1):
+        self.id = snowflake()
+        self.http = http
+        self.name = f"guild{self.id % 1000}"
+        self.bot_member = Member(self, "PeaceKeeper", bot=True)
+        self.bot_member.guild_permissions = discord.Permissions.all()
+        self.channels = [Channel(self, f"channel{i}") for i in range(channels)]
+        self._channels = {channel.id: channel for channel in self.channels}
+        self.members = []
+        self._members = {}
+        self.roles = []
+
+    @property
+    def me(self):
+        return self.bot_member
+
+    def add_member(self, member):
+        self.members.append(member)
+        self._members[member.id] = member
+
+    def get_channel(self, channel_id):
+        return self._channels.get(channel_id)
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def audit_logs(self, limit=100):
+        await self.http.request("GET", "/guilds/{guild_id}/audit-logs")
+        return
+        yield
+
+
+class Message:
+    def __init__(self, guild, channel, author, content):
+        self.id = snowflake()
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.mentions = []
+        self.role_mentions = []
+        self.created_at = discord.utils.utcnow()
+
+    async def delete(self):
+        await self.guild.http.request("DELETE", "/channels/{channel_id}/messages/{message_id}")
+
+
+def make_bot(*setups):
+    # A bot with only the given setup functions applied, on a fresh scratch database
+    from discord.ext import commands
+    from migrations import run_migrations
+    from guild_config import setup_guild_config
+
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    bot = commands.Bot(intents=intents)
+    run_migrations()
+    setup_guild_config(bot)
+    for setup in setups:
+        setup(bot)
+    return bot
+
+
+def db_queries():
+    from metrics import metrics
+    return sum(histogram.count for _, histogram in metrics.collect("db_query_seconds"))
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
@@ -0,0 +1,135 @@
+import re
+from functools import lru_cache
+
+block_list = ["discord_url", "telegram_url", "twitch_url", "youtube_url", "facebook_url", "twitter_url", "reddit_url", "instagram_url", "github_url",
+              "file", "image", "video", "audio", "attachment", "invite", "emoji", "custom_emoji", "role_mention", "everyone_mention", "here_mention",
+              "user_mention", "channel_mention", "url", "spoiler", "code", "inline_code", "quote", "block_quote", "bold", "italic", "underline"]
+
+block_patterns = {
+    "discord_url": r"(?:https?://)?(?:www\.)?discord(?:app)?\.(?:com|gg)/(?:invite/)?[a-zA-Z0-9]+",
+    "telegram_url": r"(?:https?://)?(?:t\.me|telegram\.me)/[a-zA-Z0-9_]+",
+    "twitch_url": r"(?:https?://)?(?:www\.)?twitch\.tv/[a-zA-Z0-9_]+",
+    "youtube_url": r"(?:https?://)?(?:www\.)?youtube\.com/watch\?v=[a-zA-Z0-9_-]+",
+    "facebook_url": r"(?:https?://)?(?:www\.)?facebook\.com/[a-zA-Z0-9.]+",
+    "twitter_url": r"(?:https?://)?(?:www\.)?twitter\.com/[a-zA-Z0-9_]+",
+    "reddit_url": r"(?:https?://)?(?:www\.)?reddit\.com/r/[a-zA-Z0-9_]+",
+    "instagram_url": r"(?:https?://)?(?:www\.)?instagram\.com/[a-zA-Z0-9_.]+",
+    "github_url": r"(?:https?://)?(?:www\.)?github\.com/[a-zA-Z0-9_-]+",
+    "file": r"\S+\.[a-zA-Z0-9]+",
+    "image": r"\S+\.(?:jpg|jpeg|png|gif|bmp)",
+    "video": r"\S+\.(?:mp4|avi|mov|flv|wmv)",
+    "audio": r"\S+\.(?:mp3|wav|ogg|flac)",
+    "attachment": r"https://cdn\.discordapp\.com/attachments/\S+",
+    "invite": r"(?:https?://)?(?:www\.)?discord(?:app)?\.(?:com|gg)/(?:invite/)?[a-zA-Z0-9]+",
+    "emoji": r"<:[a-zA-Z0-9_]+:\d+>",
+    "custom_emoji": r"<:[a-zA-Z0-9_]+:\d+>",
+    "role_mention": r"<@&\d+>",
+    "everyone_mention": r"@everyone",
+    "here_mention": r"@here",
+    "user_mention": r"<@!?\d+>",
+    "channel_mention": r"<#\d+>",
+    "url": r"https?://\S+",
+    "spoiler": r"\|\|.+?\|\|",
+    "code": r"```[\s\S]+?```",
+    "inline_code": r"`[^`\n]+`",
+    "quote": r"^>\s.+",
+    "block_quote": r"^>>>\s[\s\S]+",
+    "bold": r"\*\*[^*]+\*\*",
+    "italic": r"\*[^*]+\*",
+    "underline": r"__[^_]+__"
+}
+
+
+# Literals every match of a block type must contain. A substring check is far cheaper
+# than a regex scan, so they decide which alternatives are worth running at all.
+block_hints = {
+    "discord_url": ("discord",),
+    "telegram_url": ("t.me", "telegram.me"),
+    "twitch_url": ("twitch.tv",),
+    "youtube_url": ("youtube.com",),
+    "facebook_url": ("facebook.com",),
+    "twitter_url": ("twitter.com",),
+    "reddit_url": ("reddit.com/r/",),
+    "instagram_url": ("instagram.com",),
+    "github_url": ("github.com",),
+    "file": (".",),
+    "image": (".",),
+    "video": (".",),
+    "audio": (".",),
+    "attachment": ("https://cdn.discordapp.com/attachments/",),
+    "invite": ("discord",),
+    "emoji": ("<:",),
+    "custom_emoji": ("<:",),
+    "role_mention": ("<@&",),
+    "everyone_mention": ("@everyone",),
+    "here_mention": ("@here",),
+    "user_mention": ("<@",),
+    "channel_mention": ("<#",),
+    "url": ("http",),
+    "spoiler": ("||",),
+    "code": ("```",),
+    "inline_code": ("`",),
+    "quote": (">",),
+    "block_quote": (">>>",),
+    "bold": ("**",),
+    "italic": ("*",),
+    "underline": ("__",),
+}
+
+
+def _fuse(block_types):
+    # One alternation with a named group per distinct pattern; types that share a
+    # pattern (invite/discord_url, emoji/custom_emoji) share a group
+    groups = {}
+    for block_type in block_types:
+        groups.setdefault(block_patterns[block_type], block_type)
+    if not groups:
+        return None, {}
+    names = {}
+    alternatives = []
+    for i, (pattern, block_type) in enumerate(groups.items()):
+        names[f"b{i}"] = block_type
+        alternatives.append(f"(?P<b{i}>{pattern})")
+    return re.compile("|".join(alternatives)), names
+
+
+class BlockMatcher:
+    # Scans a message once for all enabled block types. The literal hints present in the
+    # message pick the alternatives that can possibly match, and the fused regex for that
+    # combination is compiled once and reused.
+    def __init__(self, block_types):
+        self.block_types = tuple(block_type for block_type in block_list if block_type in block_types)
+        self._literals = tuple(sorted({hint for block_type in self.block_types for hint in block_hints[block_type]}))
+        self._fused = {}
+
+    def _fused_for(self, present):
+        fused = self._fused.get(present)
+        if fused is None:
+            if len(self._fused) >= 256:
+                self._fused.clear()
+            candidates = [block_type for block_type in self.block_types if not present.isdisjoint(block_hints[block_type])]
+            fused = self._fused[present] = _fuse(candidates)
+        return fused
+
+    def search(self, content):
+        if not self._literals:
+            return None
+        present = frozenset([literal for literal in self._literals if literal in content])
+        if not present:
+            return None
+        regex, names = self._fused_for(present)
+        if regex is None:
+            return None
+        match = regex.search(content)
+        if match is None:
+            return None
+        return names[match.lastgroup]
+
+
+@lru_cache(maxsize=512)
+def _compile(block_types):
+    return BlockMatcher(block_types)
+
+
+def get_block_matcher(block_types):
+    return _compile(frozenset(block_types))
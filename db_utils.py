@@ -1,20 +1,157 @@
+import asyncio
+import os
 import sqlite3
-from contextlib import contextmanager
-
-@contextmanager
-def get_db_connection():
-    conn = sqlite3.connect('peacekeeper.db')
-    try:
-        yield conn
-    finally:
-        conn.close()
-
-def execute_db_query(query, params=None):
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
-        conn.commit()
-        return cursor.fetchall()
\ No newline at end of file
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from metrics import metrics, query_label
+
+DB_PATH = 'peacekeeper.db'
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 67108864",
+    "PRAGMA busy_timeout = 5000",
+)
+
+
+class Database:
+    # One writer thread owns the only read-write connection so writes are serialized
+    # the way SQLite wants them; reads run on a small pool of long-lived read connections
+    # that WAL lets proceed concurrently with the writer.
+    def __init__(self, path=DB_PATH, readers=4):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = None
+
+    def _connect(self, read_only):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def _connection(self, read_only):
+        attr = "reader" if read_only else "writer"
+        conn = getattr(self._local, attr, None)
+        if conn is None:
+            conn = self._connect(read_only)
+            setattr(self._local, attr, conn)
+        return conn
+
+    def _timed(self, query, start):
+        metrics.histogram("db_query_seconds", db=self.name, query=query_label(query)).observe(time.perf_counter() - start)
+
+    def _read(self, query, params):
+        start = time.perf_counter()
+        try:
+            return self._connection(True).execute(query, params).fetchall()
+        finally:
+            self._timed(query, start)
+
+    def _write(self, query, params, many=False, autocommit=True, fetch=False):
+        start = time.perf_counter()
+        try:
+            return self._write_timed(query, params, many, autocommit, fetch)
+        finally:
+            self._timed(query, start)
+
+    def _write_timed(self, query, params, many, autocommit, fetch):
+        conn = self._connection(False)
+        if autocommit:
+            conn.execute("BEGIN")
+        try:
+            cursor = conn.executemany(query, params) if many else conn.execute(query, params)
+            result = cursor.fetchall() if fetch else cursor.rowcount
+            if autocommit:
+                conn.execute("COMMIT")
+        except BaseException:
+            if autocommit:
+                conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _lock(self):
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        return self._write_lock
+
+    async def _run(self, executor, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+    async def fetch(self, query, params=()):
+        return await self._run(self._readers, self._read, query, params)
+
+    async def fetchone(self, query, params=()):
+        rows = await self.fetch(query, params)
+        return rows[0] if rows else None
+
+    async def execute(self, query, params=()):
+        async with self._lock():
+            return await self._run(self._writer, self._write, query, params)
+
+    async def executemany(self, query, seq_of_params):
+        async with self._lock():
+            return await self._run(self._writer, self._write, query, list(seq_of_params), True)
+
+    @asynccontextmanager
+    async def transaction(self):
+        async with self._lock():
+            await self._run(self._writer, self._write, "BEGIN", (), False, False)
+            tx = Transaction(self)
+            try:
+                yield tx
+            except BaseException:
+                await self._run(self._writer, self._write, "ROLLBACK", (), False, False)
+                raise
+            await self._run(self._writer, self._write, "COMMIT", (), False, False)
+
+    async def call(self, fn):
+        # Runs fn(writer connection) on the writer thread, for batches that need more than
+        # one statement or work (compression, DDL) that shouldn't happen on the event loop
+        async with self._lock():
+            return await self._run(self._writer, lambda: fn(self._connection(False)))
+
+    def run_sync(self, fn):
+        # Only for start-up code that runs before the event loop (migrations); fn gets
+        # the writer connection
+        return self._writer.submit(lambda: fn(self._connection(False))).result()
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+class Transaction:
+    def __init__(self, db):
+        self._db = db
+
+    async def fetch(self, query, params=()):
+        # Reads inside a transaction must see its own uncommitted writes, so they go
+        # through the writer connection as well
+        return await self._db._run(self._db._writer, self._db._write, query, params, False, False, True)
+
+    async def execute(self, query, params=()):
+        return await self._db._run(self._db._writer, self._db._write, query, params, False, False)
+
+    async def executemany(self, query, seq_of_params):
+        return await self._db._run(self._db._writer, self._db._write, query, list(seq_of_params), True, False)
+
+
+db = Database()
@@ -0,0 +1,94 @@
+import asyncio
+import datetime
+import discord
+
+BULK_DELETE_LIMIT = 100
+# Discord refuses to bulk delete messages older than 14 days; keep a margin for clock skew
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=5)
+
+
+async def delete_messages(channel, messages):
+    # Deletes the messages in as few requests as possible and returns how many requests
+    # were made and how many messages couldn't be deleted
+    cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+    recent = [m for m in messages if m.created_at > cutoff]
+    single = [m for m in messages if m.created_at <= cutoff]
+    requests = 0
+    failed = 0
+
+    for i in range(0, len(recent), BULK_DELETE_LIMIT):
+        batch = recent[i:i + BULK_DELETE_LIMIT]
+        if len(batch) == 1:
+            single.extend(batch)
+            continue
+        requests += 1
+        try:
+            await channel.delete_messages(batch)
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as e:
+            print(f"Bulk delete of {len(batch)} messages in {channel.id} failed, deleting one by one: {e}")
+            single.extend(batch)
+
+    for message in single:
+        requests += 1
+        try:
+            await message.delete()
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as e:
+            failed += 1
+            print(f"Deleting message {message.id} in {channel.id} failed: {e}")
+    return requests, failed
+
+
+class DeletionCoalescer:
+    # Messages flagged in the same channel within a short window are deleted together
+    # with bulk delete calls instead of one DELETE request each
+    def __init__(self, window=1.0):
+        self.window = window
+        self._pending = {}
+        self.requested = 0
+        self.rest_calls = 0
+        self.failures = 0
+
+    @property
+    def saved(self):
+        return self.requested - self.rest_calls
+
+    @property
+    def depth(self):
+        return sum(len(messages) for _, messages in self._pending.values())
+
+    def delete(self, message):
+        pending = self._pending.get(message.channel.id)
+        if pending is None:
+            pending = self._pending[message.channel.id] = (message.channel, {})
+            asyncio.ensure_future(self._flush_later(message.channel.id))
+        # The same message can be flagged by more than one check
+        if message.id not in pending[1]:
+            self.requested += 1
+            pending[1][message.id] = message
+
+    async def _flush_later(self, channel_id):
+        await asyncio.sleep(self.window)
+        channel, messages = self._pending.pop(channel_id)
+        try:
+            requests, failed = await delete_messages(channel, list(messages.values()))
+            self.rest_calls += requests
+            self.failures += failed
+        except Exception as e:
+            self.failures += len(messages)
+            print(f"Deleting {len(messages)} messages in {channel_id} failed: {e}")
+
+    def stats(self):
+        return {
+            "requested": self.requested,
+            "rest_calls": self.rest_calls,
+            "saved": self.saved,
+            "failures": self.failures,
+            "pending": self.depth,
+        }
+
+
+message_deleter = DeletionCoalescer()
@@ -1,9 +1,11 @@
 import discord
 from discord.ext import commands
+from metrics import metrics
 
 def setup_error_handlers(bot):
     @bot.event
     async def on_application_command_error(ctx, error):
+        metrics.increment("command_errors_total", command=ctx.command.qualified_name if ctx.command else "unknown", error=type(error).__name__)
         if isinstance(error, commands.MissingPermissions):
             await ctx.respond("You don't have the necessary permissions to use this command.", ephemeral=True)
         elif isinstance(error, commands.BotMissingPermissions):
@@ -1,60 +1,19 @@
 import discord
 from discord.commands import Option, SlashCommandGroup
-from discord.ext import commands, tasks
-import re
+from discord.ext import commands
 import datetime
-from db_utils import execute_db_query
+from db_utils import db
+from guild_config import guild_configs
+from block_filter import block_list
+from rate_limit import RateLimiter
+from content_analysis import analyze
+from actions import action_dispatcher
+from deletions import message_deleter
 
 def setup_filter(bot):
-
-    execute_db_query('''CREATE TABLE IF NOT EXISTS filter
-                    (guild_id INTEGER, word TEXT)''')
-    
-    execute_db_query('''CREATE TABLE IF NOT EXISTS block_filter
-                    (guild_id INTEGER, block_type TEXT, is_blocked INTEGER)''')
-
-    execute_db_query('''CREATE TABLE IF NOT EXISTS automod_settings
-                    (guild_id INTEGER, setting TEXT, value INTEGER)''')
-
-    message_counts_min = {}
-
-    block_list = ["discord_url", "telegram_url", "twitch_url", "youtube_url", "facebook_url", "twitter_url", "reddit_url", "instagram_url", "github_url",
-                  "file", "image", "video", "audio", "attachment", "invite", "emoji", "custom_emoji", "role_mention", "everyone_mention", "here_mention",
-                  "user_mention", "channel_mention", "url", "spoiler", "code", "inline_code", "quote", "block_quote", "bold", "italic", "underline"]
-
-    block_patterns = {
-        "discord_url": r"(?:https?://)?(?:www\.)?discord(?:app)?\.(?:com|gg)/(?:invite/)?[a-zA-Z0-9]+",
-        "telegram_url": r"(?:https?://)?(?:t\.me|telegram\.me)/[a-zA-Z0-9_]+",
-        "twitch_url": r"(?:https?://)?(?:www\.)?twitch\.tv/[a-zA-Z0-9_]+",
-        "youtube_url": r"(?:https?://)?(?:www\.)?youtube\.com/watch\?v=[a-zA-Z0-9_-]+",
-        "facebook_url": r"(?:https?://)?(?:www\.)?facebook\.com/[a-zA-Z0-9.]+",
-        "twitter_url": r"(?:https?://)?(?:www\.)?twitter\.com/[a-zA-Z0-9_]+",
-        "reddit_url": r"(?:https?://)?(?:www\.)?reddit\.com/r/[a-zA-Z0-9_]+",
-        "instagram_url": r"(?:https?://)?(?:www\.)?instagram\.com/[a-zA-Z0-9_.]+",
-        "github_url": r"(?:https?://)?(?:www\.)?github\.com/[a-zA-Z0-9_-]+",
-        "file": r"\S+\.[a-zA-Z0-9]+",
-        "image": r"\S+\.(?:jpg|jpeg|png|gif|bmp)",
-        "video": r"\S+\.(?:mp4|avi|mov|flv|wmv)",
-        "audio": r"\S+\.(?:mp3|wav|ogg|flac)",
-        "attachment": r"https://cdn\.discordapp\.com/attachments/\S+",
-        "invite": r"(?:https?://)?(?:www\.)?discord(?:app)?\.(?:com|gg)/(?:invite/)?[a-zA-Z0-9]+",
-        "emoji": r"<:[a-zA-Z0-9_]+:\d+>",
-        "custom_emoji": r"<:[a-zA-Z0-9_]+:\d+>",
-        "role_mention": r"<@&\d+>",
-        "everyone_mention": r"@everyone",
-        "here_mention": r"@here",
-        "user_mention": r"<@!?\d+>",
-        "channel_mention": r"<#\d+>",
-        "url": r"https?://\S+",
-        "spoiler": r"\|\|.+?\|\|",
-        "code": r"```[\s\S]+?```",
-        "inline_code": r"`[^`\n]+`",
-        "quote": r"^>\s.+",
-        "block_quote": r"^>>>\s[\s\S]+",
-        "bold": r"\*\*[^*]+\*\*",
-        "italic": r"\*[^*]+\*",
-        "underline": r"__[^_]+__"
-    }
+    # Separate limiters, since a guild's oldest channel can share the guild's id
+    spam_limiter = RateLimiter(period=60)
+    channel_spam_limiter = RateLimiter(period=60)
 
     automod_settings = {
         "caps_percent": {"name": "Excessive Caps", "description": "Percentage of uppercase characters allowed"},
@@ -64,7 +23,12 @@ def setup_filter(bot):
         "emoji_limit": {"name": "Emoji Limit", "description": "Maximum number of emojis allowed per message"},
         "max_lines": {"name": "Maximum Lines", "description": "Maximum number of lines allowed per message"},
         "max_words": {"name": "Maximum Words", "description": "Maximum number of words allowed per message"},
-        "zalgo_text": {"name": "Zalgo Text", "description": "Whether to filter out Zalgo text (0 for off, 1 for on)"}
+        "zalgo_text": {"name": "Zalgo Text", "description": "Whether to filter out Zalgo text (0 for off, 1 for on)"},
+        "filter_whole_words": {"name": "Filter Whole Words", "description": "Whether filtered words only match as whole words (0 for off, 1 for on)"},
+        "filter_lookalikes": {"name": "Filter Lookalikes", "description": "Whether filtered words also match lookalike characters such as 0 for o (0 for off, 1 for on)"},
+        "raid_joins": {"name": "Raid Detection", "description": "Number of joins within 10 seconds that switches on raid mode (0 for off)"},
+        "raid_action": {"name": "Raid Action", "description": "Action taken on members joining during a raid (0 for none, 1 for a one hour timeout, 2 for a kick)"},
+        "raid_hold_days": {"name": "Raid Verification Hold", "description": "During a raid, accounts younger than this many days can't verify (0 for off)"}
     }
 
     def get_automod_value(value_str):
@@ -85,7 +49,8 @@ def setup_filter(bot):
     @commands.has_permissions(manage_messages=True)
     async def add_filter(ctx, word: Option(str, "Word to add to the filter")):
         await ctx.defer()
-        execute_db_query("INSERT INTO filter VALUES (?, ?)", (ctx.guild.id, word.lower()))
+        await db.execute("INSERT OR IGNORE INTO filter VALUES (?, ?)", (ctx.guild.id, word.lower()))
+        guild_configs.add_filter_word(ctx.guild.id, word.lower())
         embed = discord.Embed(title="Word Added", description=f"'{word}' has been added to the filter.", color=discord.Color.green())
         await ctx.respond(embed=embed)
 
@@ -93,7 +58,8 @@ def setup_filter(bot):
     @commands.has_permissions(manage_messages=True)
     async def remove_filter(ctx, word: Option(str, "Word to remove from the filter")):
         await ctx.defer()
-        execute_db_query("DELETE FROM filter WHERE guild_id = ? AND word = ?", (ctx.guild.id, word.lower()))
+        await db.execute("DELETE FROM filter WHERE guild_id = ? AND word = ?", (ctx.guild.id, word.lower()))
+        guild_configs.remove_filter_word(ctx.guild.id, word.lower())
         embed = discord.Embed(title="Word Removed", description=f"'{word}' has been removed from the filter.", color=discord.Color.green())
         await ctx.respond(embed=embed)
 
@@ -101,8 +67,10 @@ def setup_filter(bot):
     @commands.has_permissions(administrator=True)
     async def reset_filter(ctx):
         await ctx.defer()
-        execute_db_query("DELETE FROM filter WHERE guild_id = ?", (ctx.guild.id,))
-        execute_db_query("DELETE FROM block_filter WHERE guild_id = ?", (ctx.guild.id,))
+        async with db.transaction() as tx:
+            await tx.execute("DELETE FROM filter WHERE guild_id = ?", (ctx.guild.id,))
+            await tx.execute("DELETE FROM block_filter WHERE guild_id = ?", (ctx.guild.id,))
+        guild_configs.reset_filter(ctx.guild.id)
         embed = discord.Embed(title="Filter Reset", description="The filter has been reset for this server.", color=discord.Color.green())
         await ctx.respond(embed=embed)
 
@@ -114,7 +82,8 @@ def setup_filter(bot):
             await ctx.respond("Invalid block type. Please choose from the autocomplete list.")
             return
         
-        execute_db_query("INSERT OR REPLACE INTO block_filter VALUES (?, ?, ?)", (ctx.guild.id, block_type, 1))
+        await db.execute("INSERT OR REPLACE INTO block_filter VALUES (?, ?, ?)", (ctx.guild.id, block_type, 1))
+        guild_configs.set_blocked(ctx.guild.id, block_type, True)
         embed = discord.Embed(title="Content Blocked", description=f"'{block_type}' has been blocked in this server.", color=discord.Color.green())
         await ctx.respond(embed=embed)
 
@@ -126,7 +95,8 @@ def setup_filter(bot):
             await ctx.respond("Invalid block type. Please choose from the autocomplete list.")
             return
         
-        execute_db_query("DELETE FROM block_filter WHERE guild_id = ? AND block_type = ?", (ctx.guild.id, block_type))
+        await db.execute("DELETE FROM block_filter WHERE guild_id = ? AND block_type = ?", (ctx.guild.id, block_type))
+        guild_configs.set_blocked(ctx.guild.id, block_type, False)
         embed = discord.Embed(title="Content Unblocked", description=f"'{block_type}' has been unblocked in this server.", color=discord.Color.green())
         await ctx.respond(embed=embed)
 
@@ -134,8 +104,8 @@ def setup_filter(bot):
     @commands.has_permissions(manage_messages=True)
     async def view_blocks(ctx):
         await ctx.defer()
-        blocked_types = execute_db_query("SELECT block_type FROM block_filter WHERE guild_id = ? AND is_blocked = 1", (ctx.guild.id,))
-        blocked_types = [row[0] for row in blocked_types]
+        config = await guild_configs.get(ctx.guild.id)
+        blocked_types = sorted(config.blocked_types)
         
         if not blocked_types:
             embed = discord.Embed(title="Block List", description="No content types are currently blocked.", color=discord.Color.blue())
@@ -161,7 +131,8 @@ def setup_filter(bot):
             await ctx.respond("Invalid value. Please use 'off', 'low', 'medium', 'high', or a number.")
             return
         
-        execute_db_query("INSERT OR REPLACE INTO automod_settings VALUES (?, ?, ?)", (ctx.guild.id, setting, numeric_value))
+        await db.execute("INSERT OR REPLACE INTO automod_settings VALUES (?, ?, ?)", (ctx.guild.id, setting, numeric_value))
+        guild_configs.set_automod(ctx.guild.id, setting, numeric_value)
         embed = discord.Embed(title="Automod Setting Updated", description=f"'{automod_settings[setting]['name']}' has been set to {value}.", color=discord.Color.green())
         await ctx.respond(embed=embed)
 
@@ -169,7 +140,8 @@ def setup_filter(bot):
     @commands.has_permissions(administrator=True)
     async def view_automod(ctx):
         await ctx.defer()
-        settings = execute_db_query("SELECT setting, value FROM automod_settings WHERE guild_id = ?", (ctx.guild.id,))
+        config = await guild_configs.get(ctx.guild.id)
+        settings = list(config.automod.items())
         
         embed = discord.Embed(title="Automod Settings", color=discord.Color.blue())
         for setting, value in settings:
@@ -183,71 +155,67 @@ def setup_filter(bot):
 
     @bot.event
     async def on_message(message):
-        if message.author.bot:
+        if message.author.bot or message.guild is None:
             return
 
-        # Check for spam
-        if message.guild.id not in message_counts_min:
-            message_counts_min[message.guild.id] = {}
-        if message.author.id not in message_counts_min[message.guild.id]:
-            message_counts_min[message.guild.id][message.author.id] = 0
-        message_counts_min[message.guild.id][message.author.id] += 1
-
-        # Fetch the latest max_messages value from the database
-        result = execute_db_query("SELECT max_messages FROM max_messages WHERE guild_id = ?", (message.guild.id,))
-        max_messages = result[0][0] if result else 10  # Default to 10 if not set
-
-        if message_counts_min.get(message.guild.id, {}).get(message.author.id, 0) > max_messages:
-            if message_counts_min.get(message.guild.id, {}).get(message.author.id, 0) > max_messages + 10:
-                await message.author.timeout_for(duration=datetime.timedelta(minutes=1), reason="Spamming")
-                embed = discord.Embed(title="Spam Warning", description=f"{message.author.mention} has been timed out for spamming.", color=discord.Color.red())
-                await message.channel.send(embed=embed)
+        config = await guild_configs.get(message.guild.id)
+
+        # Check for spam, against the channel's own limit if it has one
+        max_messages = config.channel_max_messages.get(message.channel.id)
+        if max_messages:
+            overflow = channel_spam_limiter.hit(message.channel.id, message.author.id, max_messages)
+        else:
+            overflow = spam_limiter.hit(message.guild.id, message.author.id, config.max_messages)
+
+        if overflow > 0:
+            if overflow > 10:
+                async def spam_timeout():
+                    await message.author.timeout_for(duration=datetime.timedelta(minutes=1), reason="Spamming")
+                    embed = discord.Embed(title="Spam Warning", description=f"{message.author.mention} has been timed out for spamming.", color=discord.Color.red())
+                    await message.channel.send(embed=embed)
+
+                action_dispatcher.submit(("spam_timeout", spam_timeout))
                 return
             embed = discord.Embed(title="Hold your horses!", description="You're sending messages too quickly. Please slow down.", color=discord.Color.red())
-            await message.channel.send(message.author.mention, embed=embed)
-            await message.delete()
+            message_deleter.delete(message)
+            action_dispatcher.submit(("spam_warning", lambda: message.channel.send(message.author.mention, embed=embed)))
             return
 
         # Block filter
-        blocked_types = execute_db_query("SELECT block_type FROM block_filter WHERE guild_id = ? AND is_blocked = 1", (message.guild.id,))
-        blocked_types = [row[0] for row in blocked_types]
-
-        for block_type in blocked_types:
-            if block_type in block_patterns:
-                pattern = block_patterns[block_type]
-                if re.search(pattern, message.content):
-                    await message.delete()
-                    await message.channel.send(f"{message.author.mention}, your message was removed because it contained blocked content: {block_type}")
-                    return
+        block_type = config.block_matcher.search(message.content)
+        if block_type:
+            message_deleter.delete(message)
+            action_dispatcher.submit(("block_notice", lambda: message.channel.send(f"{message.author.mention}, your message was removed because it contained blocked content: {block_type}")))
+            return
 
         # Word filter
-        filtered_words = execute_db_query("SELECT word FROM filter WHERE guild_id = ?", (message.guild.id,))
-        filtered_words = [row[0] for row in filtered_words]
-
-        content = message.content.lower()
-        for word in filtered_words:
-            if word in content:
-                censored_content = content.replace(word, f"||{word}||")
-                await message.delete()
-                censored_content_chunks = [censored_content[i:i+2000] for i in range(0, len(censored_content), 2000)]
+        censored_content = config.word_filter.censor(message.content)
+        if censored_content is not None:
+            censored_content_chunks = [censored_content[i:i+2000] for i in range(0, len(censored_content), 2000)]
+
+            async def repost_censored():
                 for chunk in censored_content_chunks:
                     await message.channel.send(f"{message.author.mention} said: {chunk}")
-                return
 
-        automod_settings = execute_db_query("SELECT setting, value FROM automod_settings WHERE guild_id = ?", (message.guild.id,))
-        automod_settings = dict(automod_settings)
+            message_deleter.delete(message)
+            action_dispatcher.submit(("censored_repost", repost_censored))
+            return
+
+        automod_settings = config.automod
 
         violations = []
 
+        # Only the features behind enabled settings are computed
+        features = analyze(message.content, config.automod_features)
+
         # Check caps percentage
         if "caps_percent" in automod_settings and automod_settings["caps_percent"] > 0:
-            caps_count = sum(1 for c in message.content if c.isupper())
-            if len(message.content) > 0 and (caps_count / len(message.content)) * 100 > automod_settings["caps_percent"]:
+            if features.caps_percent > automod_settings["caps_percent"]:
                 violations.append("excessive caps")
 
         # Check repeated characters
         if "repeated_chars" in automod_settings and automod_settings["repeated_chars"] > 0:
-            if any(char * automod_settings["repeated_chars"] in message.content for char in set(message.content)):
+            if features.longest_run >= automod_settings["repeated_chars"]:
                 violations.append("repeated characters")
 
         # Check mention limit
@@ -258,56 +226,55 @@ def setup_filter(bot):
 
         # Check emoji limit
         if "emoji_limit" in automod_settings and automod_settings["emoji_limit"] > 0:
-            emoji_count = len(re.findall(r'<:[a-zA-Z0-9_]+:\d+>', message.content))
-            if emoji_count > automod_settings["emoji_limit"]:
+            if features.custom_emojis > automod_settings["emoji_limit"]:
                 violations.append("excessive emojis")
 
         # Check max lines
         if "max_lines" in automod_settings and automod_settings["max_lines"] > 0:
-            if len(message.content.split('\n')) > automod_settings["max_lines"]:
+            if features.lines > automod_settings["max_lines"]:
                 violations.append("too many lines")
 
         # Check max words
         if "max_words" in automod_settings and automod_settings["max_words"] > 0:
-            if len(message.content.split()) > automod_settings["max_words"]:
+            if features.words > automod_settings["max_words"]:
                 violations.append("too many words")
 
         # Check Zalgo text
         if "zalgo_text" in automod_settings and automod_settings["zalgo_text"] > 0:
-            if re.search(r'[\u0300-\u036f\u0489]', message.content):
+            if features.combining_marks > 0:
                 violations.append("Zalgo text")
 
         # Take action if there are violations
         if violations:
-            await message.delete()
             violation_text = ", ".join(violations)
             warn_embed = discord.Embed(title="Automod Warning", description=f"{message.author.mention}, your message was removed for the following reason(s): {violation_text}", color=discord.Color.orange())
-            await message.channel.send(embed=warn_embed)
 
             # Timeout the user
-            try:
-                await message.author.timeout_for(duration=datetime.timedelta(minutes=5), reason=f"Automod violation: {violation_text}")
+            async def automod_timeout():
+                try:
+                    await message.author.timeout_for(duration=datetime.timedelta(minutes=5), reason=f"Automod violation: {violation_text}")
+                except discord.errors.Forbidden:
+                    print(f"Unable to timeout {message.author} (ID: {message.author.id}) due to lack of permissions.")
+                    raise
                 timeout_embed = discord.Embed(title="User Timed Out", description=f"{message.author.mention} has been timed out for 5 minutes due to automod violations.", color=discord.Color.red())
                 await message.channel.send(embed=timeout_embed)
-            except discord.errors.Forbidden:
-                print(f"Unable to timeout {message.author} (ID: {message.author.id}) due to lack of permissions.")
+
+            message_deleter.delete(message)
+            actions = [
+                ("automod_warning", lambda: message.channel.send(embed=warn_embed)),
+                ("automod_timeout", automod_timeout),
+            ]
 
             # Log the violation
-            log_channel_id = execute_db_query("SELECT channel_id FROM log_channels WHERE guild_id = ?", (message.guild.id,))
-            if log_channel_id:
-                log_channel = message.guild.get_channel(log_channel_id[0][0])
-                if log_channel:
-                    log_embed = discord.Embed(title="Automod Violation", color=discord.Color.orange())
-                    log_embed.add_field(name="User", value=f"{message.author.mention} ({message.author.id})", inline=False)
-                    log_embed.add_field(name="Channel", value=message.channel.mention, inline=False)
-                    log_embed.add_field(name="Violations", value=violation_text, inline=False)
-                    log_embed.add_field(name="Message Content", value=message.content[:1024], inline=False)
-                    await log_channel.send(embed=log_embed)
-
-    @tasks.loop(minutes=1)
-    async def reset_spam_tracker():
-        message_counts_min.clear()
-
-    reset_spam_tracker.start()
+            log_channel = message.guild.get_channel(config.log_channel_id) if config.log_channel_id else None
+            if log_channel:
+                log_embed = discord.Embed(title="Automod Violation", color=discord.Color.orange())
+                log_embed.add_field(name="User", value=f"{message.author.mention} ({message.author.id})", inline=False)
+                log_embed.add_field(name="Channel", value=message.channel.mention, inline=False)
+                log_embed.add_field(name="Violations", value=violation_text, inline=False)
+                log_embed.add_field(name="Message Content", value=message.content[:1024], inline=False)
+                actions.append(("automod_log", lambda: log_channel.send(embed=log_embed)))
+
+            action_dispatcher.submit(*actions)
 
     bot.add_application_command(automod)
\ No newline at end of file
@@ -0,0 +1,172 @@
+import asyncio
+from db_utils import db
+from word_filter import WordFilter
+from block_filter import get_block_matcher
+from content_analysis import features_for
+
+DEFAULT_MAX_MESSAGES = 10
+
+
+class GuildConfig:
+    __slots__ = ("guild_id", "max_messages", "channel_max_messages", "blocked_types", "block_matcher", "word_filter", "automod", "automod_features", "log_channel_id", "log_settings")
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.max_messages = DEFAULT_MAX_MESSAGES
+        self.channel_max_messages = {}
+        self.blocked_types = set()
+        self.block_matcher = get_block_matcher(())
+        self.word_filter = WordFilter()
+        self.automod = {}
+        self.automod_features = frozenset()
+        self.log_channel_id = None
+        self.log_settings = {}
+
+
+class GuildConfigCache:
+    def __init__(self):
+        self._configs = {}
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def _load(self, guild_id):
+        max_messages, channel_max_messages, blocks, words, automod, log_channels, log_settings = await asyncio.gather(
+            db.fetch("SELECT max_messages FROM max_messages WHERE guild_id = ?", (guild_id,)),
+            db.fetch("SELECT channel_id, max_messages FROM channel_max_messages WHERE guild_id = ?", (guild_id,)),
+            db.fetch("SELECT block_type FROM block_filter WHERE guild_id = ? AND is_blocked = 1", (guild_id,)),
+            db.fetch("SELECT word FROM filter WHERE guild_id = ?", (guild_id,)),
+            db.fetch("SELECT setting, value FROM automod_settings WHERE guild_id = ?", (guild_id,)),
+            db.fetch("SELECT channel_id FROM log_channels WHERE guild_id = ?", (guild_id,)),
+            db.fetch("SELECT aspect, enabled FROM log_settings WHERE guild_id = ?", (guild_id,)),
+        )
+        config = GuildConfig(guild_id)
+        if max_messages:
+            config.max_messages = max_messages[0][0]
+        config.channel_max_messages = dict(channel_max_messages)
+        config.blocked_types = {row[0] for row in blocks}
+        config.block_matcher = get_block_matcher(config.blocked_types)
+        config.automod = dict(automod)
+        config.automod_features = features_for(config.automod)
+        config.word_filter = WordFilter(
+            (row[0] for row in words),
+            whole_words=config.automod.get("filter_whole_words", 0) > 0,
+            confusables=config.automod.get("filter_lookalikes", 0) > 0,
+        )
+        if log_channels:
+            config.log_channel_id = log_channels[0][0]
+        config.log_settings = dict(log_settings)
+        return config
+
+    async def get(self, guild_id):
+        config = self._configs.get(guild_id)
+        if config is not None:
+            self.hits += 1
+            return config
+
+        self.misses += 1
+        task = self._loading.get(guild_id)
+        if task is None:
+            task = self._loading[guild_id] = asyncio.ensure_future(self._load(guild_id))
+        try:
+            config = await asyncio.shield(task)
+        except BaseException:
+            # A failed load is forgotten so the next get() tries again
+            if self._loading.get(guild_id) is task and task.done():
+                del self._loading[guild_id]
+            raise
+        # A write that lands while the load is in flight drops the task from _loading,
+        # in which case this (possibly stale) result is used once but not cached
+        if self._loading.get(guild_id) is task:
+            del self._loading[guild_id]
+            self._configs[guild_id] = config
+        return self._configs.get(guild_id, config)
+
+    def cached(self, guild_id):
+        return self._configs.get(guild_id)
+
+    def _loaded(self, guild_id):
+        self._loading.pop(guild_id, None)
+        return self._configs.get(guild_id)
+
+    def invalidate(self, guild_id):
+        self._loading.pop(guild_id, None)
+        self._configs.pop(guild_id, None)
+
+    def add_filter_word(self, guild_id, word):
+        config = self._loaded(guild_id)
+        if config:
+            config.word_filter.add(word)
+
+    def remove_filter_word(self, guild_id, word):
+        config = self._loaded(guild_id)
+        if config:
+            config.word_filter.remove(word)
+
+    def reset_filter(self, guild_id):
+        config = self._loaded(guild_id)
+        if config:
+            config.word_filter.clear()
+            config.blocked_types.clear()
+            config.block_matcher = get_block_matcher(())
+
+    def set_blocked(self, guild_id, block_type, blocked):
+        config = self._loaded(guild_id)
+        if config:
+            if blocked:
+                config.blocked_types.add(block_type)
+            else:
+                config.blocked_types.discard(block_type)
+            config.block_matcher = get_block_matcher(config.blocked_types)
+
+    def set_automod(self, guild_id, setting, value):
+        config = self._loaded(guild_id)
+        if config:
+            config.automod[setting] = value
+            config.automod_features = features_for(config.automod)
+            if setting == "filter_whole_words":
+                config.word_filter.configure(whole_words=value > 0)
+            elif setting == "filter_lookalikes":
+                config.word_filter.configure(confusables=value > 0)
+
+    def set_max_messages(self, guild_id, max_messages):
+        config = self._loaded(guild_id)
+        if config:
+            config.max_messages = max_messages
+
+    def set_channel_max_messages(self, guild_id, channel_id, max_messages):
+        config = self._loaded(guild_id)
+        if config:
+            if max_messages:
+                config.channel_max_messages[channel_id] = max_messages
+            else:
+                config.channel_max_messages.pop(channel_id, None)
+
+    def set_log_channel(self, guild_id, channel_id):
+        config = self._loaded(guild_id)
+        if config:
+            config.log_channel_id = channel_id
+
+    def set_log_settings(self, guild_id, aspects, enabled):
+        config = self._loaded(guild_id)
+        if config:
+            for aspect in aspects:
+                config.log_settings[aspect] = enabled
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "guilds": len(self._configs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+guild_configs = GuildConfigCache()
+
+
+def setup_guild_config(bot):
+    @bot.listen("on_guild_remove")
+    async def drop_guild_config(guild):
+        guild_configs.invalidate(guild.id)
@@ -46,12 +46,12 @@ def setup_help(bot):
 
         # Main help embed
         embed = discord.Embed(title="PeaceKeeper Help", description="Welcome to PeaceKeeper! Here's an overview of available commands:", color=discord.Color.blue())
-        embed.add_field(name="Moderation", value="`/ban`, `/kick`, `/timeout`, `/warn`, `/clear`", inline=False)
+        embed.add_field(name="Moderation", value="`/ban`, `/kick`, `/timeout`, `/mass ban`, `/mass kick`, `/mass timeout`, `/warn`, `/clear`", inline=False)
         embed.add_field(name="Filters", value="`/add_filter`, `/remove_filter`, `/view_filter`, `/block`, `/unblock`", inline=False)
-        embed.add_field(name="Logs", value="`/set_log_channel`, `/enable_log`, `/disable_log`, `/view_log_settings`", inline=False)
+        embed.add_field(name="Logs", value="`/set_log_channel`, `/enable_log`, `/disable_log`, `/view_log_settings`, `/search_logs`", inline=False)
         embed.add_field(name="User Management", value="`/add_role`, `/remove_role`, `/temprole`, `/notes`", inline=False)
         embed.add_field(name="Utilities", value="`/server_info`, `/user_info`, `/role_info`, `/channel_info`", inline=False)
-        embed.add_field(name="Automod", value="`/automod set`, `/automod view`", inline=False)
+        embed.add_field(name="Automod", value="`/automod set`, `/automod view`, `/raid_mode`", inline=False)
         embeds.append(embed)
 
         # Moderation commands
@@ -59,8 +59,9 @@ def setup_help(bot):
         embed.add_field(name="/ban <member> [reason]", value="Ban a member from the server", inline=False)
         embed.add_field(name="/kick <member> [reason]", value="Kick a member from the server", inline=False)
         embed.add_field(name="/timeout <member> <duration> [reason]", value="Timeout a member for a specified duration", inline=False)
+        embed.add_field(name="/mass ban|kick|timeout [ids] [joined_within] [account_age] [name_pattern] [reason]", value="Act on every member matching all given criteria, after a confirmation", inline=False)
         embed.add_field(name="/warn <member> <reason>", value="Warn a member", inline=False)
-        embed.add_field(name="/clear <amount>", value="Clear a specified number of messages", inline=False)
+        embed.add_field(name="/clear <amount> [user] [pattern] [content] [attachments] [within] [older_than] [include_old]", value="Clear up to a number of messages, optionally only those matching the filters", inline=False)
         embeds.append(embed)
 
         # Filter commands
@@ -78,6 +79,7 @@ def setup_help(bot):
         embed.add_field(name="/enable_log <aspect>", value="Enable a log aspect", inline=False)
         embed.add_field(name="/disable_log <aspect>", value="Disable a log aspect", inline=False)
         embed.add_field(name="/view_log_settings", value="View the current log settings", inline=False)
+        embed.add_field(name="/search_logs [user] [aspect] [days]", value="Search archived log events", inline=False)
         embeds.append(embed)
 
         # User management commands
@@ -105,7 +107,10 @@ def setup_help(bot):
         embed = discord.Embed(title="Automod Commands", color=discord.Color.orange())
         embed.add_field(name="/automod set <setting> <value>", value="Configure an automod setting", inline=False)
         embed.add_field(name="/automod view", value="View current automod settings", inline=False)
-        embed.add_field(name="Available Settings", value="caps_percent, repeated_chars, spam_messages, mention_limit, emoji_limit, max_lines, max_words, zalgo_text", inline=False)
+        embed.add_field(name="/raid_mode <enabled>", value="Turn raid mode on or off by hand", inline=False)
+        embed.add_field(name="/set_max_messages <max_messages>", value="Set how many messages users can send per minute", inline=False)
+        embed.add_field(name="/set_channel_max_messages <channel> <max_messages>", value="Set a per-minute message limit for one channel (0 to use the server limit)", inline=False)
+        embed.add_field(name="Available Settings", value="caps_percent, repeated_chars, spam_messages, mention_limit, emoji_limit, max_lines, max_words, zalgo_text, filter_whole_words, filter_lookalikes, raid_joins, raid_action, raid_hold_days", inline=False)
         embed.add_field(name="Setting Values", value="Use 'off', 'low', 'medium', 'high', or a specific number", inline=False)
         embeds.append(embed)
 
@@ -0,0 +1,215 @@
+import asyncio
+import datetime
+import json
+import zlib
+import discord
+from discord.ext import tasks
+from db_utils import Database
+
+ARCHIVE_PATH = 'log_archive.db'
+
+
+def _segment_for(event_id):
+    return f"events_{discord.utils.snowflake_time(event_id):%Y%m}"
+
+
+def _month_end(table):
+    year, month = int(table[7:11]), int(table[11:13])
+    if month == 12:
+        return datetime.datetime(year + 1, 1, 1, tzinfo=datetime.timezone.utc)
+    return datetime.datetime(year, month + 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class ArchivedEvent:
+    __slots__ = ("id", "guild_id", "user_id", "aspect", "embed")
+
+    def __init__(self, id, guild_id, user_id, aspect, embed):
+        self.id = id
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.aspect = aspect
+        self.embed = embed
+
+    @property
+    def created_at(self):
+        return discord.utils.snowflake_time(self.id)
+
+
+class EventArchive:
+    # Every logged event, kept in a separate SQLite file split into one table per month.
+    # Event ids are snowflakes, so the id alone orders events, locates their segment and
+    # serves as the keyset cursor for time ranges and pagination. Embeds are stored as
+    # zlib-compressed JSON. log_event only appends to a pending list; a background task
+    # writes it in batches on the archive's writer thread, and retention drops whole
+    # segments and trims the oldest one.
+    def __init__(self, path=ARCHIVE_PATH, retention_days=90, batch_size=500, max_pending=20000):
+        self.db = Database(path, readers=2)
+        self.retention = datetime.timedelta(days=retention_days)
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._pending = []
+        self._segments = []
+        self._last_id = 0
+        self._flushing = None
+        self.archived = 0
+        self.dropped = 0
+
+    def open(self):
+        self._segments = self.db.run_sync(self._open)
+
+    def _open(self, conn):
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'events_%'").fetchall()
+        return sorted((row[0] for row in rows), reverse=True)
+
+    def _next_id(self):
+        event_id = max(self._last_id + 1, discord.utils.time_snowflake(discord.utils.utcnow()))
+        self._last_id = event_id
+        return event_id
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def add(self, guild_id, aspect, embed, user_id=None):
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append((self._next_id(), guild_id, user_id, aspect, embed.to_dict()))
+        if len(self._pending) >= self.batch_size:
+            self.schedule_flush()
+
+    def schedule_flush(self):
+        if self._pending and self._flushing is None:
+            self._flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        try:
+            while self._pending:
+                batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+                try:
+                    created = await self.db.call(lambda conn: self._write(conn, batch))
+                except Exception as e:
+                    self.dropped += len(batch)
+                    print(f"Failed to archive {len(batch)} log events: {e}")
+                    continue
+                if created:
+                    self._segments = sorted(set(self._segments).union(created), reverse=True)
+                self.archived += len(batch)
+        finally:
+            self._flushing = None
+
+    def _write(self, conn, batch):
+        # Runs on the writer thread, so compression stays off the event loop
+        rows = {}
+        for event_id, guild_id, user_id, aspect, embed in batch:
+            payload = zlib.compress(json.dumps(embed, separators=(',', ':')).encode('utf-8'))
+            rows.setdefault(_segment_for(event_id), []).append((event_id, guild_id, user_id, aspect, payload))
+        created = [table for table in rows if table not in self._segments]
+        conn.execute("BEGIN")
+        try:
+            for table in created:
+                conn.execute(f'''CREATE TABLE IF NOT EXISTS {table}
+                             (id INTEGER PRIMARY KEY, guild_id INTEGER, user_id INTEGER, aspect TEXT, payload BLOB)''')
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_guild ON {table} (guild_id, id)")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_guild_user ON {table} (guild_id, user_id, id)")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_guild_aspect ON {table} (guild_id, aspect, id)")
+            for table, table_rows in rows.items():
+                conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?)", table_rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return created
+
+    async def search(self, guild_id, user_id=None, aspect=None, since=None, before_id=None, limit=10):
+        # Newest first. Pass the id of the last event of a page as before_id for the next one.
+        upper = before_id if before_id is not None else discord.utils.time_snowflake(discord.utils.utcnow(), high=True) + 1
+        lower = discord.utils.time_snowflake(since) if since is not None else 0
+        conditions = "guild_id = ? AND id < ? AND id >= ?"
+        params = [guild_id, upper, lower]
+        if user_id is not None:
+            conditions += " AND user_id = ?"
+            params.append(user_id)
+        if aspect is not None:
+            conditions += " AND aspect = ?"
+            params.append(aspect)
+
+        events = []
+        upper_segment = _segment_for(upper - 1)
+        lower_segment = _segment_for(lower) if lower else ""
+        for table in self._segments:
+            if table > upper_segment:
+                continue
+            if table < lower_segment:
+                break
+            rows = await self.db.fetch(f"SELECT id, guild_id, user_id, aspect, payload FROM {table} WHERE {conditions} ORDER BY id DESC LIMIT ?", (*params, limit - len(events)))
+            for event_id, guild_id, user_id, aspect, payload in rows:
+                events.append(ArchivedEvent(event_id, guild_id, user_id, aspect, json.loads(zlib.decompress(payload))))
+            if len(events) >= limit:
+                break
+        return events
+
+    async def prune(self):
+        cutoff = discord.utils.utcnow() - self.retention
+        cutoff_id = discord.utils.time_snowflake(cutoff)
+        expired = [table for table in self._segments if _month_end(table) <= cutoff]
+        oldest = next((table for table in reversed(self._segments) if table not in expired), None)
+
+        def prune_segments(conn):
+            conn.execute("BEGIN")
+            try:
+                for table in expired:
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                if oldest is not None:
+                    conn.execute(f"DELETE FROM {oldest} WHERE id < ?", (cutoff_id,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+
+        self._segments = [table for table in self._segments if table not in expired]
+        await self.db.call(prune_segments)
+        return len(expired)
+
+    def close(self):
+        # Write whatever is still pending before the writer thread shuts down
+        if self._pending:
+            self.db.run_sync(lambda conn: self._write(conn, self._pending))
+            self._pending = []
+        self.db.close()
+
+    def stats(self):
+        return {
+            "pending": self.depth,
+            "segments": len(self._segments),
+            "archived": self.archived,
+            "dropped": self.dropped,
+        }
+
+
+event_archive = EventArchive()
+
+
+def setup_log_archive(bot):
+    event_archive.open()
+
+    @tasks.loop(seconds=2)
+    async def flush_event_archive():
+        event_archive.schedule_flush()
+
+    @tasks.loop(hours=24)
+    async def prune_event_archive():
+        dropped = await event_archive.prune()
+        if dropped:
+            print(f"Dropped {dropped} expired log archive segments")
+
+    @bot.listen("on_ready")
+    async def start_event_archive():
+        if not flush_event_archive.is_running():
+            flush_event_archive.start()
+        if not prune_event_archive.is_running():
+            prune_event_archive.start()
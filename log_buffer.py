@@ -0,0 +1,167 @@
+import asyncio
+from collections import deque
+import discord
+
+MAX_EMBEDS = 10
+MAX_EMBED_CHARS = 6000
+MAX_DESCRIPTION = 4096
+MAX_FIELD_SUMMARY = 120
+MAX_LINE = 400
+
+
+class _ChannelBuffer:
+    __slots__ = ("channel", "entries", "full")
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.entries = deque()
+        self.full = asyncio.Event()
+
+
+def _shorten(text, limit):
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def summary_line(embed):
+    # One event on one line, keeping its fields (content, before/after, reason...)
+    parts = [embed.description or embed.title]
+    parts.extend(f"**{field.name}:** {_shorten(field.value, MAX_FIELD_SUMMARY)}" for field in embed.fields)
+    return _shorten(f"• {' | '.join(parts)}", MAX_LINE)
+
+
+class _Summary:
+    # Several log events of one aspect folded into a single embed
+    __slots__ = ("title", "color", "count", "lines", "size")
+
+    def __init__(self, title, color):
+        self.title = title
+        self.color = color
+        self.count = 0
+        self.lines = []
+        self.size = 0
+
+    def absorb(self, entry):
+        if isinstance(entry, _Summary):
+            self.count += entry.count
+            lines = entry.lines
+        else:
+            self.count += 1
+            lines = [summary_line(entry)]
+        for line in lines:
+            if self.size + len(line) + 1 <= MAX_DESCRIPTION - 32:
+                self.lines.append(line)
+                self.size += len(line) + 1
+
+    def to_embed(self):
+        description = "\n".join(self.lines)
+        if self.count > len(self.lines):
+            description += f"\n…and {self.count - len(self.lines)} more"
+        return discord.Embed(title=f"{self.title} (x{self.count})", description=description, color=self.color)
+
+
+class LogBuffer:
+    # Log embeds are queued per log channel and sent up to ten per message, once a
+    # message's worth is waiting or flush_after seconds have passed. Only once more than
+    # merge_backlog messages' worth is backed up are consecutive runs of the same aspect
+    # folded into a summary embed, a line per event, so the order of events is kept. New
+    # events are only dropped once max_pending entries remain even after merging.
+    def __init__(self, flush_after=2.0, max_pending=500, merge_at=3, merge_backlog=3):
+        self.flush_after = flush_after
+        self.max_pending = max_pending
+        self.merge_at = merge_at
+        self.merge_backlog = merge_backlog
+        self._buffers = {}
+        self.messages_sent = 0
+        self.embeds_sent = 0
+        self.merged = 0
+        self.dropped = 0
+        self.failures = 0
+
+    @property
+    def depth(self):
+        return sum(len(buffer.entries) for buffer in self._buffers.values())
+
+    def add(self, channel, aspect, embed):
+        buffer = self._buffers.get(channel.id)
+        if buffer is None:
+            buffer = self._buffers[channel.id] = _ChannelBuffer(channel)
+            asyncio.ensure_future(self._drain(channel.id))
+        if len(buffer.entries) >= self.max_pending:
+            self._merge(buffer)
+            if len(buffer.entries) >= self.max_pending:
+                self.dropped += 1
+                return False
+        buffer.entries.append((aspect, embed))
+        if len(buffer.entries) >= MAX_EMBEDS:
+            buffer.full.set()
+        return True
+
+    async def _drain(self, channel_id):
+        buffer = self._buffers[channel_id]
+        try:
+            await asyncio.wait_for(buffer.full.wait(), self.flush_after)
+        except asyncio.TimeoutError:
+            pass
+        try:
+            while buffer.entries:
+                if len(buffer.entries) > self.merge_backlog * MAX_EMBEDS:
+                    self._merge(buffer)
+                embeds = self._take(buffer.entries)
+                try:
+                    await buffer.channel.send(embeds=embeds)
+                    self.messages_sent += 1
+                    self.embeds_sent += len(embeds)
+                except discord.HTTPException as e:
+                    self.failures += 1
+                    print(f"Failed to send {len(embeds)} log embeds to {channel_id}: {e}")
+        finally:
+            del self._buffers[channel_id]
+
+    def _take(self, entries):
+        embeds = []
+        size = 0
+        while entries and len(embeds) < MAX_EMBEDS:
+            embed = entries[0][1]
+            if isinstance(embed, _Summary):
+                embed = embed.to_embed()
+            if embeds and size + len(embed) > MAX_EMBED_CHARS:
+                break
+            entries.popleft()
+            embeds.append(embed)
+            size += len(embed)
+        return embeds
+
+    def _merge(self, buffer):
+        runs = []
+        for aspect, entry in buffer.entries:
+            if runs and runs[-1][0] == aspect:
+                runs[-1][1].append(entry)
+            else:
+                runs.append((aspect, [entry]))
+        merged = deque()
+        for aspect, entries in runs:
+            if len(entries) < self.merge_at and not any(isinstance(entry, _Summary) for entry in entries):
+                merged.extend((aspect, entry) for entry in entries)
+                continue
+            summary = _Summary(entries[0].title, entries[0].color)
+            for entry in entries:
+                summary.absorb(entry)
+                if not isinstance(entry, _Summary):
+                    self.merged += 1
+            merged.append((aspect, summary))
+        buffer.entries = merged
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "channels": len(self._buffers),
+            "messages_sent": self.messages_sent,
+            "embeds_sent": self.embeds_sent,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
+
+
+log_buffer = LogBuffer()
@@ -1,27 +1,60 @@
+import asyncio
 import discord
 from discord.commands import Option
-from discord.ext import commands
-from datetime import datetime
-from db_utils import execute_db_query
+from discord.ext import commands, tasks
+from datetime import datetime, timedelta
+from db_utils import db
+from guild_config import guild_configs
+from log_buffer import log_buffer
+from membership import membership_index
+from audit_cache import audit_correlator
+from message_store import message_store
+from log_archive import event_archive
+from raid import raid_guard
+
+# Members a mass action is working on, by guild. The action logs one summary entry, so
+# their own removals and timeouts are not logged one by one.
+mass_action_targets = {}
+
+
+def covered_by_mass_action(guild_id, user_id):
+    targets = mass_action_targets.get(guild_id)
+    return targets is not None and user_id in targets
+
+
+def covered_by_summary(guild_id, user_id):
+    # Mass actions and raid enforcement each log a summary instead
+    return covered_by_mass_action(guild_id, user_id) or raid_guard.covers(guild_id, user_id)
+
+
+async def log_event(guild, aspect, embed, user_id=None):
+    # Everything is archived for /search_logs, whether or not the aspect is posted
+    event_archive.add(guild.id, aspect, embed, user_id)
+    config = await guild_configs.get(guild.id)
+    if not config.log_settings.get(aspect):
+        return
+    if config.log_channel_id:
+        channel = guild.get_channel(config.log_channel_id)
+        if channel:
+            log_buffer.add(channel, aspect, embed)
 
-def setup_logs(bot):
-    execute_db_query('''CREATE TABLE IF NOT EXISTS log_channels
-                 (guild_id INTEGER, channel_id INTEGER)''')
-    execute_db_query('''CREATE TABLE IF NOT EXISTS log_settings
-                 (guild_id INTEGER, aspect TEXT, enabled INTEGER)''')
 
+def setup_logs(bot):
     log_aspects = [
         "kick", "ban", "unban", "join", "leave", "message_delete", "message_edit",
         "channel_create", "channel_delete", "channel_update", "role_create",
         "role_delete", "role_update", "nickname_change", "user_update",
         "voice_state_update", "invite_create", "invite_delete", "member_timeout",
-        "role_add", "role_remove", "emoji_add", "emoji_remove", "role_permissions_update", "all"
+        "role_add", "role_remove", "emoji_add", "emoji_remove", "role_permissions_update", "raid", "temporary_role", "all"
     ]
 
+    user_update_lookups = asyncio.Semaphore(16)
+
     @bot.slash_command(name="set_log_channel", description="Set the log channel for the server")
     @commands.has_permissions(administrator=True)
     async def set_log_channel(ctx, channel: Option(discord.TextChannel, "The channel to set as log channel")):
-        execute_db_query("INSERT OR REPLACE INTO log_channels VALUES (?, ?)", (ctx.guild.id, channel.id))
+        await db.execute("INSERT OR REPLACE INTO log_channels VALUES (?, ?)", (ctx.guild.id, channel.id))
+        guild_configs.set_log_channel(ctx.guild.id, channel.id)
         embed = discord.Embed(title="Log Channel Set", description=f"Log channel has been set to {channel.mention}", color=discord.Color.green())
         await ctx.respond(embed=embed)
 
@@ -34,11 +67,12 @@ def setup_logs(bot):
             return
         
         if aspect == "all":
-            for asp in log_aspects[:-1]:
-                execute_db_query("INSERT OR REPLACE INTO log_settings VALUES (?, ?, ?)", (ctx.guild.id, asp, 1))
+            await db.executemany("INSERT OR REPLACE INTO log_settings VALUES (?, ?, ?)", [(ctx.guild.id, asp, 1) for asp in log_aspects[:-1]])
+            guild_configs.set_log_settings(ctx.guild.id, log_aspects[:-1], 1)
             embed = discord.Embed(title="Log Aspect Enabled", description="All log aspects have been enabled.", color=discord.Color.green())
         else:
-            execute_db_query("INSERT OR REPLACE INTO log_settings VALUES (?, ?, ?)", (ctx.guild.id, aspect, 1))
+            await db.execute("INSERT OR REPLACE INTO log_settings VALUES (?, ?, ?)", (ctx.guild.id, aspect, 1))
+            guild_configs.set_log_settings(ctx.guild.id, [aspect], 1)
             embed = discord.Embed(title="Log Aspect Enabled", description=f"The {aspect} log aspect has been enabled.", color=discord.Color.green())
         
         await ctx.respond(embed=embed)
@@ -52,74 +86,147 @@ def setup_logs(bot):
             return
         
         if aspect == "all":
-            for asp in log_aspects[:-1]:
-                execute_db_query("INSERT OR REPLACE INTO log_settings VALUES (?, ?, ?)", (ctx.guild.id, asp, 0))
+            await db.executemany("INSERT OR REPLACE INTO log_settings VALUES (?, ?, ?)", [(ctx.guild.id, asp, 0) for asp in log_aspects[:-1]])
+            guild_configs.set_log_settings(ctx.guild.id, log_aspects[:-1], 0)
             embed = discord.Embed(title="Log Aspect Disabled", description="All log aspects have been disabled.", color=discord.Color.green())
         else:
-            execute_db_query("INSERT OR REPLACE INTO log_settings VALUES (?, ?, ?)", (ctx.guild.id, aspect, 0))
+            await db.execute("INSERT OR REPLACE INTO log_settings VALUES (?, ?, ?)", (ctx.guild.id, aspect, 0))
+            guild_configs.set_log_settings(ctx.guild.id, [aspect], 0)
             embed = discord.Embed(title="Log Aspect Disabled", description=f"The {aspect} log aspect has been disabled.", color=discord.Color.green())
         
         await ctx.respond(embed=embed)
 
-    async def log_event(guild, aspect, embed):
-        result = execute_db_query("SELECT channel_id FROM log_channels WHERE guild_id = ?", (guild.id,))
-        if result:
-            channel_id = result[0][0]
-            enabled = execute_db_query("SELECT enabled FROM log_settings WHERE guild_id = ? AND aspect = ?", (guild.id, aspect))
-            if enabled and enabled[0][0]:
-                channel = guild.get_channel(channel_id)
-                if channel:
-                    await channel.send(embed=embed)
-
     @bot.event
     async def on_member_join(member):
+        # During a raid joins are only counted and go out as periodic summaries
+        config = await guild_configs.get(member.guild.id)
+        if raid_guard.record_join(member, config):
+            return
+
         embed = discord.Embed(title="Member Joined", description=f"{member.mention} has joined the server.", color=discord.Color.green())
         embed.set_thumbnail(url=member.avatar.url if member.avatar else member.default_avatar.url)
-        await log_event(member.guild, "join", embed)
+        await log_event(member.guild, "join", embed, user_id=member.id)
+
+    @tasks.loop(seconds=30)
+    async def post_raid_summaries():
+        for guild, aspect, embed in raid_guard.tick(bot):
+            await log_event(guild, aspect, embed)
+
+    @bot.listen("on_ready")
+    async def start_raid_summaries():
+        if not post_raid_summaries.is_running():
+            post_raid_summaries.start()
+
+    async def log_removal(guild, mention, user_id, record, note=None):
+        if record.action == discord.AuditLogAction.kick:
+            embed = discord.Embed(title="Member Kicked", description=f"{mention} was kicked from the server.", color=discord.Color.orange())
+            aspect = "kick"
+        else:
+            embed = discord.Embed(title="Member Banned", description=f"{mention} was banned from the server.", color=discord.Color.red())
+            aspect = "ban"
+        embed.add_field(name="Reason", value=record.reason if record.reason else "No reason provided")
+        if note:
+            embed.add_field(name="Note", value=note)
+        await log_event(guild, aspect, embed, user_id=user_id)
 
     @bot.event
     async def on_member_remove(member):
-        async for entry in member.guild.audit_logs(limit=1, action=discord.AuditLogAction.kick):
-            if entry.target.id == member.id:
-                embed = discord.Embed(title="Member Kicked", description=f"{member.mention} was kicked from the server.", color=discord.Color.orange())
-                embed.add_field(name="Reason", value=entry.reason if entry.reason else "No reason provided")
-                await log_event(member.guild, "kick", embed)
-                return
-
-        async for entry in member.guild.audit_logs(limit=1, action=discord.AuditLogAction.ban):
-            if entry.target.id == member.id:
-                embed = discord.Embed(title="Member Banned", description=f"{member.mention} was banned from the server.", color=discord.Color.red())
-                embed.add_field(name="Reason", value=entry.reason if entry.reason else "No reason provided")
-                await log_event(member.guild, "ban", embed)
-                return
+        if covered_by_summary(member.guild.id, member.id):
+            return
+        record = await audit_correlator.resolve(member.guild, member.id)
+        if record is not None:
+            await log_removal(member.guild, member.mention, member.id, record)
+            return
 
         embed = discord.Embed(title="Member Left", description=f"{member.mention} has left the server.", color=discord.Color.orange())
-        await log_event(member.guild, "leave", embed)
+        await log_event(member.guild, "leave", embed, user_id=member.id)
+
+    @bot.listen("on_member_removal_corrected")
+    async def log_corrected_removal(guild_id, user_id, record):
+        # The audit log entry turned up after the removal was already logged as a leave
+        guild = bot.get_guild(guild_id)
+        if guild is None or covered_by_summary(guild_id, user_id):
+            return
+        await log_removal(guild, f"<@{user_id}>", user_id, record, note="Logged as a leave before the audit log entry arrived.")
 
     @bot.event
     async def on_member_unban(guild, user):
         embed = discord.Embed(title="Member Unbanned", description=f"{user.mention} was unbanned from the server.", color=discord.Color.green())
-        await log_event(guild, "unban", embed)
+        await log_event(guild, "unban", embed, user_id=user.id)
+
+    async def stored_or_cached(message_id, cached_message):
+        # Content comes from the message store, which survives restarts and py-cord's
+        # cache limit, and otherwise from py-cord's cache
+        record = await message_store.get(message_id)
+        if record is not None:
+            return record.author_id, record.content
+        if cached_message is not None and not cached_message.author.bot:
+            return cached_message.author.id, cached_message.content
+        return None
 
     @bot.event
-    async def on_message_delete(message):
-        if message.author.bot:
+    async def on_raw_message_delete(payload):
+        guild = bot.get_guild(payload.guild_id) if payload.guild_id else None
+        if guild is None:
             return
+        found = await stored_or_cached(payload.message_id, payload.cached_message)
+        message_store.discard(payload.message_id)
+        if found is None:
+            return
+
+        author_id, content = found
+        embed = discord.Embed(title="Message Deleted", description=f"A message by <@{author_id}> was deleted in <#{payload.channel_id}>", color=discord.Color.red())
+        embed.add_field(name="Content", value=content[:1024] if content else "No text content")
+        await log_event(guild, "message_delete", embed, user_id=author_id)
 
-        embed = discord.Embed(title="Message Deleted", description=f"A message by {message.author.mention} was deleted in {message.channel.mention}", color=discord.Color.red())
-        embed.add_field(name="Content", value=message.content if message.content else "No text content")
-        await log_event(message.guild, "message_delete", embed)
+    @bot.event
+    async def on_raw_bulk_message_delete(payload):
+        guild = bot.get_guild(payload.guild_id) if payload.guild_id else None
+        if guild is None:
+            return
+        cached = {message.id: message for message in payload.cached_messages}
+        lines = []
+        for message_id in sorted(payload.message_ids):
+            found = await stored_or_cached(message_id, cached.get(message_id))
+            message_store.discard(message_id)
+            if found is not None:
+                author_id, content = found
+                lines.append(f"<@{author_id}>: {content[:200] if content else 'No text content'}")
+
+        embed = discord.Embed(title="Messages Bulk Deleted", description=f"{len(payload.message_ids)} messages were deleted in <#{payload.channel_id}>", color=discord.Color.red())
+        if lines:
+            shown = []
+            size = 0
+            for line in lines:
+                if size + len(line) + 1 > 1024:
+                    break
+                shown.append(line)
+                size += len(line) + 1
+            embed.add_field(name=f"Content ({len(shown)} of {len(lines)} known)", value="\n".join(shown), inline=False)
+        await log_event(guild, "message_delete", embed)
 
     @bot.event
-    async def on_message_edit(before, after):
-        if before.author.bot:
+    async def on_raw_message_edit(payload):
+        content = payload.data.get("content")
+        if content is None or payload.data.get("author", {}).get("bot") or not payload.data.get("guild_id"):
+            return
+        previous = await message_store.update(payload.message_id, content)
+        if previous is not None:
+            before_content = previous.content
+        elif payload.cached_message is not None:
+            before_content = payload.cached_message.content
+            message = payload.cached_message
+            message_store.add(message.id, message.guild.id, message.channel.id, message.author.id, content)
+        else:
             return
 
-        if before.content != after.content:
-            embed = discord.Embed(title="Message Edited", description=f"A message by {before.author.mention} was edited in {before.channel.mention}", color=discord.Color.blue())
-            embed.add_field(name="Before", value=before.content, inline=False)
-            embed.add_field(name="After", value=after.content, inline=False)
-            await log_event(before.guild, "message_edit", embed)
+        guild = bot.get_guild(int(payload.data["guild_id"]))
+        if guild and before_content != content:
+            author_id = payload.data["author"]["id"]
+            embed = discord.Embed(title="Message Edited", description=f"A message by <@{author_id}> was edited in <#{payload.channel_id}>", color=discord.Color.blue())
+            embed.add_field(name="Before", value=before_content[:1024] if before_content else "No text content", inline=False)
+            embed.add_field(name="After", value=content[:1024] if content else "No text content", inline=False)
+            await log_event(guild, "message_edit", embed, user_id=int(author_id))
 
     @bot.event
     async def on_guild_channel_create(channel):
@@ -177,16 +284,16 @@ def setup_logs(bot):
             embed = discord.Embed(title="Nickname Changed", description=f"{before.mention}'s nickname was changed.", color=discord.Color.blue())
             embed.add_field(name="Before", value=before.nick if before.nick else "No nickname", inline=False)
             embed.add_field(name="After", value=after.nick if after.nick else "No nickname", inline=False)
-            await log_event(after.guild, "nickname_change", embed)
+            await log_event(after.guild, "nickname_change", embed, user_id=after.id)
 
-        if before.communication_disabled_until == None and after.communication_disabled_until != None:
+        if before.communication_disabled_until == None and after.communication_disabled_until != None and not covered_by_summary(after.guild.id, after.id):
             embed = discord.Embed(title="Member Timeout", description=f"{before.mention} was timed out.", color=discord.Color.red())
             embed.add_field(name="Timeout Until", value=after.communication_disabled_until.strftime("%Y-%m-%d %H:%M:%S") if after.communication_disabled_until else "No timeout")
-            await log_event(after.guild, "member_timeout", embed)
+            await log_event(after.guild, "member_timeout", embed, user_id=after.id)
         
         if before.communication_disabled_until != None and after.communication_disabled_until == None:
             embed = discord.Embed(title="Member Untimeout", description=f"{before.mention} was untimed out.", color=discord.Color.green())
-            await log_event(after.guild, "member_untimeout", embed)
+            await log_event(after.guild, "member_untimeout", embed, user_id=after.id)
         
         if before.roles != after.roles:
             added_roles = set(after.roles) - set(before.roles)
@@ -195,12 +302,12 @@ def setup_logs(bot):
             if added_roles:
                 for role in added_roles:
                     embed = discord.Embed(title="Role Added", description=f"{after.mention} was given the role {role.mention}", color=discord.Color.green())
-                    await log_event(after.guild, "role_add", embed)
+                    await log_event(after.guild, "role_add", embed, user_id=after.id)
 
             if removed_roles:
                 for role in removed_roles:
                     embed = discord.Embed(title="Role Removed", description=f"{after.mention} was removed from the role {role.mention}", color=discord.Color.orange())
-                    await log_event(after.guild, "role_remove", embed)
+                    await log_event(after.guild, "role_remove", embed, user_id=after.id)
 
     @bot.event
     async def on_user_update(before, after):
@@ -208,9 +315,21 @@ def setup_logs(bot):
             embed = discord.Embed(title="User Updated", description=f"User {before.mention} updated their profile.", color=discord.Color.blue())
             embed.add_field(name="Before", value=f"{before.name}#{before.discriminator}", inline=False)
             embed.add_field(name="After", value=f"{after.name}#{after.discriminator}", inline=False)
-            for guild in bot.guilds:
-                if guild.get_member(after.id):
-                    await log_event(guild, "user_update", embed)
+            # Guilds whose config is cached and has user_update logging off are skipped
+            # outright; only uncached ones need a lookup, a few at a time
+            guilds = []
+            for guild_id in membership_index.guilds_of(after.id):
+                config = guild_configs.cached(guild_id)
+                if config is None or config.log_settings.get("user_update"):
+                    guild = bot.get_guild(guild_id)
+                    if guild:
+                        guilds.append(guild)
+
+            async def log_user_update(guild):
+                async with user_update_lookups:
+                    await log_event(guild, "user_update", embed, user_id=after.id)
+
+            await asyncio.gather(*(log_user_update(guild) for guild in guilds))
 
     @bot.event
     async def on_voice_state_update(member, before, after):
@@ -219,7 +338,7 @@ def setup_logs(bot):
                 embed = discord.Embed(title="Member Joined Voice Channel", description=f"{member.mention} joined {after.channel.name}", color=discord.Color.green())
             else:
                 embed = discord.Embed(title="Member Left Voice Channel", description=f"{member.mention} left {before.channel.name}", color=discord.Color.orange())
-            await log_event(member.guild, "voice_state_update", embed)
+            await log_event(member.guild, "voice_state_update", embed, user_id=member.id)
 
     @bot.event
     async def on_invite_create(invite):
@@ -227,7 +346,7 @@ def setup_logs(bot):
         embed.add_field(name="Code", value=invite.code)
         embed.add_field(name="Max Uses", value=invite.max_uses if invite.max_uses else "Unlimited")
         embed.add_field(name="Expires", value=invite.expires_at.strftime("%Y-%m-%d %H:%M:%S") if invite.expires_at else "Never")
-        await log_event(invite.guild, "invite_create", embed)
+        await log_event(invite.guild, "invite_create", embed, user_id=invite.inviter.id if invite.inviter else None)
 
     @bot.event
     async def on_invite_delete(invite):
@@ -252,9 +371,86 @@ def setup_logs(bot):
     @bot.slash_command(name="view_log_settings", description="View the log settings for the server")
     @commands.has_permissions(administrator=True)
     async def view_log_settings(ctx):
-        settings = execute_db_query("SELECT aspect, enabled FROM log_settings WHERE guild_id = ?", (ctx.guild.id,))
+        config = await guild_configs.get(ctx.guild.id)
+        settings = config.log_settings.items()
         embed = discord.Embed(title="Log Settings", color=discord.Color.blue())
         embed.description = ""
         for aspect, enabled in settings:
             embed.description += f"{aspect}: {'Enabled' if enabled else 'Disabled'}\n"
-        await ctx.respond(embed=embed)
\ No newline at end of file
+        await ctx.respond(embed=embed)
+
+    class LogSearchView(discord.ui.View):
+        def __init__(self, author_id, guild_id, user, aspect, since, events, has_more):
+            super().__init__(timeout=120)
+            self.author_id = author_id
+            self.guild_id = guild_id
+            self.user = user
+            self.aspect = aspect
+            self.since = since
+            self.events = events
+            self.has_more = has_more
+            # before_id cursor of every page seen so far, for going back
+            self.cursors = [None]
+            self.previous.disabled = True
+            self.next.disabled = not has_more
+
+        async def interaction_check(self, interaction):
+            return interaction.user.id == self.author_id
+
+        @discord.ui.button(label="Previous", style=discord.ButtonStyle.gray)
+        async def previous(self, button: discord.ui.Button, interaction: discord.Interaction):
+            self.cursors.pop()
+            await self.load_page(interaction, self.cursors[-1])
+
+        @discord.ui.button(label="Next", style=discord.ButtonStyle.gray)
+        async def next(self, button: discord.ui.Button, interaction: discord.Interaction):
+            self.cursors.append(self.events[-1].id)
+            await self.load_page(interaction, self.cursors[-1])
+
+        async def load_page(self, interaction, before_id):
+            self.events, self.has_more = await search_page(self.guild_id, self.user, self.aspect, self.since, before_id)
+            self.previous.disabled = len(self.cursors) == 1
+            self.next.disabled = not self.has_more
+            await interaction.response.edit_message(embed=create_search_embed(self.events, self.user, self.aspect, len(self.cursors)), view=self)
+
+    async def search_page(guild_id, user, aspect, since, before_id):
+        events = await event_archive.search(guild_id, user.id if user else None, aspect, since, before_id, limit=11)
+        return events[:10], len(events) > 10
+
+    def create_search_embed(events, user, aspect, page):
+        embed = discord.Embed(title="Log Search", color=discord.Color.blue())
+        filters = []
+        if user:
+            filters.append(f"User: {user.mention}")
+        if aspect:
+            filters.append(f"Aspect: {aspect}")
+        embed.description = " | ".join(filters) if filters else "All events"
+        if not events:
+            embed.description += "\nNo matching events found."
+        for event in events:
+            summary = event.embed.get("description") or ", ".join(field["name"] for field in event.embed.get("fields", [])) or "No details"
+            embed.add_field(
+                name=f"{event.embed.get('title', event.aspect)} ({event.aspect})",
+                value=f"<t:{int(event.created_at.timestamp())}:f> {summary}"[:1024],
+                inline=False
+            )
+        embed.set_footer(text=f"Page {page}")
+        return embed
+
+    @bot.slash_command(name="search_logs", description="Search the archived log events")
+    @commands.has_permissions(administrator=True)
+    async def search_logs(ctx,
+                          user: Option(discord.User, "Only events about this user", required=False),
+                          aspect: Option(str, "Only events of this log aspect", autocomplete=discord.utils.basic_autocomplete(log_aspects[:-1]), required=False),
+                          days: Option(int, "How many days back to search", required=False, default=7)):
+        # The archive holds deleted message content and moderation reasons
+        await ctx.defer(ephemeral=True)
+        if aspect and aspect not in log_aspects[:-1]:
+            embed = discord.Embed(title="Invalid Aspect", description="Please choose a valid log aspect.", color=discord.Color.red())
+            await ctx.respond(embed=embed)
+            return
+
+        since = discord.utils.utcnow() - timedelta(days=max(days, 1))
+        events, has_more = await search_page(ctx.guild.id, user, aspect, since, None)
+        view = LogSearchView(ctx.author.id, ctx.guild.id, user, aspect, since, events, has_more)
+        await ctx.respond(embed=create_search_embed(events, user, aspect, 1), view=view)
@@ -4,6 +4,7 @@ from discord.ext import commands
 import os
 from dotenv import load_dotenv
 from moderation import setup_moderation
+from mass_actions import setup_mass_actions
 from filter import setup_filter
 from logs import setup_logs
 from error_handlers import setup_error_handlers
@@ -12,6 +13,19 @@ from utilities import setup_utilities
 from notes import setup_notes
 from help_ import setup_help
 from verification import setup_verification
+from db_utils import db
+from migrations import run_migrations
+from guild_config import setup_guild_config
+from membership import setup_membership
+from audit_cache import setup_audit_cache
+from mod_routing import setup_mod_routing
+from assets import setup_assets
+from message_store import message_store, setup_message_store
+from log_archive import event_archive, setup_log_archive
+from raid import setup_raid
+from role_expiry import setup_role_expiry
+from stats import setup_stats
+from renderer import renderer
 
 load_dotenv()
 
@@ -33,7 +47,16 @@ async def ping(ctx):
     await ctx.respond(embed=embed)
 
 def setup(bot):
+    run_migrations()
+    setup_guild_config(bot)
+    setup_membership(bot)
+    setup_audit_cache(bot)
+    setup_mod_routing(bot)
+    setup_assets(bot)
+    setup_message_store(bot)
+    setup_log_archive(bot)
     setup_moderation(bot)
+    setup_mass_actions(bot)
     setup_filter(bot)
     setup_logs(bot)
     setup_error_handlers(bot)
@@ -42,7 +65,16 @@ def setup(bot):
     setup_notes(bot)
     setup_help(bot)
     setup_verification(bot)
+    setup_raid(bot)
+    setup_role_expiry(bot)
+    setup_stats(bot)
 
 setup(bot)
 
-bot.run(os.getenv('TOKEN'))
\ No newline at end of file
+try:
+    bot.run(os.getenv('TOKEN'))
+finally:
+    message_store.close()
+    event_archive.close()
+    renderer.close()
+    db.close()
\ No newline at end of file
@@ -0,0 +1,301 @@
+import asyncio
+import datetime
+import fnmatch
+import re
+import discord
+from discord.commands import Option, SlashCommandGroup
+from discord.ext import commands
+from logs import log_event, mass_action_targets
+
+BULK_BAN_LIMIT = 200
+MAX_TARGETS = 1000
+CONCURRENCY = 5
+RETRIES = 3
+PROGRESS_INTERVAL = 2.0
+# Gateway events for the targets can arrive a little after the REST calls return
+TARGET_GRACE = 60
+SAMPLE = 20
+
+
+class MassActionProgress:
+    __slots__ = ("total", "done", "failed")
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+
+    @property
+    def finished(self):
+        return self.done + self.failed
+
+
+def retry_after(error, attempt):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", 0)) or 2 ** attempt
+    except ValueError:
+        return 2 ** attempt
+
+
+async def run_limited(targets, action, progress, concurrency=CONCURRENCY):
+    # Runs action(target) for every target, a few at a time. py-cord already waits out
+    # rate limits it sees coming; a 429 or server error that still gets through is retried
+    # after the Retry-After the response asked for.
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(target):
+        async with semaphore:
+            for attempt in range(RETRIES):
+                try:
+                    await action(target)
+                    progress.done += 1
+                    return
+                except discord.HTTPException as e:
+                    if (e.status == 429 or e.status >= 500) and attempt < RETRIES - 1:
+                        await asyncio.sleep(retry_after(e, attempt))
+                        continue
+                    progress.failed += 1
+                    return
+
+    await asyncio.gather(*(run(target) for target in targets))
+
+
+async def run_bulk_ban(guild, targets, progress, reason, delete_message_seconds):
+    for i in range(0, len(targets), BULK_BAN_LIMIT):
+        chunk = targets[i:i + BULK_BAN_LIMIT]
+        try:
+            banned, failed = await guild.bulk_ban(*chunk, delete_message_seconds=delete_message_seconds, reason=reason)
+        except discord.Forbidden:
+            progress.failed += len(chunk)
+            continue
+        except discord.HTTPException as e:
+            # No bulk ban for this guild, or none of the chunk could be banned that way
+            print(f"Bulk ban of {len(chunk)} users in {guild.id} failed, banning one by one: {e}")
+            await run_limited(chunk, lambda target: guild.ban(target, delete_message_seconds=delete_message_seconds, reason=reason), progress)
+            continue
+        progress.done += len(banned)
+        progress.failed += len(chunk) - len(banned)
+
+
+def parse_ids(text):
+    return {int(match) for match in re.findall(r"\d{15,20}", text or "")}
+
+
+def can_act_on(ctx, member):
+    if member.id in (ctx.author.id, ctx.guild.owner_id, ctx.guild.me.id):
+        return False
+    if ctx.author.id != ctx.guild.owner_id and member.top_role >= ctx.author.top_role:
+        return False
+    return member.top_role < ctx.guild.me.top_role
+
+
+def select_targets(ctx, ids, joined_within, account_age, name_pattern, include_non_members):
+    # Members matching every given criterion. Ids of users who aren't members can only be
+    # banned, and only when the ids are the sole criterion.
+    now = discord.utils.utcnow()
+    wanted = parse_ids(ids) if ids else None
+    joined_after = now - datetime.timedelta(minutes=joined_within) if joined_within else None
+    created_after = now - datetime.timedelta(days=account_age) if account_age else None
+    pattern = re.compile(fnmatch.translate(name_pattern.lower())) if name_pattern else None
+
+    targets = []
+    skipped = 0
+    for member in ctx.guild.members:
+        if wanted is not None and member.id not in wanted:
+            continue
+        if joined_after and (member.joined_at is None or member.joined_at < joined_after):
+            continue
+        if created_after and member.created_at < created_after:
+            continue
+        if pattern and not (pattern.match(member.name.lower()) or pattern.match(member.display_name.lower())):
+            continue
+        if can_act_on(ctx, member):
+            targets.append(member)
+        else:
+            skipped += 1
+
+    if include_non_members and wanted and not (joined_after or created_after or pattern):
+        members = {member.id for member in ctx.guild.members}
+        targets.extend(discord.Object(user_id) for user_id in sorted(wanted - members))
+    return targets, skipped
+
+
+def describe_selection(ids, joined_within, account_age, name_pattern):
+    criteria = []
+    if ids:
+        criteria.append(f"{len(parse_ids(ids))} listed ids")
+    if joined_within:
+        criteria.append(f"joined in the last {joined_within} minutes")
+    if account_age:
+        criteria.append(f"accounts younger than {account_age} days")
+    if name_pattern:
+        criteria.append(f"names matching `{name_pattern}`")
+    return ", ".join(criteria)
+
+
+def sample_mentions(targets):
+    shown = ", ".join(f"<@{target.id}>" for target in targets[:SAMPLE])
+    if len(targets) > SAMPLE:
+        shown += f" and {len(targets) - SAMPLE} more"
+    return shown[:1024]
+
+
+def setup_mass_actions(bot):
+    ACTIONS = {
+        "ban": {"title": "Mass Ban", "verb": "banned", "aspect": "ban", "color": discord.Color.red()},
+        "kick": {"title": "Mass Kick", "verb": "kicked", "aspect": "kick", "color": discord.Color.orange()},
+        "timeout": {"title": "Mass Timeout", "verb": "timed out", "aspect": "member_timeout", "color": discord.Color.orange()},
+    }
+
+    class MassActionView(discord.ui.View):
+        def __init__(self, ctx, action, targets, skipped, selection, reason, run):
+            super().__init__(timeout=60)
+            self.ctx = ctx
+            self.action = action
+            self.targets = targets
+            self.skipped = skipped
+            self.selection = selection
+            self.reason = reason
+            self.run = run
+
+        async def interaction_check(self, interaction):
+            return interaction.user.id == self.ctx.author.id
+
+        @discord.ui.button(label="Confirm", style=discord.ButtonStyle.danger)
+        async def confirm(self, button: discord.ui.Button, interaction: discord.Interaction):
+            self.stop()
+            progress = MassActionProgress(len(self.targets))
+            await interaction.response.edit_message(embed=progress_embed(self.action, progress), view=None)
+            await execute(self.ctx, self.action, self.targets, self.skipped, self.selection, self.reason, self.run, progress, interaction)
+
+        @discord.ui.button(label="Cancel", style=discord.ButtonStyle.gray)
+        async def cancel(self, button: discord.ui.Button, interaction: discord.Interaction):
+            self.stop()
+            embed = discord.Embed(title=ACTIONS[self.action]["title"], description="Cancelled.", color=discord.Color.blue())
+            await interaction.response.edit_message(embed=embed, view=None)
+
+    def progress_embed(action, progress):
+        info = ACTIONS[action]
+        embed = discord.Embed(title=info["title"], description=f"Working... {progress.finished}/{progress.total}", color=info["color"])
+        embed.add_field(name="Done", value=progress.done)
+        embed.add_field(name="Failed", value=progress.failed)
+        return embed
+
+    async def execute(ctx, action, targets, skipped, selection, reason, run, progress, interaction):
+        guild = ctx.guild
+        ids = {target.id for target in targets}
+        mass_action_targets.setdefault(guild.id, set()).update(ids)
+
+        async def report_progress():
+            # One message edited every few seconds rather than a message per target
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                try:
+                    await interaction.edit_original_response(embed=progress_embed(action, progress))
+                except discord.HTTPException:
+                    pass
+
+        reporter = asyncio.ensure_future(report_progress())
+        try:
+            await run(targets, progress)
+        finally:
+            reporter.cancel()
+            asyncio.get_running_loop().call_later(TARGET_GRACE, release_targets, guild.id, ids)
+
+        info = ACTIONS[action]
+        embed = discord.Embed(title=info["title"], description=f"{progress.done} members {info['verb']}, {progress.failed} failed, {skipped} skipped.", color=info["color"])
+        embed.add_field(name="Moderator", value=ctx.author.mention, inline=False)
+        embed.add_field(name="Selection", value=selection, inline=False)
+        embed.add_field(name="Reason", value=reason, inline=False)
+        embed.add_field(name="Targets", value=sample_mentions(targets), inline=False)
+        try:
+            await interaction.edit_original_response(embed=embed)
+        except discord.HTTPException:
+            pass
+        await log_event(guild, info["aspect"], embed, user_id=ctx.author.id)
+
+    def release_targets(guild_id, ids):
+        covered = mass_action_targets.get(guild_id)
+        if covered is not None:
+            covered.difference_update(ids)
+            if not covered:
+                del mass_action_targets[guild_id]
+
+    async def prepare(ctx, action, ids, joined_within, account_age, name_pattern, reason, run):
+        # Checked before deferring, since only the first response can be ephemeral
+        if not (ids or joined_within or account_age or name_pattern):
+            await ctx.respond("Give at least one of ids, joined_within, account_age or name_pattern to select members.", ephemeral=True)
+            return
+        await ctx.defer()
+        reason = reason or "No reason provided"
+        selection = describe_selection(ids, joined_within, account_age, name_pattern)
+        targets, skipped = select_targets(ctx, ids, joined_within, account_age, name_pattern, action == "ban")
+
+        info = ACTIONS[action]
+        if not targets:
+            embed = discord.Embed(title=info["title"], description=f"No members match: {selection}.", color=discord.Color.blue())
+            if skipped:
+                embed.description += f" {skipped} matching members are above you or the bot and were skipped."
+            await ctx.respond(embed=embed)
+            return
+        if len(targets) > MAX_TARGETS:
+            embed = discord.Embed(title=info["title"], description=f"{len(targets)} members match, more than the limit of {MAX_TARGETS}. Narrow the selection.", color=discord.Color.red())
+            await ctx.respond(embed=embed)
+            return
+
+        embed = discord.Embed(title=info["title"], description=f"{len(targets)} members will be {info['verb']}. Confirm within 60 seconds.", color=info["color"])
+        embed.add_field(name="Selection", value=selection, inline=False)
+        embed.add_field(name="Reason", value=reason, inline=False)
+        embed.add_field(name="Targets", value=sample_mentions(targets), inline=False)
+        if skipped:
+            embed.add_field(name="Skipped", value=f"{skipped} members above you or the bot", inline=False)
+        await ctx.respond(embed=embed, view=MassActionView(ctx, action, targets, skipped, selection, reason, run))
+
+    mass = SlashCommandGroup("mass", "Moderate many members at once")
+
+    @mass.command(name="ban", description="Ban every member matching the selection")
+    @commands.has_permissions(ban_members=True)
+    async def mass_ban(ctx,
+                       ids: Option(str, "User ids or mentions, separated by spaces", required=False),
+                       joined_within: Option(int, "Only members who joined within this many minutes", min_value=1, required=False),
+                       account_age: Option(int, "Only accounts younger than this many days", min_value=1, required=False),
+                       name_pattern: Option(str, "Only names matching this pattern, * and ? as wildcards", required=False),
+                       delete_days: Option(int, "Days of their messages to delete", min_value=0, max_value=7, default=0),
+                       reason: Option(str, "Reason for the bans", required=False)):
+        async def run(targets, progress):
+            await run_bulk_ban(ctx.guild, targets, progress, f"{reason or 'Mass ban'} (by {ctx.author})", delete_days * 86400)
+
+        await prepare(ctx, "ban", ids, joined_within, account_age, name_pattern, reason, run)
+
+    @mass.command(name="kick", description="Kick every member matching the selection")
+    @commands.has_permissions(kick_members=True)
+    async def mass_kick(ctx,
+                        ids: Option(str, "User ids or mentions, separated by spaces", required=False),
+                        joined_within: Option(int, "Only members who joined within this many minutes", min_value=1, required=False),
+                        account_age: Option(int, "Only accounts younger than this many days", min_value=1, required=False),
+                        name_pattern: Option(str, "Only names matching this pattern, * and ? as wildcards", required=False),
+                        reason: Option(str, "Reason for the kicks", required=False)):
+        async def run(targets, progress):
+            audit_reason = f"{reason or 'Mass kick'} (by {ctx.author})"
+            await run_limited(targets, lambda member: member.kick(reason=audit_reason), progress)
+
+        await prepare(ctx, "kick", ids, joined_within, account_age, name_pattern, reason, run)
+
+    @mass.command(name="timeout", description="Time out every member matching the selection")
+    @commands.has_permissions(moderate_members=True)
+    async def mass_timeout(ctx,
+                           duration: Option(int, "Duration in minutes", min_value=1, max_value=40320),
+                           ids: Option(str, "User ids or mentions, separated by spaces", required=False),
+                           joined_within: Option(int, "Only members who joined within this many minutes", min_value=1, required=False),
+                           account_age: Option(int, "Only accounts younger than this many days", min_value=1, required=False),
+                           name_pattern: Option(str, "Only names matching this pattern, * and ? as wildcards", required=False),
+                           reason: Option(str, "Reason for the timeouts", required=False)):
+        async def run(targets, progress):
+            audit_reason = f"{reason or 'Mass timeout'} (by {ctx.author})"
+            await run_limited(targets, lambda member: member.timeout_for(duration=datetime.timedelta(minutes=duration), reason=audit_reason), progress)
+
+        await prepare(ctx, "timeout", ids, joined_within, account_age, name_pattern, reason, run)
+
+    bot.add_application_command(mass)
@@ -0,0 +1,75 @@
+class MembershipIndex:
+    # user id -> ids of the guilds the bot shares with them. Most users share a single
+    # guild with the bot, so that case is stored as a bare int and only users seen in
+    # several guilds get a set.
+    def __init__(self):
+        self._guilds = {}
+
+    def __len__(self):
+        return len(self._guilds)
+
+    def add(self, user_id, guild_id):
+        current = self._guilds.get(user_id)
+        if current is None:
+            self._guilds[user_id] = guild_id
+        elif isinstance(current, set):
+            current.add(guild_id)
+        elif current != guild_id:
+            self._guilds[user_id] = {current, guild_id}
+
+    def remove(self, user_id, guild_id):
+        current = self._guilds.get(user_id)
+        if current is None:
+            return
+        if isinstance(current, set):
+            current.discard(guild_id)
+            if len(current) == 1:
+                self._guilds[user_id] = next(iter(current))
+        elif current == guild_id:
+            del self._guilds[user_id]
+
+    def add_guild(self, guild):
+        for member in guild.members:
+            self.add(member.id, guild.id)
+
+    def remove_guild(self, guild):
+        for member in guild.members:
+            self.remove(member.id, guild.id)
+
+    def guilds_of(self, user_id):
+        current = self._guilds.get(user_id)
+        if current is None:
+            return ()
+        if isinstance(current, set):
+            return tuple(current)
+        return (current,)
+
+
+membership_index = MembershipIndex()
+
+
+def setup_membership(bot):
+    @bot.listen("on_ready")
+    async def index_members():
+        for guild in bot.guilds:
+            membership_index.add_guild(guild)
+
+    @bot.listen("on_guild_join")
+    async def index_joined_guild(guild):
+        membership_index.add_guild(guild)
+
+    @bot.listen("on_guild_available")
+    async def index_available_guild(guild):
+        membership_index.add_guild(guild)
+
+    @bot.listen("on_guild_remove")
+    async def drop_guild_members(guild):
+        membership_index.remove_guild(guild)
+
+    @bot.listen("on_member_join")
+    async def index_member(member):
+        membership_index.add(member.id, member.guild.id)
+
+    @bot.listen("on_member_remove")
+    async def drop_member(member):
+        membership_index.remove(member.id, member.guild.id)
@@ -0,0 +1,371 @@
+import asyncio
+import datetime
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import discord
+from discord.ext import tasks
+
+# message id, guild id, channel id, author id, content length
+HEADER = struct.Struct('<QQQQI')
+# Rough memory cost of one message in a segment index: a dict entry with its int key and
+# value while the segment is active, two array items once it's sealed
+ACTIVE_INDEX_BYTES = 100
+SEALED_INDEX_BYTES = 16
+WRITE_CHUNK = 256 * 1024
+
+
+class StoredMessage:
+    __slots__ = ("id", "guild_id", "channel_id", "author_id", "content")
+
+    def __init__(self, id, guild_id, channel_id, author_id, content):
+        self.id = id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.content = content
+
+    @property
+    def created_at(self):
+        return discord.utils.snowflake_time(self.id)
+
+
+def _decode(data, offset):
+    message_id, guild_id, channel_id, author_id, length = HEADER.unpack_from(data, offset)
+    start = offset + HEADER.size
+    return StoredMessage(message_id, guild_id, channel_id, author_id, bytes(data[start:start + length]).decode('utf-8'))
+
+
+class _Segment:
+    # One append-only file of records. The active segment indexes offsets in a dict;
+    # sealed ones keep two sorted arrays and are searched by bisection. New records wait
+    # in pending, which holds the bytes from written up to size, until the writer thread
+    # appends them to the file.
+    def __init__(self, path, number):
+        self.path = path
+        self.number = number
+        self.created = time.time()
+        self.size = 0
+        self.written = 0
+        self.pending = bytearray()
+        self.offsets = {}
+        self.ids = None
+        self.positions = None
+        self.min_id = None
+        self.max_id = None
+
+    @property
+    def index_bytes(self):
+        offsets = self.offsets
+        if offsets is not None:
+            return len(offsets) * ACTIVE_INDEX_BYTES
+        return len(self.ids) * SEALED_INDEX_BYTES
+
+    def note(self, message_id, offset):
+        # Returns whether the message is new to the segment
+        new = message_id not in self.offsets
+        self.offsets[message_id] = offset
+        if self.min_id is None or message_id < self.min_id:
+            self.min_id = message_id
+        if self.max_id is None or message_id > self.max_id:
+            self.max_id = message_id
+        return new
+
+    def take_pending(self):
+        data = self.pending
+        self.pending = bytearray()
+        self.written = self.size
+        return data
+
+    def seal(self):
+        # Runs on the writer thread; find() keeps using the dict until the arrays are set.
+        # A message edited within the segment keeps only its newest offset
+        ordered = sorted(self.offsets.items())
+        self.ids = array('Q', (message_id for message_id, _ in ordered))
+        self.positions = array('Q', (offset for _, offset in ordered))
+        self.offsets = None
+
+    def find(self, message_id):
+        if self.min_id is None or not self.min_id <= message_id <= self.max_id:
+            return None
+        offsets = self.offsets
+        if offsets is not None:
+            return offsets.get(message_id)
+        i = bisect_left(self.ids, message_id)
+        if i < len(self.ids) and self.ids[i] == message_id:
+            return self.positions[i]
+        return None
+
+
+class MessageStore:
+    # Recent message content for delete and edit logs. The newest messages stay in an
+    # in-memory LRU; every message is also appended to segment files on disk, which are
+    # rotated at segment_size, or once an eighth of ttl old, and deleted once they are
+    # older than ttl or the store is over disk_budget. The segment indexes count against
+    # memory_budget too: they may take half of it, and the LRU gets what they leave. All
+    # file work happens on one writer thread, in the order it was handed over.
+    def __init__(self, directory='message_store', ttl=7 * 86400, memory_budget=32 * 1024 * 1024,
+                 segment_size=16 * 1024 * 1024, disk_budget=1024 * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.memory_budget = memory_budget
+        self.segment_size = segment_size
+        self.disk_budget = disk_budget
+        self._recent = OrderedDict()
+        self._memory = 0
+        self._index_memory = 0
+        self._segments = []
+        self._io = None
+        self._files = {}
+        self._readers = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def open(self):
+        if self._io is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="message_store")
+        self._segments = []
+        numbers = sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith('.seg') and name[:-4].isdigit())
+        for number in numbers:
+            segment = _Segment(os.path.join(self.directory, f"{number:08d}.seg"), number)
+            self._recover(segment)
+            segment.seal()
+            self._segments.append(segment)
+        self._new_segment()
+        self._expire()
+
+    def _recover(self, segment):
+        # Rebuilds a segment's index from its records, cutting off a torn final record
+        with open(segment.path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + HEADER.size <= len(data):
+            message_id, _, _, _, length = HEADER.unpack_from(data, offset)
+            if offset + HEADER.size + length > len(data):
+                break
+            segment.note(message_id, offset)
+            offset += HEADER.size + length
+        if offset < len(data):
+            with open(segment.path, 'r+b') as f:
+                f.truncate(offset)
+        segment.size = segment.written = offset
+
+    def _new_segment(self):
+        number = self._segments[-1].number + 1 if self._segments else 1
+        self._segments.append(_Segment(os.path.join(self.directory, f"{number:08d}.seg"), number))
+
+    # Writer thread
+
+    def _write(self, segment, data):
+        file = self._files.get(segment.number)
+        if file is None:
+            file = self._files[segment.number] = open(segment.path, 'ab', buffering=0)
+        file.write(data)
+
+    def _finish(self, segment, data):
+        self._write(segment, data)
+        self._files.pop(segment.number).close()
+        segment.seal()
+
+    def _remove(self, segment):
+        for files in (self._files, self._readers):
+            file = files.pop(segment.number, None)
+            if file is not None:
+                file.close()
+        try:
+            os.remove(segment.path)
+        except FileNotFoundError:
+            pass
+
+    def _read(self, segment, offset):
+        try:
+            reader = self._readers.get(segment.number)
+            if reader is None:
+                reader = self._readers[segment.number] = open(segment.path, 'rb')
+            reader.seek(offset)
+            header = reader.read(HEADER.size)
+            return _decode(header + reader.read(HEADER.unpack(header)[-1]), 0)
+        except (OSError, struct.error):
+            # The segment expired while the read was queued
+            return None
+
+    def _close_files(self):
+        for files in (self._files, self._readers):
+            for file in files.values():
+                file.close()
+            files.clear()
+
+    # Event loop
+
+    def _cutoff_id(self):
+        return discord.utils.time_snowflake(datetime.datetime.fromtimestamp(time.time() - self.ttl, datetime.timezone.utc))
+
+    def _rotate(self):
+        segment = self._segments[-1]
+        self._io.submit(self._finish, segment, segment.take_pending())
+        self._new_segment()
+        self._expire()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        total = sum(segment.size for segment in self._segments)
+        index = sum(segment.index_bytes for segment in self._segments)
+        while len(self._segments) > 1:
+            oldest = self._segments[0]
+            expired = oldest.max_id is None or discord.utils.snowflake_time(oldest.max_id).timestamp() < cutoff
+            if not expired and total <= self.disk_budget and index <= self.memory_budget // 2:
+                break
+            self._segments.pop(0)
+            total -= oldest.size
+            index -= oldest.index_bytes
+            self._io.submit(self._remove, oldest)
+        self._index_memory = index
+        self._trim_recent()
+
+    def _trim_recent(self):
+        while self._recent and self._memory + self._index_memory > self.memory_budget:
+            _, evicted = self._recent.popitem(last=False)
+            self._memory -= len(evicted.content) + 100
+
+    def _remember(self, record):
+        previous = self._recent.pop(record.id, None)
+        if previous is not None:
+            self._memory -= len(previous.content) + 100
+        self._recent[record.id] = record
+        self._memory += len(record.content) + 100
+        self._trim_recent()
+
+    def add(self, message_id, guild_id, channel_id, author_id, content):
+        if self._io is None:
+            self.open()
+        record = StoredMessage(message_id, guild_id, channel_id, author_id, content)
+        if message_id < self._cutoff_id():
+            return record
+        self._remember(record)
+        encoded = content.encode('utf-8')
+        segment = self._segments[-1]
+        offset = segment.size
+        segment.pending += HEADER.pack(message_id, guild_id, channel_id, author_id, len(encoded))
+        segment.pending += encoded
+        segment.size += HEADER.size + len(encoded)
+        if segment.note(message_id, offset):
+            self._index_memory += ACTIVE_INDEX_BYTES
+        if segment.size >= self.segment_size or segment.index_bytes >= self.memory_budget // 4:
+            self._rotate()
+        elif len(segment.pending) >= WRITE_CHUNK:
+            self._io.submit(self._write, segment, segment.take_pending())
+        return record
+
+    def add_message(self, message):
+        return self.add(message.id, message.guild.id, message.channel.id, message.author.id, message.content)
+
+    async def _load(self, segment, offset):
+        if offset >= segment.written:
+            return _decode(segment.pending, offset - segment.written)
+        return await asyncio.get_running_loop().run_in_executor(self._io, self._read, segment, offset)
+
+    async def get(self, message_id):
+        if message_id < self._cutoff_id():
+            self.expired += 1
+            return None
+        record = self._recent.get(message_id)
+        if record is not None:
+            self.memory_hits += 1
+            return record
+        for segment in reversed(self._segments):
+            offset = segment.find(message_id)
+            if offset is not None:
+                record = await self._load(segment, offset)
+                if record is not None:
+                    self.disk_hits += 1
+                    return record
+                break
+        self.misses += 1
+        return None
+
+    async def update(self, message_id, content):
+        # Returns the stored message as it was before the edit
+        previous = await self.get(message_id)
+        if previous is not None:
+            self.add(message_id, previous.guild_id, previous.channel_id, previous.author_id, content)
+        return previous
+
+    def discard(self, message_id):
+        # Deleted messages leave memory; their disk records expire with the segment
+        record = self._recent.pop(message_id, None)
+        if record is not None:
+            self._memory -= len(record.content) + 100
+
+    def flush(self):
+        if self._io is not None and self._segments[-1].pending:
+            segment = self._segments[-1]
+            self._io.submit(self._write, segment, segment.take_pending())
+
+    def maintain(self):
+        # Hands buffered records to the writer and enforces ttl even when the active
+        # segment is filling slowly
+        if self._io is None:
+            return
+        segment = self._segments[-1]
+        if segment.size and time.time() - segment.created >= self.ttl / 8:
+            self._rotate()
+        else:
+            self.flush()
+            self._expire()
+        cutoff_id = self._cutoff_id()
+        while self._recent:
+            message_id = next(iter(self._recent))
+            if message_id >= cutoff_id:
+                break
+            self.discard(message_id)
+
+    def close(self):
+        if self._io is None:
+            return
+        self.flush()
+        self._io.submit(self._close_files)
+        self._io.shutdown(wait=True)
+        self._io = None
+
+    def stats(self):
+        return {
+            "memory_messages": len(self._recent),
+            "memory_bytes": self._memory,
+            "index_bytes": self._index_memory,
+            "segments": len(self._segments),
+            "disk_bytes": sum(segment.size for segment in self._segments),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+        }
+
+
+message_store = MessageStore()
+
+
+def setup_message_store(bot):
+    message_store.open()
+
+    @tasks.loop(seconds=5)
+    async def maintain_message_store():
+        message_store.maintain()
+
+    @bot.listen("on_ready")
+    async def start_message_store_maintenance():
+        if not maintain_message_store.is_running():
+            maintain_message_store.start()
+
+    @bot.listen("on_message")
+    async def store_message(message):
+        if message.author.bot or message.guild is None:
+            return
+        message_store.add_message(message)
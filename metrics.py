@@ -0,0 +1,154 @@
+import functools
+import re
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds, Prometheus style (each bucket counts values <= its bound)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        # Database timings are observed from the worker threads
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(BUCKETS, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+    @property
+    def average(self):
+        return self.sum / self.count if self.count else 0.0
+
+
+class Metrics:
+    # Process-wide registry. Histograms and counters are keyed by name and a sorted
+    # label tuple; gauges are callbacks evaluated only when metrics are read, so queue
+    # depths and cache stats cost nothing on the hot path.
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._gauges = []
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def register_gauges(self, fn):
+        # fn returns (name, labels dict, value) triples
+        self._gauges.append(fn)
+
+    def gauges(self):
+        for fn in self._gauges:
+            yield from fn()
+
+    def collect(self, name):
+        # (labels dict, histogram) pairs of one histogram family
+        return [(dict(labels), histogram) for (family, labels), histogram in list(self.histograms.items()) if family == name]
+
+    def counter_values(self, name):
+        return [(dict(labels), value) for (family, labels), value in list(self.counters.items()) if family == name]
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        families = {}
+        for (name, labels), histogram in list(self.histograms.items()):
+            families.setdefault(name, []).append((labels, histogram))
+        for name, series in sorted(families.items()):
+            lines.append(f"# TYPE peacekeeper_{name} histogram")
+            for labels, histogram in series:
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f"peacekeeper_{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"peacekeeper_{name}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"peacekeeper_{name}_count{_labels(labels)} {histogram.count}")
+
+        counters = {}
+        for (name, labels), value in list(self.counters.items()):
+            counters.setdefault(name, []).append((labels, value))
+        for name, series in sorted(counters.items()):
+            lines.append(f"# TYPE peacekeeper_{name} counter")
+            for labels, value in series:
+                lines.append(f"peacekeeper_{name}{_labels(labels)} {value}")
+
+        gauges = {}
+        for name, labels, value in self.gauges():
+            gauges.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+        for name, series in sorted(gauges.items()):
+            lines.append(f"# TYPE peacekeeper_{name} gauge")
+            for labels, value in series:
+                lines.append(f"peacekeeper_{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_QUERY_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE|EXISTS)\s+(\w+)', re.I)
+
+
+@functools.lru_cache(maxsize=512)
+def query_label(query):
+    # "SELECT warnings" style label; monthly archive segments share one label
+    words = query.split(None, 1)
+    verb = words[0].upper() if words else "?"
+    match = _QUERY_TABLE.search(query)
+    table = re.sub(r'_\d{6}$', '', match.group(1)) if match else ""
+    return f"{verb} {table}".strip()
+
+
+def timed_event(name, handler):
+    histogram = metrics.histogram("event_seconds", event=name)
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await handler(*args, **kwargs)
+        except Exception:
+            metrics.increment("event_errors_total", event=name)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+metrics = Metrics()
@@ -0,0 +1,102 @@
+import datetime
+from db_utils import db
+
+
+def _baseline(conn):
+    # The schema as the cogs used to create it on start-up
+    conn.execute('''CREATE TABLE IF NOT EXISTS filter
+                 (guild_id INTEGER, word TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS block_filter
+                 (guild_id INTEGER, block_type TEXT, is_blocked INTEGER)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS automod_settings
+                 (guild_id INTEGER, setting TEXT, value INTEGER)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS log_channels
+                 (guild_id INTEGER, channel_id INTEGER)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS log_settings
+                 (guild_id INTEGER, aspect TEXT, enabled INTEGER)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS temporary_roles
+                 (guild_id INTEGER, user_id INTEGER, role_id INTEGER, expiry_time TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS max_messages
+                 (guild_id INTEGER, max_messages INTEGER)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS user_notes
+                 (guild_id INTEGER, user_id INTEGER, moderator_id INTEGER, note TEXT, timestamp TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS verification_messages
+                 (guild_id INTEGER, channel_id INTEGER, message_id INTEGER, role_id INTEGER)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS warnings
+                 (guild_id INTEGER, user_id INTEGER, moderator_id INTEGER, reason TEXT, timestamp TEXT, message_id INTEGER)''')
+
+
+def _rebuild(conn, table, definition):
+    # Copy rows oldest first with INSERT OR REPLACE so the newest row for each key survives
+    conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    conn.execute(f"CREATE TABLE {table} ({definition})")
+    conn.execute(f"INSERT OR REPLACE INTO {table} SELECT * FROM {table}_old ORDER BY rowid")
+    conn.execute(f"DROP TABLE {table}_old")
+
+
+def _keys_and_indexes(conn):
+    _rebuild(conn, "filter", "guild_id INTEGER, word TEXT, PRIMARY KEY (guild_id, word)")
+    _rebuild(conn, "block_filter", "guild_id INTEGER, block_type TEXT, is_blocked INTEGER, PRIMARY KEY (guild_id, block_type)")
+    _rebuild(conn, "automod_settings", "guild_id INTEGER, setting TEXT, value INTEGER, PRIMARY KEY (guild_id, setting)")
+    _rebuild(conn, "log_channels", "guild_id INTEGER PRIMARY KEY, channel_id INTEGER")
+    _rebuild(conn, "log_settings", "guild_id INTEGER, aspect TEXT, enabled INTEGER, PRIMARY KEY (guild_id, aspect)")
+    _rebuild(conn, "max_messages", "guild_id INTEGER PRIMARY KEY, max_messages INTEGER")
+    _rebuild(conn, "verification_messages", "guild_id INTEGER PRIMARY KEY, channel_id INTEGER, message_id INTEGER, role_id INTEGER")
+
+    # Nothing ever created this table, but set_mod_channel and sendToModChannel rely on it
+    conn.execute('''CREATE TABLE IF NOT EXISTS mod_channels
+                 (guild_id INTEGER PRIMARY KEY, channel_id INTEGER)''')
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_warnings_guild_user ON warnings (guild_id, user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_notes_guild_user ON user_notes (guild_id, user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_temporary_roles_expiry ON temporary_roles (expiry_time)")
+
+
+def _channel_max_messages(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS channel_max_messages
+                 (guild_id INTEGER, channel_id INTEGER PRIMARY KEY, max_messages INTEGER)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_channel_max_messages_guild ON channel_max_messages (guild_id)")
+
+
+def _temporary_role_schedule(conn):
+    # Expiry times become unix timestamps (the ISO strings were naive local time) and each
+    # row gets an id and a count of failed removal attempts for the expiry scheduler
+    rows = conn.execute("SELECT guild_id, user_id, role_id, expiry_time FROM temporary_roles ORDER BY rowid").fetchall()
+    conn.execute("DROP TABLE temporary_roles")
+    conn.execute('''CREATE TABLE temporary_roles
+                 (id INTEGER PRIMARY KEY, guild_id INTEGER, user_id INTEGER, role_id INTEGER, expires_at REAL, attempts INTEGER NOT NULL DEFAULT 0)''')
+    conn.executemany("INSERT INTO temporary_roles (guild_id, user_id, role_id, expires_at) VALUES (?, ?, ?, ?)",
+                     [(guild_id, user_id, role_id, datetime.datetime.fromisoformat(expiry_time).timestamp()) for guild_id, user_id, role_id, expiry_time in rows])
+    conn.execute("CREATE INDEX idx_temporary_roles_expiry ON temporary_roles (expires_at)")
+
+
+MIGRATIONS = [
+    (1, _baseline),
+    (2, _keys_and_indexes),
+    (3, _channel_max_messages),
+    (4, _temporary_role_schedule),
+]
+
+
+def _migrate(conn):
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    applied = []
+    for version, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        applied.append(version)
+    return applied
+
+
+def run_migrations():
+    applied = db.run_sync(_migrate)
+    if applied:
+        print(f"Applied database migrations: {', '.join(map(str, applied))}")
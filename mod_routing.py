@@ -0,0 +1,100 @@
+from db_utils import db
+
+PING_PERMISSION = "kick_members"
+
+
+def mod_roles(guild, permission=PING_PERMISSION):
+    return [role for role in guild.roles if role.permissions.administrator or getattr(role.permissions, permission)]
+
+
+class ModRoute:
+    __slots__ = ("channel_id", "channel", "pings")
+
+    def __init__(self, channel_id, channel):
+        self.channel_id = channel_id
+        self.channel = channel
+        self.pings = None
+
+
+class ModRoutingCache:
+    # Where moderator alerts go in each guild: the mod channel, resolved from the gateway
+    # cache, and the mentions of every role that can kick members. The channel is looked
+    # up once per guild and the mentions are rebuilt only after roles change, so alerts
+    # cost no REST calls and no walk over the guild's roles.
+    def __init__(self):
+        self._routes = {}
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    async def get(self, guild):
+        route = self._routes.get(guild.id)
+        if route is None:
+            self.misses += 1
+            row = await db.fetchone("SELECT channel_id FROM mod_channels WHERE guild_id = ?", (guild.id,))
+            channel_id = row[0] if row else None
+            # set_channel may have run while the row was being read, and wins if so
+            route = self._routes.setdefault(guild.id, ModRoute(channel_id, guild.get_channel(channel_id) if channel_id else None))
+        else:
+            self.hits += 1
+        if route.pings is None:
+            self.rebuilds += 1
+            route.pings = " ".join(role.mention for role in mod_roles(guild))
+        return route
+
+    def set_channel(self, guild_id, channel):
+        route = self._routes.get(guild_id)
+        if route is None:
+            self._routes[guild_id] = ModRoute(channel.id, channel)
+        else:
+            route.channel_id = channel.id
+            route.channel = channel
+
+    def channel_deleted(self, guild_id, channel_id):
+        route = self._routes.get(guild_id)
+        if route and route.channel_id == channel_id:
+            route.channel = None
+
+    def roles_changed(self, guild_id):
+        route = self._routes.get(guild_id)
+        if route:
+            route.pings = None
+
+    def invalidate(self, guild_id):
+        self._routes.pop(guild_id, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "guilds": len(self._routes),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rebuilds": self.rebuilds,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+mod_routing = ModRoutingCache()
+
+
+def setup_mod_routing(bot):
+    @bot.listen("on_guild_role_create")
+    async def mod_routing_role_created(role):
+        mod_routing.roles_changed(role.guild.id)
+
+    @bot.listen("on_guild_role_delete")
+    async def mod_routing_role_deleted(role):
+        mod_routing.roles_changed(role.guild.id)
+
+    @bot.listen("on_guild_role_update")
+    async def mod_routing_role_updated(before, after):
+        if before.permissions != after.permissions:
+            mod_routing.roles_changed(after.guild.id)
+
+    @bot.listen("on_guild_channel_delete")
+    async def mod_routing_channel_deleted(channel):
+        mod_routing.channel_deleted(channel.guild.id, channel.id)
+
+    @bot.listen("on_guild_remove")
+    async def drop_mod_routing(guild):
+        mod_routing.invalidate(guild.id)
@@ -1,15 +1,18 @@
+import asyncio
+import re
 import discord
 from discord.commands import Option
-from discord.ext import commands, tasks
+from discord.ext import commands
 import datetime
-from utilities import sendToModChannel, findRolesByPermission
-from db_utils import execute_db_query
+from mod_routing import mod_routing
+from reports import report_aggregator
+from db_utils import db
+from guild_config import guild_configs
+from role_expiry import role_expiry
+from assets import logo, respond_with_logo
+from purge import MAX_PATTERN_LENGTH, PROGRESS_INTERVAL, PROGRESS_LIFETIME, SCAN_LIMIT, PurgeCriteria, PurgeJob, active_purges, purge_types
 
 def setup_moderation(bot):
-    execute_db_query('''CREATE TABLE IF NOT EXISTS temporary_roles
-                    (guild_id INTEGER, user_id INTEGER, role_id INTEGER, expiry_time TEXT)''')
-    execute_db_query('''CREATE TABLE IF NOT EXISTS max_messages
-                    (guild_id INTEGER, max_messages INTEGER)''')
     @bot.slash_command(name="ban", description="Ban a user from the server")
     @commands.has_permissions(ban_members=True)
     async def ban(ctx, member: Option(discord.Member, "The member to ban"), reason: Option(str, "Reason for the ban", required=False)):
@@ -19,10 +22,8 @@ def setup_moderation(bot):
         
         await member.ban(reason=reason)
         embed = discord.Embed(title="User Banned", description=f"{member.mention} has been banned from the server.", color=discord.Color.red())
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
         embed.add_field(name="Reason", value=reason)
-        await ctx.respond(embed=embed, file=file)
+        await respond_with_logo(ctx, embed)
 
     @bot.slash_command(name="kick", description="Kick a user from the server")
     @commands.has_permissions(kick_members=True)
@@ -33,10 +34,8 @@ def setup_moderation(bot):
         
         await member.kick(reason=reason)
         embed = discord.Embed(title="User Kicked", description=f"{member.mention} has been kicked from the server.", color=discord.Color.orange())
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
         embed.add_field(name="Reason", value=reason)
-        await ctx.respond(embed=embed, file=file)
+        await respond_with_logo(ctx, embed)
 
     @bot.slash_command(name="timeout", description="Timeout a user")
     @commands.has_permissions(moderate_members=True)
@@ -47,10 +46,8 @@ def setup_moderation(bot):
         
         await member.timeout_for(duration=datetime.timedelta(minutes=duration), reason=reason)
         embed = discord.Embed(title="User Timed Out", description=f"{member.mention} has been timed out for {duration} minutes.", color=discord.Color.orange())
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
         embed.add_field(name="Reason", value=reason)
-        await ctx.respond(embed=embed, file=file)
+        await respond_with_logo(ctx, embed)
     
     @bot.slash_command(name="unban", description="Unban a user from the server")
     @commands.has_permissions(ban_members=True)
@@ -61,10 +58,8 @@ def setup_moderation(bot):
         
         await ctx.guild.unban(member, reason=reason)
         embed = discord.Embed(title="User Unbanned", description=f"{member.mention} has been unbanned from the server.", color=discord.Color.green())
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
         embed.add_field(name="Reason", value=reason)
-        await ctx.respond(embed=embed, file=file)
+        await respond_with_logo(ctx, embed)
 
     @bot.slash_command(name="untimeout", description="Remove a timeout from a user")
     @commands.has_permissions(moderate_members=True)
@@ -75,20 +70,117 @@ def setup_moderation(bot):
         
         await member.remove_timeout(reason=reason)
         embed = discord.Embed(title="User Untimed Out", description=f"{member.mention} has been untimed out.", color=discord.Color.green())
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
         embed.add_field(name="Reason", value=reason)
-        await ctx.respond(embed=embed, file=file)
+        await respond_with_logo(ctx, embed)
 
-    @bot.slash_command(name="clear", description="Clear a specified number of messages")
+    class PurgeView(discord.ui.View):
+        def __init__(self, author_id, job):
+            super().__init__(timeout=None)
+            self.author_id = author_id
+            self.job = job
+
+        async def interaction_check(self, interaction):
+            return interaction.user.id == self.author_id
+
+        @discord.ui.button(label="Cancel", style=discord.ButtonStyle.danger)
+        async def cancel(self, button: discord.ui.Button, interaction: discord.Interaction):
+            self.job.cancel()
+            button.disabled = True
+            await interaction.response.edit_message(view=self)
+
+    def purge_progress_embed(job):
+        embed = discord.Embed(title="Clearing Messages", description=f"{job.deleted} of up to {job.amount} messages cleared so far...", color=discord.Color.blue())
+        embed.add_field(name="Scanned", value=job.scanned)
+        embed.add_field(name="Matched", value=job.matched)
+        return embed
+
+    @bot.slash_command(name="clear", description="Clear messages, optionally only those matching filters")
     @commands.has_permissions(manage_messages=True)
-    async def clear(ctx, amount: Option(int, "Number of messages to clear")):
-        await ctx.defer()
-        await ctx.channel.purge(limit=amount + 1)  # +1 to include the command message
-        embed = discord.Embed(title="Chat Cleared", description=f"{amount} messages have been cleared.", color=discord.Color.blue())
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
-        await ctx.respond(embed=embed, delete_after=5, file=file)
+    async def clear(ctx,
+                    amount: Option(int, "Number of messages to clear", min_value=1, max_value=SCAN_LIMIT),
+                    user: Option(discord.User, "Only messages from this user", required=False),
+                    pattern: Option(str, "Only messages matching this regular expression", max_length=MAX_PATTERN_LENGTH, required=False),
+                    content: Option(str, "Only messages of this type", autocomplete=discord.utils.basic_autocomplete(purge_types), required=False),
+                    attachments: Option(bool, "Only messages with (true) or without (false) attachments", required=False),
+                    within: Option(int, "Only messages from the last this many minutes", min_value=1, required=False),
+                    older_than: Option(int, "Only messages older than this many minutes", min_value=1, required=False),
+                    include_old: Option(bool, "Also clear messages older than 14 days, one at a time (slow)", default=False)):
+        await ctx.defer(ephemeral=True)
+        if content is not None and content not in purge_types:
+            await ctx.respond("Invalid content type. Please choose from the autocomplete list.", ephemeral=True)
+            return
+        if pattern is not None and len(pattern) > MAX_PATTERN_LENGTH:
+            await ctx.respond(f"The pattern can be at most {MAX_PATTERN_LENGTH} characters long.", ephemeral=True)
+            return
+        try:
+            regex = re.compile(pattern, re.IGNORECASE) if pattern else None
+        except re.error as e:
+            await ctx.respond(f"Invalid pattern: {e}", ephemeral=True)
+            return
+        if ctx.channel.id in active_purges:
+            await ctx.respond("Messages are already being cleared in this channel.", ephemeral=True)
+            return
+
+        now = discord.utils.utcnow()
+        job = PurgeJob(
+            ctx.channel,
+            PurgeCriteria(user.id if user else None, regex, content, attachments),
+            amount,
+            before=now - datetime.timedelta(minutes=older_than) if older_than else None,
+            after=now - datetime.timedelta(minutes=within) if within else None,
+            include_old=include_old,
+        )
+        view = PurgeView(ctx.author.id, job)
+        active_purges[ctx.channel.id] = job
+        await ctx.respond(embed=purge_progress_embed(job), view=view, ephemeral=True)
+
+        async def report_progress():
+            # One ephemeral message, edited every few seconds for as long as the token lasts
+            deadline = asyncio.get_running_loop().time() + PROGRESS_LIFETIME
+            while asyncio.get_running_loop().time() + PROGRESS_INTERVAL < deadline:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                try:
+                    await ctx.edit(embed=purge_progress_embed(job), view=view)
+                except discord.HTTPException:
+                    pass
+            embed = purge_progress_embed(job)
+            embed.description += "\nThis is taking a while; the summary will be sent to you directly."
+            try:
+                await ctx.edit(embed=embed, view=view)
+            except discord.HTTPException:
+                pass
+
+        reporter = asyncio.ensure_future(report_progress())
+        error = None
+        try:
+            await job.run()
+        except discord.HTTPException as e:
+            error = e
+        finally:
+            reporter.cancel()
+            view.stop()
+            del active_purges[ctx.channel.id]
+
+        embed = discord.Embed(title="Chat Cleared", description=f"{job.deleted} messages have been cleared.", color=discord.Color.blue())
+        if job.cancelled:
+            embed.description += " Cancelled before finishing."
+        if job.slow_pattern:
+            embed.description += " Stopped early: the pattern was too slow to match."
+        if job.failed:
+            embed.description += f" {job.failed} messages couldn't be deleted."
+        if error is not None:
+            embed.description += f" Stopped early: {error}"
+        embed.add_field(name="Scanned", value=job.scanned)
+        if logo.url:
+            embed.set_thumbnail(url=logo.url)
+        try:
+            await ctx.edit(embed=embed, view=None)
+        except discord.HTTPException:
+            # The interaction token expired during a long purge
+            try:
+                await ctx.author.send(embed=embed)
+            except discord.HTTPException:
+                await ctx.channel.send(ctx.author.mention, embed=embed, delete_after=60)
 
     @bot.slash_command(name="temprole", description="Assign a temporary role to a user")
     @commands.has_permissions(manage_roles=True)
@@ -109,8 +201,7 @@ def setup_moderation(bot):
 
         expiry_time = datetime.datetime.now() + datetime.timedelta(minutes=duration)
 
-        execute_db_query("INSERT INTO temporary_roles VALUES (?, ?, ?, ?)", 
-                  (ctx.guild.id, member.id, role.id, expiry_time.isoformat()))
+        await role_expiry.add(ctx.guild.id, member.id, role.id, expiry_time.timestamp())
 
         embed = discord.Embed(title="Temporary Role Assigned", color=discord.Color.blue())
         embed.add_field(name="Member", value=member.mention, inline=False)
@@ -118,42 +209,12 @@ def setup_moderation(bot):
         embed.add_field(name="Duration", value=f"{duration} minutes", inline=False)
         embed.add_field(name="Expiry Time", value=expiry_time.strftime("%Y-%m-%d %H:%M:%S"), inline=False)
         embed.add_field(name="Reason", value=reason, inline=False)
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
-
-        await ctx.respond(embed=embed, file=file)
-
-    @tasks.loop(minutes=1)
-    async def check_expired_roles():
-        current_time = datetime.datetime.now().isoformat()
-        expired_roles = execute_db_query("SELECT * FROM temporary_roles WHERE expiry_time <= ?", (current_time,))
-
-        for guild_id, user_id, role_id, _ in expired_roles:
-            guild = bot.get_guild(guild_id)
-            if guild:
-                member = guild.get_member(user_id)
-                role = guild.get_role(role_id)
-                if member and role:
-                    await member.remove_roles(role, reason="Temporary role expired")
-
-                    embed = discord.Embed(title="Temporary Role Expired", color=discord.Color.orange())
-                    embed.add_field(name="Member", value=member.mention, inline=False)
-                    embed.add_field(name="Role", value=role.mention, inline=False)
-
-                    try:
-                        log_channel_id = execute_db_query("SELECT channel_id FROM log_channels WHERE guild_id = ?", (guild_id,))
-                        if log_channel_id:
-                            log_channel = guild.get_channel(log_channel_id[0][0])
-                            if log_channel:
-                                await log_channel.send(embed=embed)
-                    except Exception as e:
-                        print(f"Error sending log message: {e}")
-
-        execute_db_query("DELETE FROM temporary_roles WHERE expiry_time <= ?", (current_time,))
-
-    @check_expired_roles.before_loop
-    async def before_check_expired_roles():
-        await bot.wait_until_ready()
+
+        await respond_with_logo(ctx, embed)
+
+    @bot.listen("on_ready")
+    async def start_role_expiry():
+        role_expiry.start(bot)
     
     @bot.slash_command(name="add_role", description="Add a role to a user")
     @commands.has_permissions(manage_roles=True)
@@ -161,9 +222,7 @@ def setup_moderation(bot):
         await ctx.defer()
         await member.add_roles(role)
         embed = discord.Embed(title="Role Added", description=f"{role.mention} has been added to {member.mention}.", color=discord.Color.green())
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
-        await ctx.respond(embed=embed, file=file)
+        await respond_with_logo(ctx, embed)
     
     @bot.slash_command(name="remove_role", description="Remove a role from a user")
     @commands.has_permissions(manage_roles=True)
@@ -171,32 +230,27 @@ def setup_moderation(bot):
         await ctx.defer()
         await member.remove_roles(role)
         embed = discord.Embed(title="Role Removed", description=f"{role.mention} has been removed from {member.mention}.", color=discord.Color.red())
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
-        await ctx.respond(embed=embed, file=file)
+        await respond_with_logo(ctx, embed)
     
     @bot.slash_command(name="set_mod_channel", description="Set the mod log channel")
     @commands.has_permissions(manage_guild=True)
     async def set_mod_channel(ctx, channel: Option(discord.TextChannel, "The channel to set as the mod log channel")):
         await ctx.defer()
-        execute_db_query("INSERT OR REPLACE INTO mod_channels VALUES (?, ?)", (ctx.guild.id, channel.id))
+        await db.execute("INSERT OR REPLACE INTO mod_channels VALUES (?, ?)", (ctx.guild.id, channel.id))
+        mod_routing.set_channel(ctx.guild.id, channel)
         embed = discord.Embed(title="Mod Log Channel Set", description=f"{channel.mention} has been set as the mod log channel.", color=discord.Color.blue())
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
-        await ctx.respond(embed=embed, file=file)
+        await respond_with_logo(ctx, embed)
     
     @bot.slash_command(name="report", description="Report a user")
     async def report(ctx, member: discord.Member, reason: str):
         await ctx.defer()
-        embed = discord.Embed(title="User Reported", description=f"{member.mention} has been reported by {ctx.author.mention}.", color=discord.Color.red())
+        if not report_aggregator.add(ctx, member, reason):
+            embed = discord.Embed(title="Already Reported", description=f"You've already reported {member.mention} recently. The moderators have your report.", color=discord.Color.orange())
+            await respond_with_logo(ctx, embed)
+            return
+        embed = discord.Embed(title="User Reported", description=f"{ctx.author.mention} has reported {member.mention}.", color=discord.Color.red())
         embed.add_field(name="Reason", value=reason)
-        embed2 = discord.Embed(title="User Reported", description=f"{ctx.author.mention} has reported {member.mention}.", color=discord.Color.red())
-        embed2.add_field(name="Reason", value=reason)
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
-        embed2.set_thumbnail(url="attachment://PeaceKeeper.png")
-        await ctx.respond(embed=embed2, file=file)
-        await sendToModChannel(ctx, embed, True)
+        await respond_with_logo(ctx, embed)
     
     @bot.slash_command(name="set_max_messages", description="Set the maximum number of messages users can send in a minute")
     @commands.has_permissions(administrator=True)
@@ -206,25 +260,40 @@ def setup_moderation(bot):
             await ctx.respond("The maximum number of messages must be at least 1.", ephemeral=True)
             return
 
-        # delete old max_messages value if it exists
-        execute_db_query("DELETE FROM max_messages WHERE guild_id = ?", (ctx.guild.id,))
-        execute_db_query("INSERT INTO max_messages VALUES (?, ?)", (ctx.guild.id, max_messages))
+        await db.execute("INSERT OR REPLACE INTO max_messages VALUES (?, ?)", (ctx.guild.id, max_messages))
+        guild_configs.set_max_messages(ctx.guild.id, max_messages)
 
         embed = discord.Embed(title="Max Messages Updated", description=f"Users can now send a maximum of {max_messages} messages per minute.", color=discord.Color.blue())
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
-        await ctx.respond(embed=embed, file=file)
+        await respond_with_logo(ctx, embed)
+
+    @bot.slash_command(name="set_channel_max_messages", description="Set the maximum number of messages users can send in a minute in one channel")
+    @commands.has_permissions(administrator=True)
+    async def set_channel_max_messages(ctx, channel: Option(discord.TextChannel, "The channel to limit"), max_messages: Option(int, "Maximum number of messages per minute (0 to use the server limit)")):
+        await ctx.defer()
+        if max_messages < 0:
+            await ctx.respond("The maximum number of messages can't be negative.", ephemeral=True)
+            return
+
+        if max_messages == 0:
+            await db.execute("DELETE FROM channel_max_messages WHERE channel_id = ?", (channel.id,))
+            description = f"{channel.mention} now uses the server-wide message limit."
+        else:
+            await db.execute("INSERT OR REPLACE INTO channel_max_messages VALUES (?, ?, ?)", (ctx.guild.id, channel.id, max_messages))
+            description = f"Users can now send a maximum of {max_messages} messages per minute in {channel.mention}."
+        guild_configs.set_channel_max_messages(ctx.guild.id, channel.id, max_messages)
+
+        embed = discord.Embed(title="Channel Max Messages Updated", description=description, color=discord.Color.blue())
+        await respond_with_logo(ctx, embed)
 
     @bot.slash_command(name="get_max_messages", description="Get the current maximum number of messages per minute")
     @commands.has_permissions(administrator=True)
     async def get_max_messages(ctx):
         await ctx.defer()
-        result = execute_db_query("SELECT max_messages FROM max_messages WHERE guild_id = ?", (ctx.guild.id,))
-        max_messages = result[0][0] if result else 10  # Default to 10 if not set
+        config = await guild_configs.get(ctx.guild.id)
+        max_messages = config.max_messages
 
         embed = discord.Embed(title="Current Max Messages", description=f"The current maximum is {max_messages} messages per minute.", color=discord.Color.blue())
-        file = discord.File("PeaceKeeper.png", filename="PeaceKeeper.png")
-        embed.set_thumbnail(url="attachment://PeaceKeeper.png")
-        await ctx.respond(embed=embed, file=file)
-
-    check_expired_roles.start()
\ No newline at end of file
+        if config.channel_max_messages:
+            overrides = "\n".join(f"<#{channel_id}>: {limit} messages per minute" for channel_id, limit in config.channel_max_messages.items())
+            embed.add_field(name="Channel Overrides", value=overrides[:1024], inline=False)
+        await respond_with_logo(ctx, embed)
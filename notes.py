@@ -1,12 +1,9 @@
 import discord
 from discord.commands import Option
 from discord.ext import commands
-from db_utils import execute_db_query
+from db_utils import db
 
 def setup_notes(bot):
-    execute_db_query('''CREATE TABLE IF NOT EXISTS user_notes
-                 (guild_id INTEGER, user_id INTEGER, moderator_id INTEGER, note TEXT, timestamp TEXT)''')
-
     class NotePaginator(discord.ui.View):
         def __init__(self, notes, user):
             super().__init__(timeout=60)
@@ -56,7 +53,7 @@ def setup_notes(bot):
     async def add_note(ctx, user: Option(discord.Member, "The user to add a note to"), note: Option(str, "The note to add")):
         await ctx.defer()
         timestamp = discord.utils.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-        execute_db_query("INSERT INTO user_notes VALUES (?, ?, ?, ?, ?)", 
+        await db.execute("INSERT INTO user_notes VALUES (?, ?, ?, ?, ?)", 
                          (ctx.guild.id, user.id, ctx.author.id, note, timestamp))
         
         embed = discord.Embed(title="Note Added", description=f"A note has been added to {user.mention}'s profile.", color=discord.Color.green())
@@ -68,7 +65,7 @@ def setup_notes(bot):
     @commands.has_permissions(manage_messages=True)
     async def view_notes(ctx, user: Option(discord.Member, "The user to view notes for")):
         await ctx.defer()
-        notes = execute_db_query("SELECT moderator_id, note, timestamp FROM user_notes WHERE guild_id = ? AND user_id = ?", 
+        notes = await db.fetch("SELECT moderator_id, note, timestamp FROM user_notes WHERE guild_id = ? AND user_id = ?", 
                                  (ctx.guild.id, user.id))
         
         if not notes:
@@ -85,7 +82,7 @@ def setup_notes(bot):
                         note_index: Option(int, "The index of the note to edit"), 
                         new_note: Option(str, "The new content of the note")):
         await ctx.defer()
-        notes = execute_db_query("SELECT rowid, moderator_id, note, timestamp FROM user_notes WHERE guild_id = ? AND user_id = ?", 
+        notes = await db.fetch("SELECT rowid, moderator_id, note, timestamp FROM user_notes WHERE guild_id = ? AND user_id = ?", 
                                  (ctx.guild.id, user.id))
         
         if not notes or note_index < 1 or note_index > len(notes):
@@ -98,7 +95,7 @@ def setup_notes(bot):
             await ctx.respond("You can only edit notes that you've added, unless you're an administrator.")
             return
 
-        execute_db_query("UPDATE user_notes SET note = ? WHERE rowid = ?", (new_note, note_id))
+        await db.execute("UPDATE user_notes SET note = ? WHERE rowid = ?", (new_note, note_id))
         
         embed = discord.Embed(title="Note Edited", description=f"A note for {user.mention} has been edited.", color=discord.Color.yellow())
         embed.add_field(name="Old Note", value=old_note, inline=False)
@@ -111,7 +108,7 @@ def setup_notes(bot):
     async def delete_note(ctx, user: Option(discord.Member, "The user whose note to delete"), 
                           note_index: Option(int, "The index of the note to delete")):
         await ctx.defer()
-        notes = execute_db_query("SELECT rowid, moderator_id, note FROM user_notes WHERE guild_id = ? AND user_id = ?", 
+        notes = await db.fetch("SELECT rowid, moderator_id, note FROM user_notes WHERE guild_id = ? AND user_id = ?", 
                                  (ctx.guild.id, user.id))
         
         if not notes or note_index < 1 or note_index > len(notes):
@@ -124,7 +121,7 @@ def setup_notes(bot):
             await ctx.respond("You can only delete notes that you've added, unless you're an administrator.")
             return
 
-        execute_db_query("DELETE FROM user_notes WHERE rowid = ?", (note_id,))
+        await db.execute("DELETE FROM user_notes WHERE rowid = ?", (note_id,))
         
         embed = discord.Embed(title="Note Deleted", description=f"A note for {user.mention} has been deleted.", color=discord.Color.red())
         embed.add_field(name="Deleted Note", value=note)
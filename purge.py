@@ -0,0 +1,147 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import discord
+from block_filter import block_list, get_block_matcher
+from deletions import BULK_DELETE_LIMIT, BULK_DELETE_MAX_AGE, delete_messages
+
+SCAN_LIMIT = 50_000
+PROGRESS_INTERVAL = 2.0
+# Interaction tokens last 15 minutes; stop editing the progress message a little before that
+PROGRESS_LIFETIME = 14 * 60
+# Moderator patterns are matched a page at a time on a worker thread, and a page that
+# takes longer than PATTERN_BUDGET seconds ends the purge
+MAX_PATTERN_LENGTH = 200
+PATTERN_PAGE = 100
+PATTERN_BUDGET = 1.0
+# Content types beyond the block list's, which look at more than the text
+purge_types = ["bot", "embed"] + block_list
+
+# Channels with a purge in progress, so two can't fight over the same history
+active_purges = {}
+pattern_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="purge")
+
+
+class PurgeCriteria:
+    __slots__ = ("user_id", "pattern", "content_type", "matcher", "attachments")
+
+    def __init__(self, user_id=None, pattern=None, content_type=None, attachments=None):
+        self.user_id = user_id
+        self.pattern = pattern
+        self.content_type = content_type
+        self.matcher = get_block_matcher((content_type,)) if content_type in block_list else None
+        self.attachments = attachments
+
+    def matches(self, message):
+        if self.user_id is not None and message.author.id != self.user_id:
+            return False
+        if self.attachments is not None and bool(message.attachments) != self.attachments:
+            return False
+        if self.content_type == "bot" and not message.author.bot:
+            return False
+        if self.content_type == "embed" and not message.embeds:
+            return False
+        if self.matcher is not None and not self.matcher.search(message.content):
+            return False
+        if self.pattern is not None and not self.pattern.search(message.content):
+            return False
+        return True
+
+    def filter(self, messages, budget):
+        # The matching messages, or None if they take longer than budget to go through
+        deadline = time.monotonic() + budget
+        matches = []
+        for message in messages:
+            if self.matches(message):
+                matches.append(message)
+            if time.monotonic() > deadline:
+                return None
+        return matches
+
+
+class PurgeJob:
+    # Streams a channel's history newest first, one page at a time, and deletes the
+    # matching messages in batches of up to 100 while it goes on reading. At most one
+    # batch is being deleted while the next one fills, so memory stays the same no matter
+    # how many messages are scanned. Unless include_old is set the stream stops at the
+    # bulk delete cutoff; older messages can only be deleted one request each.
+    def __init__(self, channel, criteria, amount, before=None, after=None, include_old=False, scan_limit=SCAN_LIMIT):
+        self.channel = channel
+        self.criteria = criteria
+        self.amount = amount
+        self.before = before
+        self.after = after
+        self.include_old = include_old
+        self.scan_limit = scan_limit
+        self.scanned = 0
+        self.matched = 0
+        self.deleted = 0
+        self.failed = 0
+        self.requests = 0
+        self.cancelled = False
+        self.slow_pattern = False
+        self._batch = []
+        self._deleting = None
+
+    def cancel(self):
+        self.cancelled = True
+
+    async def run(self):
+        after = self.after
+        if not self.include_old:
+            cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+            after = max(after, cutoff) if after else cutoff
+
+        page_size = PATTERN_PAGE if self.criteria.pattern is not None else 1
+        page = []
+        try:
+            async for message in self.channel.history(limit=self.scan_limit, before=self.before, after=after, oldest_first=False):
+                if self.cancelled:
+                    break
+                page.append(message)
+                if len(page) < page_size:
+                    continue
+                if await self._take(page):
+                    break
+                page = []
+            else:
+                if page:
+                    await self._take(page)
+            if self._batch and not self.cancelled and not self.slow_pattern:
+                await self._hand_off()
+        finally:
+            if self._deleting is not None:
+                await self._deleting
+
+    async def _take(self, page):
+        # Returns whether the purge is over
+        self.scanned += len(page)
+        if self.criteria.pattern is None:
+            matches = [message for message in page if self.criteria.matches(message)]
+        else:
+            matches = await asyncio.get_running_loop().run_in_executor(pattern_pool, self.criteria.filter, page, PATTERN_BUDGET)
+            if matches is None:
+                self.slow_pattern = True
+                return True
+        if self.cancelled:
+            return True
+        for message in matches:
+            self.matched += 1
+            self._batch.append(message)
+            if len(self._batch) == BULK_DELETE_LIMIT or self.matched >= self.amount:
+                await self._hand_off()
+            if self.matched >= self.amount:
+                return True
+        return False
+
+    async def _hand_off(self):
+        if self._deleting is not None:
+            await self._deleting
+        self._deleting = asyncio.ensure_future(self._delete(self._batch))
+        self._batch = []
+
+    async def _delete(self, batch):
+        requests, failed = await delete_messages(self.channel, batch)
+        self.requests += requests
+        self.deleted += len(batch) - failed
+        self.failed += failed
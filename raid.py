@@ -0,0 +1,271 @@
+import datetime
+import time
+from array import array
+from collections import deque
+import discord
+from discord.commands import Option
+from discord.ext import commands, tasks
+from guild_config import guild_configs
+from actions import action_dispatcher
+
+RAID_WINDOW = 10
+RAID_CALM_AFTER = 60
+RAID_ACTIONS_PER_SECOND = 5
+# Members queued for the raid action per guild; later joins past this are only summarized
+MAX_PENDING_ACTIONS = 1000
+# How long a member the raid action was taken on stays out of the per-member logs
+ENFORCED_GRACE = 60
+RAID_TIMEOUT = datetime.timedelta(hours=1)
+SUMMARY_SAMPLE = 20
+
+
+class JoinRateMeter:
+    # Joins over the last `window` seconds, counted in a ring of one-second buckets.
+    # Each update clears the buckets skipped since the previous one, so the work is
+    # constant per join and the memory is fixed per guild.
+    __slots__ = ("window", "buckets", "total", "last")
+
+    def __init__(self, window=RAID_WINDOW):
+        self.window = window
+        self.buckets = array('I', bytes(4 * window))
+        self.total = 0
+        self.last = 0
+
+    def _advance(self, second):
+        if second - self.last >= self.window:
+            for i in range(self.window):
+                self.buckets[i] = 0
+            self.total = 0
+        else:
+            for s in range(self.last + 1, second + 1):
+                i = s % self.window
+                self.total -= self.buckets[i]
+                self.buckets[i] = 0
+        self.last = second
+
+    def hit(self, now=None):
+        second = int(now if now is not None else time.monotonic())
+        if second > self.last:
+            self._advance(second)
+        self.buckets[second % self.window] += 1
+        self.total += 1
+        return self.total
+
+    def rate(self, now=None):
+        second = int(now if now is not None else time.monotonic())
+        if second > self.last:
+            self._advance(second)
+        return self.total
+
+
+class _Raid:
+    __slots__ = ("started", "last_burst", "joins", "sample", "manual", "timed_out", "kicked")
+
+    def __init__(self, manual=False):
+        self.started = time.monotonic()
+        self.last_burst = self.started
+        self.joins = 0
+        self.sample = []
+        self.manual = manual
+        self.timed_out = 0
+        self.kicked = 0
+
+
+class RaidGuard:
+    def __init__(self):
+        self._meters = {}
+        self._recent = {}
+        self._raids = {}
+        self._pending_actions = {}
+        self._enforced = {}
+        self._announcements = []
+        self.actions_taken = 0
+        self.actions_dropped = 0
+
+    def active(self, guild_id):
+        return guild_id in self._raids
+
+    def record_join(self, member, config):
+        # Returns True when the guild is in raid mode and the join should only be summarized
+        threshold = config.automod.get("raid_joins", 0)
+        raid = self._raids.get(member.guild.id)
+        if threshold <= 0 and raid is None:
+            return False
+
+        meter = self._meters.get(member.guild.id)
+        if meter is None:
+            meter = self._meters[member.guild.id] = JoinRateMeter()
+        recent = self._recent.get(member.guild.id)
+        if recent is None:
+            recent = self._recent[member.guild.id] = deque(maxlen=100)
+        rate = meter.hit()
+        recent.append(member)
+
+        if raid is None and rate >= threshold:
+            raid = self.start(member.guild, f"{rate} members joined within {RAID_WINDOW} seconds")
+            # The joins that crossed the threshold belong to the burst as well
+            burst = list(recent)[-rate:]
+            for joined in burst[:-1]:
+                self._enforce(joined, config)
+        if raid is None:
+            return False
+
+        if threshold > 0 and rate >= threshold:
+            raid.last_burst = time.monotonic()
+        raid.joins += 1
+        if len(raid.sample) < SUMMARY_SAMPLE:
+            raid.sample.append(member.mention)
+        self._enforce(member, config)
+        return True
+
+    def _enforce(self, member, config):
+        if config.automod.get("raid_action", 0) > 0:
+            pending = self._pending_actions.get(member.guild.id)
+            if pending is None:
+                pending = self._pending_actions[member.guild.id] = deque()
+            if len(pending) >= MAX_PENDING_ACTIONS:
+                self.actions_dropped += 1
+                return
+            pending.append(member)
+
+    def mark_enforced(self, member, kicked):
+        # The action is logged in the raid summary rather than once per member
+        self._enforced.setdefault(member.guild.id, {})[member.id] = time.monotonic()
+        raid = self._raids.get(member.guild.id)
+        if raid is not None:
+            if kicked:
+                raid.kicked += 1
+            else:
+                raid.timed_out += 1
+
+    def covers(self, guild_id, user_id):
+        enforced = self._enforced.get(guild_id)
+        at = enforced.get(user_id) if enforced else None
+        return at is not None and time.monotonic() - at < ENFORCED_GRACE
+
+    def _prune_enforced(self, now):
+        for guild_id, enforced in list(self._enforced.items()):
+            for user_id in [u for u, at in enforced.items() if now - at >= ENFORCED_GRACE]:
+                del enforced[user_id]
+            if not enforced:
+                del self._enforced[guild_id]
+
+    def holds(self, guild_id, user, config):
+        # New accounts can be kept from verifying while a raid is on
+        hold_days = config.automod.get("raid_hold_days", 0)
+        if hold_days <= 0 or guild_id not in self._raids:
+            return False
+        return discord.utils.utcnow() - user.created_at < datetime.timedelta(days=hold_days)
+
+    def start(self, guild, reason, manual=False):
+        raid = self._raids[guild.id] = _Raid(manual)
+        embed = discord.Embed(title="Raid Mode Enabled", description=reason, color=discord.Color.red())
+        self._announcements.append((guild, "raid", embed))
+        return raid
+
+    def stop(self, guild, reason):
+        raid = self._raids.pop(guild.id, None)
+        if raid is None:
+            return False
+        self._pending_actions.pop(guild.id, None)
+        self._recent.pop(guild.id, None)
+        self._summarize(guild, raid)
+        embed = discord.Embed(title="Raid Mode Disabled", description=reason, color=discord.Color.green())
+        self._announcements.append((guild, "raid", embed))
+        return True
+
+    def _summarize(self, guild, raid):
+        if not (raid.joins or raid.timed_out or raid.kicked):
+            return
+        embed = discord.Embed(title="Raid Joins", description=f"{raid.joins} members joined during raid mode.", color=discord.Color.orange())
+        if raid.sample:
+            shown = ", ".join(raid.sample)
+            if raid.joins > len(raid.sample):
+                shown += f" and {raid.joins - len(raid.sample)} more"
+            embed.add_field(name="Members", value=shown[:1024], inline=False)
+        if raid.timed_out or raid.kicked:
+            embed.add_field(name="Raid Action", value=f"{raid.timed_out} timed out, {raid.kicked} kicked", inline=False)
+        self._announcements.append((guild, "join", embed))
+        raid.joins = 0
+        raid.sample = []
+        raid.timed_out = 0
+        raid.kicked = 0
+
+    def tick(self, bot):
+        # Called periodically: summarizes raid joins, ends raids once joins calm down and
+        # returns the (guild, aspect, embed) log entries that piled up
+        now = time.monotonic()
+        for guild_id, raid in list(self._raids.items()):
+            guild = bot.get_guild(guild_id)
+            if guild is None:
+                # The bot left the guild; nothing queued for it can be acted on anymore
+                self._raids.pop(guild_id, None)
+                self._pending_actions.pop(guild_id, None)
+                self._recent.pop(guild_id, None)
+                self._meters.pop(guild_id, None)
+                self._enforced.pop(guild_id, None)
+                continue
+            if not raid.manual and now - raid.last_burst >= RAID_CALM_AFTER:
+                self.stop(guild, f"No join burst for {RAID_CALM_AFTER} seconds.")
+            else:
+                self._summarize(guild, raid)
+        self._prune_enforced(now)
+        announcements, self._announcements = self._announcements, []
+        return announcements
+
+    def take_actions(self, limit=RAID_ACTIONS_PER_SECOND):
+        # Hands out at most `limit` queued members per guild for each call
+        batch = []
+        for guild_id, pending in list(self._pending_actions.items()):
+            for _ in range(min(limit, len(pending))):
+                batch.append(pending.popleft())
+            if not pending:
+                del self._pending_actions[guild_id]
+        return batch
+
+    def stats(self):
+        return {
+            "raids": len(self._raids),
+            "pending_actions": sum(len(pending) for pending in self._pending_actions.values()),
+            "actions_taken": self.actions_taken,
+            "actions_dropped": self.actions_dropped,
+        }
+
+
+raid_guard = RaidGuard()
+
+
+def setup_raid(bot):
+    @tasks.loop(seconds=1)
+    async def enforce_raid_actions():
+        for member in raid_guard.take_actions():
+            config = guild_configs.cached(member.guild.id)
+            action = config.automod.get("raid_action", 0) if config else 0
+            if action > 0:
+                raid_guard.mark_enforced(member, kicked=action >= 2)
+            if action == 1:
+                action_dispatcher.submit(("raid_timeout", lambda member=member: member.timeout_for(duration=RAID_TIMEOUT, reason="Raid protection")))
+            elif action >= 2:
+                action_dispatcher.submit(("raid_kick", lambda member=member: member.kick(reason="Raid protection")))
+            raid_guard.actions_taken += 1
+
+    @bot.listen("on_ready")
+    async def start_raid_enforcement():
+        if not enforce_raid_actions.is_running():
+            enforce_raid_actions.start()
+
+    @bot.slash_command(name="raid_mode", description="Turn raid mode on or off")
+    @commands.has_permissions(administrator=True)
+    async def raid_mode(ctx, enabled: Option(bool, "Whether raid mode should be on")):
+        if enabled:
+            if raid_guard.active(ctx.guild.id):
+                embed = discord.Embed(title="Raid Mode", description="Raid mode is already on.", color=discord.Color.orange())
+            else:
+                raid_guard.start(ctx.guild, f"Enabled by {ctx.author.mention}.", manual=True)
+                embed = discord.Embed(title="Raid Mode", description="Raid mode is now on. It stays on until you turn it off.", color=discord.Color.red())
+        else:
+            if raid_guard.stop(ctx.guild, f"Disabled by {ctx.author.mention}."):
+                embed = discord.Embed(title="Raid Mode", description="Raid mode is now off.", color=discord.Color.green())
+            else:
+                embed = discord.Embed(title="Raid Mode", description="Raid mode is not on.", color=discord.Color.orange())
+        await ctx.respond(embed=embed)
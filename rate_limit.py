@@ -0,0 +1,158 @@
+import math
+import time
+from array import array
+
+# Discord ids are never 0, so it marks a free slot
+_EMPTY = 0
+_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+_MIN_BITS = 3
+
+
+class _BucketTable:
+    # Open addressing with linear probing over flat arrays: 20 bytes a slot, with the
+    # table kept between a third and two thirds full. Removal shifts later entries of
+    # the same probe run back instead of leaving tombstones.
+    __slots__ = ("bits", "count", "users", "tokens", "updated")
+
+    def __init__(self, bits=_MIN_BITS):
+        size = 1 << bits
+        self.bits = bits
+        self.count = 0
+        self.users = array('Q', bytes(8 * size))
+        self.tokens = array('f', bytes(4 * size))
+        self.updated = array('d', bytes(8 * size))
+
+    def _home(self, user_id):
+        return ((user_id * _MULTIPLIER) & _MASK64) >> (64 - self.bits)
+
+    def find(self, user_id):
+        # The slot holding user_id, or the free slot it would go in
+        users = self.users
+        mask = len(users) - 1
+        i = self._home(user_id)
+        while True:
+            key = users[i]
+            if key == user_id or key == _EMPTY:
+                return i
+            i = (i + 1) & mask
+
+    def insert(self, i, user_id, tokens, now):
+        self.users[i] = user_id
+        self.tokens[i] = tokens
+        self.updated[i] = now
+        self.count += 1
+        if 3 * self.count > 2 * len(self.users):
+            self.resize(self.bits + 1)
+
+    def remove(self, i):
+        users, tokens, updated = self.users, self.tokens, self.updated
+        mask = len(users) - 1
+        j = i
+        while True:
+            j = (j + 1) & mask
+            key = users[j]
+            if key == _EMPTY:
+                break
+            # An entry can fill the hole if the hole lies between its home and where it is
+            if (j - self._home(key)) & mask >= (j - i) & mask:
+                users[i] = key
+                tokens[i] = tokens[j]
+                updated[i] = updated[j]
+                i = j
+        users[i] = _EMPTY
+        self.count -= 1
+
+    def resize(self, bits):
+        users, tokens, updated = self.users, self.tokens, self.updated
+        self.__init__(bits)
+        for i, user_id in enumerate(users):
+            if user_id != _EMPTY:
+                j = self.find(user_id)
+                self.users[j] = user_id
+                self.tokens[j] = tokens[i]
+                self.updated[j] = updated[i]
+                self.count += 1
+
+    def shrink(self):
+        bits = self.bits
+        while bits > _MIN_BITS and 3 * self.count < (1 << (bits - 1)):
+            bits -= 1
+        if bits != self.bits:
+            self.resize(bits)
+
+
+class RateLimiter:
+    # Token bucket per (scope, user), where the scope is a guild or a channel with its
+    # own limit. Each scope's buckets live in a flat hash table rather than in Python
+    # objects, and every hit advances a clock hand over a few slots, table after table,
+    # to evict buckets that have been idle long enough to be full again.
+    def __init__(self, period=60.0, sweep=4, max_overflow=11):
+        self.period = period
+        # Tokens never go below -max_overflow, so a burst costs at most that much debt
+        self.max_overflow = max_overflow
+        self.idle_after = 2 * period
+        self._sweep = sweep
+        self._tables = {}
+        self._scan = iter(())
+        self._hand_scope = None
+        self._hand = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return sum(table.count for table in self._tables.values())
+
+    def _release(self, scope_id, table, slot):
+        table.remove(slot)
+        if not table.count:
+            del self._tables[scope_id]
+        self.evicted += 1
+
+    def _evict_idle(self, now):
+        budget = self._sweep
+        while budget:
+            table = self._tables.get(self._hand_scope)
+            if table is None or self._hand >= len(table.users):
+                # Done with this table; give back the space evictions freed up
+                if table is not None:
+                    table.shrink()
+                self._hand_scope = next(self._scan, None)
+                self._hand = 0
+                if self._hand_scope is None:
+                    if not self._tables:
+                        return
+                    self._scan = iter(list(self._tables))
+                continue
+            budget -= 1
+            slot = self._hand
+            # Only full buckets go; one in debt refills at no less than a token a period
+            if table.users[slot] != _EMPTY and now - table.updated[slot] >= max(self.idle_after, self.period * (1 - table.tokens[slot])):
+                # Another entry may have shifted into the slot, so look at it again
+                self._release(self._hand_scope, table, slot)
+            else:
+                self._hand += 1
+
+    def hit(self, scope_id, user_id, limit, now=None):
+        # Returns how many messages over the limit this one is (0 when allowed)
+        if now is None:
+            now = time.monotonic()
+        table = self._tables.get(scope_id)
+        if table is None:
+            table = self._tables[scope_id] = _BucketTable()
+        slot = table.find(user_id)
+        if table.users[slot] == user_id:
+            tokens = max(min(limit, table.tokens[slot] + (now - table.updated[slot]) * limit / self.period) - 1, -self.max_overflow)
+            table.tokens[slot] = tokens
+            table.updated[slot] = now
+        else:
+            tokens = limit - 1
+            table.insert(slot, user_id, tokens, now)
+        self._evict_idle(now)
+        return 0 if tokens >= 0 else math.ceil(-tokens)
+
+    def reset(self, scope_id, user_id):
+        table = self._tables.get(scope_id)
+        if table is not None:
+            slot = table.find(user_id)
+            if table.users[slot] == user_id:
+                self._release(scope_id, table, slot)
@@ -0,0 +1,93 @@
+import asyncio
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import discord
+import PIL.Image
+import PIL.ImageDraw
+from assets import arial
+
+# FreeType faces aren't safe to share between threads, and the font objects are cached
+_text_lock = threading.Lock()
+
+
+def letter_avatar(letter, size=400, background="black", foreground="white"):
+    image = PIL.Image.new("RGB", (size, size), color=background)
+    draw = PIL.ImageDraw.Draw(image)
+    font = arial.font(size // 2)
+    with _text_lock:
+        bbox = draw.textbbox((0, 0), letter, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+        text_position = ((size - text_width) // 2, (size - text_height) // 2)
+        draw.text(text_position, letter, fill=foreground, font=font)
+    return image
+
+
+def _to_png(draw, args):
+    buffer = io.BytesIO()
+    draw(*args).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class ImageRenderer:
+    # Generated images are drawn on a small thread pool, away from the event loop, and
+    # encoded to PNG in memory. The bytes of the most recently used ones are kept in an
+    # LRU keyed by the draw function and its arguments, and concurrent requests for the
+    # same image share one render. Any function returning a PIL image can be rendered
+    # as long as its arguments are hashable.
+    def __init__(self, workers=2, max_images=256):
+        self.max_images = max_images
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="renderer")
+        self._images = OrderedDict()
+        self._rendering = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    async def render(self, draw, *args):
+        key = (draw, args)
+        data = self._images.get(key)
+        if data is not None:
+            self.hits += 1
+            self._images.move_to_end(key)
+            return data
+
+        future = self._rendering.get(key)
+        if future is None:
+            self.misses += 1
+            future = self._rendering[key] = asyncio.get_running_loop().run_in_executor(self._executor, _to_png, draw, args)
+            future.add_done_callback(lambda future: self._finished(key, future))
+        else:
+            self.shared += 1
+        return await asyncio.shield(future)
+
+    def _finished(self, key, future):
+        del self._rendering[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._images[key] = future.result()
+        if len(self._images) > self.max_images:
+            self._images.popitem(last=False)
+
+    async def file(self, filename, draw, *args):
+        return discord.File(io.BytesIO(await self.render(draw, *args)), filename=filename)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        lookups = self.hits + self.shared + self.misses
+        return {
+            "images": len(self._images),
+            "bytes": sum(len(data) for data in self._images.values()),
+            "rendering": len(self._rendering),
+            "hits": self.hits,
+            "shared": self.shared,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.shared) / lookups if lookups else 0.0,
+        }
+
+
+renderer = ImageRenderer()
@@ -0,0 +1,134 @@
+import asyncio
+import discord
+from assets import logo
+from utilities import sendToModChannel
+
+MAX_REASON_LENGTH = 200
+FIELD_LIMIT = 1024
+
+
+class AggregatedReport:
+    __slots__ = ("member", "created_at", "reports", "ctx", "message", "pinged", "dirty", "task")
+
+    def __init__(self, member):
+        self.member = member
+        self.created_at = discord.utils.utcnow()
+        self.reports = {}
+        self.ctx = None
+        self.message = None
+        self.pinged = False
+        self.dirty = False
+        self.task = None
+
+    def embed(self, max_reasons):
+        count = len(self.reports)
+        if count == 1:
+            reporter_id = next(iter(self.reports))
+            description = f"{self.member.mention} has been reported by <@{reporter_id}>."
+        else:
+            description = f"{self.member.mention} has been reported by {count} users."
+        embed = discord.Embed(title="User Reported", description=description, color=discord.Color.red())
+
+        lines = []
+        length = 0
+        for reporter_id, reason in list(self.reports.items())[:max_reasons]:
+            line = f"<@{reporter_id}>: {reason}"
+            if length + len(line) + 1 > FIELD_LIMIT - 20:
+                break
+            lines.append(line)
+            length += len(line) + 1
+        if count > len(lines):
+            lines.append(f"...and {count - len(lines)} more")
+        embed.add_field(name="Reasons" if count > 1 else "Reason", value="\n".join(lines), inline=False)
+        embed.add_field(name="First Reported", value=discord.utils.format_dt(self.created_at, "R"))
+        if logo.url:
+            embed.set_thumbnail(url=logo.url)
+        return embed
+
+
+class ReportAggregator:
+    # Reports against the same member within a window share one mod channel message,
+    # which is edited in place as more come in and pings the mod roles only once. Edits
+    # are spaced edit_interval apart, so a burst of reports costs a couple of requests.
+    # Entries expire when their window ends, and past max_entries the oldest is dropped.
+    def __init__(self, window=600, edit_interval=3.0, max_entries=1000, max_reporters=500, max_reasons=10):
+        self.window = window
+        self.edit_interval = edit_interval
+        self.max_entries = max_entries
+        self.max_reporters = max_reporters
+        self.max_reasons = max_reasons
+        self._reports = {}
+        self.received = 0
+        self.duplicates = 0
+        self.posted = 0
+        self.edited = 0
+        self.evicted = 0
+
+    def add(self, ctx, member, reason):
+        # Returns False if this user already reported the member in the current window
+        key = (ctx.guild.id, member.id)
+        entry = self._reports.get(key)
+        if entry is None:
+            entry = self._reports[key] = AggregatedReport(member)
+            asyncio.get_running_loop().call_later(self.window, self._expire, key, entry)
+            if len(self._reports) > self.max_entries:
+                del self._reports[next(iter(self._reports))]
+                self.evicted += 1
+        if ctx.author.id in entry.reports:
+            self.duplicates += 1
+            return False
+
+        self.received += 1
+        if len(entry.reports) < self.max_reporters:
+            entry.reports[ctx.author.id] = reason[:MAX_REASON_LENGTH]
+        entry.ctx = ctx
+        entry.dirty = True
+        if entry.task is None:
+            entry.task = asyncio.ensure_future(self._publish(key, entry))
+        return True
+
+    def _expire(self, key, entry):
+        if self._reports.get(key) is entry:
+            del self._reports[key]
+
+    async def _publish(self, key, entry):
+        try:
+            while entry.dirty:
+                entry.dirty = False
+                embed = entry.embed(self.max_reasons)
+                if entry.message is not None:
+                    try:
+                        await entry.message.edit(embed=embed)
+                        self.edited += 1
+                    except discord.NotFound:
+                        # Deleted by a moderator; post it again, without pinging twice
+                        entry.message = None
+                    except discord.HTTPException as e:
+                        print(f"Failed to update the report on {entry.member.id}: {e}")
+                if entry.message is None:
+                    try:
+                        entry.message = await sendToModChannel(entry.ctx, embed, not entry.pinged)
+                    except discord.HTTPException as e:
+                        print(f"Failed to post the report on {entry.member.id}: {e}")
+                    if entry.message is None:
+                        # No usable mod channel; let the next report try again
+                        self._expire(key, entry)
+                        return
+                    entry.pinged = True
+                    self.posted += 1
+                await asyncio.sleep(self.edit_interval)
+        finally:
+            entry.task = None
+
+    def stats(self):
+        return {
+            "open": len(self._reports),
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "posted": self.posted,
+            "edited": self.edited,
+            "evicted": self.evicted,
+        }
+
+
+report_aggregator = ReportAggregator()
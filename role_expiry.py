@@ -0,0 +1,223 @@
+import asyncio
+import heapq
+import time
+import discord
+from db_utils import db
+from logs import log_event
+
+LOAD_WINDOW = 3600
+MAX_ATTEMPTS = 8
+RETRY_BASE = 30
+RETRY_MAX = 6 * 3600
+GUILD_CONCURRENCY = 4
+UNAVAILABLE_RETRY = 300
+
+
+class TemporaryRole:
+    __slots__ = ("id", "guild_id", "user_id", "role_id", "expires_at", "attempts")
+
+    def __init__(self, id, guild_id, user_id, role_id, expires_at, attempts=0):
+        self.id = id
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.role_id = role_id
+        self.expires_at = expires_at
+        self.attempts = attempts
+
+
+class RoleExpiryScheduler:
+    # Temporary roles due within the next `window` seconds sit in a min-heap keyed by expiry
+    # time; later ones stay in the table until the window reaches them and are then read
+    # with a range query on the expiry index, so nothing is ever scanned. The runner sleeps
+    # until the earliest expiry and is woken early when a sooner one is added. Due roles
+    # are removed guild by guild, a few guilds at a time. Failed removals are retried with
+    # exponential backoff, and every outcome is written back to the table. Roles in a guild
+    # that is unavailable wait for it without using up attempts, and are only dropped when
+    # the bot leaves the guild.
+    def __init__(self, window=LOAD_WINDOW, concurrency=GUILD_CONCURRENCY):
+        self.window = window
+        self._heap = []
+        self._entries = {}
+        self._loaded_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._guilds = asyncio.Semaphore(concurrency)
+        self._task = None
+        self._running = set()
+        self.removed = 0
+        self.retried = 0
+        self.abandoned = 0
+        self.postponed = 0
+
+    def start(self, bot):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run(bot))
+
+    async def add(self, guild_id, user_id, role_id, expires_at):
+        async with db.transaction() as tx:
+            rows = await tx.fetch("INSERT INTO temporary_roles (guild_id, user_id, role_id, expires_at) VALUES (?, ?, ?, ?) RETURNING id",
+                                  (guild_id, user_id, role_id, expires_at))
+        entry = TemporaryRole(rows[0][0], guild_id, user_id, role_id, expires_at)
+        # Past the loaded window the row is picked up when the window gets there, and a
+        # window load running alongside the insert may have picked it up already
+        if expires_at < self._loaded_until and entry.id not in self._entries:
+            self._schedule(entry)
+        return entry
+
+    def _schedule(self, entry):
+        self._entries[entry.id] = entry
+        heapq.heappush(self._heap, (entry.expires_at, entry.id))
+        if self._heap[0][1] == entry.id:
+            self._wakeup.set()
+
+    async def _load(self, until):
+        # The window moves first so that roles added while the query runs schedule themselves
+        start, self._loaded_until = self._loaded_until, until
+        try:
+            rows = await db.fetch("SELECT id, guild_id, user_id, role_id, expires_at, attempts FROM temporary_roles WHERE expires_at >= ? AND expires_at < ?",
+                                  (start, until))
+        except Exception:
+            self._loaded_until = start
+            raise
+        for row in rows:
+            # Rows added while the query ran may be scheduled already
+            if row[0] not in self._entries:
+                entry = TemporaryRole(*row)
+                self._entries[entry.id] = entry
+                self._heap.append((entry.expires_at, entry.id))
+        heapq.heapify(self._heap)
+
+    async def _run(self, bot):
+        while True:
+            try:
+                now = time.time()
+                if self._loaded_until - now < self.window / 2:
+                    await self._load(now + self.window)
+                due = self._pop_due(now)
+                for guild_id, entries in due.items():
+                    task = asyncio.ensure_future(self._expire_guild(bot, guild_id, entries))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+
+                wake_at = self._loaded_until - self.window / 2
+                if self._heap:
+                    wake_at = min(wake_at, self._heap[0][0])
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(0.0, wake_at - time.time()))
+                except asyncio.TimeoutError:
+                    pass
+            except Exception as e:
+                print(f"Temporary role scheduler error: {e}")
+                await asyncio.sleep(RETRY_BASE)
+
+    def _pop_due(self, now):
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, entry_id = heapq.heappop(self._heap)
+            entry = self._entries.get(entry_id)
+            if entry is not None:
+                due.setdefault(entry.guild_id, []).append(entry)
+        return due
+
+    async def _expire_guild(self, bot, guild_id, entries):
+        async with self._guilds:
+            guild = bot.get_guild(guild_id)
+            if guild is None:
+                # Unavailable for now; on_guild_remove drops the rows if the bot has left
+                self.postponed += len(entries)
+                await self._settle([], [], entries)
+                return
+
+            finished, failed = [], []
+            for entry in entries:
+                member = guild.get_member(entry.user_id)
+                role = guild.get_role(entry.role_id)
+                # A member who left or a deleted role leaves nothing to remove
+                if member is None or role is None or role not in member.roles:
+                    finished.append(entry)
+                    continue
+                try:
+                    await member.remove_roles(role, reason="Temporary role expired")
+                except discord.NotFound:
+                    finished.append(entry)
+                    continue
+                except discord.HTTPException as e:
+                    print(f"Failed to remove temporary role {role.id} from {member.id}: {e}")
+                    failed.append(entry)
+                    continue
+                finished.append(entry)
+                self.removed += 1
+
+                embed = discord.Embed(title="Temporary Role Expired", color=discord.Color.orange())
+                embed.add_field(name="Member", value=member.mention, inline=False)
+                embed.add_field(name="Role", value=role.mention, inline=False)
+                try:
+                    await log_event(guild, "temporary_role", embed, user_id=member.id)
+                except Exception as e:
+                    print(f"Failed to log the expiry of temporary role {role.id} of {member.id}: {e}")
+            await self._settle(finished, failed)
+
+    async def _settle(self, finished, failed, postponed=()):
+        now = time.time()
+        retries = []
+        for entry in postponed:
+            entry.expires_at = now + UNAVAILABLE_RETRY
+            retries.append(entry)
+        for entry in failed:
+            entry.attempts += 1
+            if entry.attempts >= MAX_ATTEMPTS:
+                print(f"Giving up on temporary role {entry.role_id} of {entry.user_id} in {entry.guild_id} after {entry.attempts} attempts")
+                self.abandoned += 1
+                finished.append(entry)
+            else:
+                entry.expires_at = now + min(RETRY_BASE * 2 ** (entry.attempts - 1), RETRY_MAX)
+                retries.append(entry)
+                self.retried += 1
+
+        try:
+            async with db.transaction() as tx:
+                if finished:
+                    await tx.executemany("DELETE FROM temporary_roles WHERE id = ?", [(entry.id,) for entry in finished])
+                if retries:
+                    await tx.executemany("UPDATE temporary_roles SET expires_at = ?, attempts = ? WHERE id = ?",
+                                         [(entry.expires_at, entry.attempts, entry.id) for entry in retries])
+        except Exception as e:
+            # The rows are unchanged, so everything is tried again once it's due
+            print(f"Failed to save {len(finished) + len(retries)} temporary role expiries: {e}")
+            retries += finished
+            finished = []
+            for entry in retries:
+                entry.expires_at = now + RETRY_BASE
+
+        for entry in finished:
+            self._entries.pop(entry.id, None)
+        for entry in retries:
+            if entry.expires_at < self._loaded_until:
+                self._schedule(entry)
+            else:
+                self._entries.pop(entry.id, None)
+
+    async def forget_guild(self, guild_id):
+        await db.execute("DELETE FROM temporary_roles WHERE guild_id = ?", (guild_id,))
+        # Their heap items are skipped once nothing in _entries matches them
+        for entry_id in [entry.id for entry in self._entries.values() if entry.guild_id == guild_id]:
+            del self._entries[entry_id]
+
+    def stats(self):
+        return {
+            "scheduled": len(self._entries),
+            "queued": len(self._heap),
+            "removed": self.removed,
+            "retried": self.retried,
+            "abandoned": self.abandoned,
+            "postponed": self.postponed,
+        }
+
+
+role_expiry = RoleExpiryScheduler()
+
+
+def setup_role_expiry(bot):
+    @bot.listen("on_guild_remove")
+    async def drop_temporary_roles(guild):
+        await role_expiry.forget_guild(guild.id)
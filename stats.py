@@ -0,0 +1,147 @@
+import asyncio
+import os
+import time
+import discord
+from discord.ext import commands, tasks
+from metrics import metrics, timed_event
+from guild_config import guild_configs
+from actions import action_dispatcher
+from deletions import message_deleter
+from log_buffer import log_buffer
+from audit_cache import audit_correlator
+from message_store import message_store
+from log_archive import event_archive
+from raid import raid_guard
+from role_expiry import role_expiry
+from assets import logo
+from renderer import renderer
+from membership import membership_index
+from mod_routing import mod_routing
+from reports import report_aggregator
+
+METRICS_FILE = os.getenv('METRICS_FILE', 'peacekeeper.prom')
+
+COMPONENTS = {
+    "guild_config": guild_configs,
+    "actions": action_dispatcher,
+    "deletions": message_deleter,
+    "log_buffer": log_buffer,
+    "audit_cache": audit_correlator,
+    "message_store": message_store,
+    "log_archive": event_archive,
+    "raid": raid_guard,
+    "role_expiry": role_expiry,
+    "logo": logo,
+    "renderer": renderer,
+    "mod_routing": mod_routing,
+    "reports": report_aggregator,
+}
+
+
+def component_gauges():
+    for component, source in COMPONENTS.items():
+        for key, value in source.stats().items():
+            if isinstance(value, (int, float)):
+                yield f"{component}_{key}", {}, value
+    for action, stats in action_dispatcher.stats()["actions"].items():
+        for key, value in stats.items():
+            yield f"action_{key}", {"action": action}, value
+    yield "membership_index_users", {}, len(membership_index)
+
+
+def instrument_http(http):
+    # Counts and times every REST call py-cord makes, by route template
+    request = http.request
+
+    async def timed_request(route, *args, **kwargs):
+        histogram = metrics.histogram("rest_seconds", method=route.method, route=route.path)
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await request(route, *args, **kwargs)
+        except discord.HTTPException as e:
+            status = str(e.status)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start)
+            metrics.increment("rest_requests_total", method=route.method, route=route.path, status=status)
+
+    http.request = timed_request
+
+
+def setup_stats(bot):
+    # Runs after every other setup so it can wrap the handlers they registered
+    for name, handler in list(vars(bot).items()):
+        if name.startswith("on_") and asyncio.iscoroutinefunction(handler):
+            setattr(bot, name, timed_event(name, handler))
+    instrument_http(bot.http)
+    metrics.register_gauges(component_gauges)
+
+    @bot.before_invoke
+    async def start_command_timer(ctx):
+        ctx.started_at = time.perf_counter()
+
+    @bot.after_invoke
+    async def stop_command_timer(ctx):
+        started_at = getattr(ctx, "started_at", None)
+        if started_at is not None:
+            metrics.histogram("command_seconds", command=ctx.command.qualified_name).observe(time.perf_counter() - started_at)
+
+    @tasks.loop(seconds=15)
+    async def export_metrics():
+        text = metrics.render()
+        # Write then rename so a scraper never reads a half-written file
+        await asyncio.get_running_loop().run_in_executor(None, write_metrics_file, text)
+
+    def write_metrics_file(text):
+        temporary = f"{METRICS_FILE}.tmp"
+        with open(temporary, "w") as f:
+            f.write(text)
+        os.replace(temporary, METRICS_FILE)
+
+    @bot.listen("on_ready")
+    async def start_metrics_export():
+        if not export_metrics.is_running():
+            export_metrics.start()
+
+    def timing_lines(family, label, limit=6):
+        series = sorted(metrics.collect(family), key=lambda item: item[1].sum, reverse=True)[:limit]
+        lines = []
+        for labels, histogram in series:
+            lines.append(f"`{labels[label]}` {histogram.count}x, avg {histogram.average * 1000:.1f}ms, p99 ≤{histogram.quantile(0.99) * 1000:.0f}ms")
+        return "\n".join(lines) or "No data yet"
+
+    @bot.slash_command(name="stats", description="Show the bot's performance metrics")
+    @commands.is_owner()
+    async def stats(ctx):
+        embed = discord.Embed(title="Bot Stats", color=discord.Color.blue())
+        embed.add_field(name="Event Handlers", value=timing_lines("event_seconds", "event"), inline=False)
+        embed.add_field(name="Commands", value=timing_lines("command_seconds", "command"), inline=False)
+        embed.add_field(name="Database Queries", value=timing_lines("db_query_seconds", "query"), inline=False)
+
+        rest = metrics.counter_values("rest_requests_total")
+        total = sum(value for _, value in rest)
+        failed = sum(value for labels, value in rest if labels["status"] != "ok")
+        embed.add_field(name="REST Calls", value=f"{total} calls, {failed} failed\n{timing_lines('rest_seconds', 'route', 4)}", inline=False)
+
+        config = guild_configs.stats()
+        store = message_store.stats()
+        store_lookups = store["memory_hits"] + store["disk_hits"] + store["misses"]
+        embed.add_field(name="Caches", value=(
+            f"Guild config: {config['hit_rate']:.1%} hits ({config['guilds']} guilds)\n"
+            f"Message store: {(store['memory_hits'] + store['disk_hits']) / store_lookups if store_lookups else 0:.1%} found, {store['memory_messages']} in memory\n"
+            f"Membership index: {len(membership_index)} users"
+        ), inline=False)
+
+        actions = action_dispatcher.stats()
+        deletions = message_deleter.stats()
+        logs = log_buffer.stats()
+        archive = event_archive.stats()
+        embed.add_field(name="Queues", value=(
+            f"Actions: {actions['depth']} queued, {actions['dropped']} dropped\n"
+            f"Deletions: {deletions['pending']} pending, {deletions['saved']} requests saved\n"
+            f"Log buffer: {logs['depth']} queued, {logs['merged']} merged, {logs['dropped']} dropped\n"
+            f"Log archive: {archive['pending']} pending, {archive['dropped']} dropped\n"
+            f"Raid actions: {raid_guard.stats()['pending_actions']} pending"
+        ), inline=False)
+        await ctx.respond(embed=embed, ephemeral=True)
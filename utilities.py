@@ -1,10 +1,7 @@
 import discord
 from discord.ext import commands
-import PIL.Image
-import PIL.ImageDraw
-import PIL.ImageFont
-import os
-from db_utils import execute_db_query
+from renderer import renderer, letter_avatar
+from mod_routing import mod_routing
 import datetime
 
 def setup_utilities(bot):
@@ -15,18 +12,7 @@ def setup_utilities(bot):
         embed = discord.Embed(title=guild.name, description=f"ID: {guild.id}", color=discord.Color.blurple())
         
         if guild.icon is None:
-            image = PIL.Image.new("RGB", (400, 400), color="black")
-            draw = PIL.ImageDraw.Draw(image)
-            font_size = 200
-            font = PIL.ImageFont.truetype("arial.ttf", font_size)
-            text = guild.name[0].upper()
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            text_position = ((400 - text_width) // 2, (400 - text_height) // 2)
-            draw.text(text_position, text, fill="white", font=font)
-            image.save("thumbnail.png")
-            file = discord.File("thumbnail.png", filename="thumbnail.png")
+            file = await renderer.file("thumbnail.png", letter_avatar, guild.name[0].upper())
             embed.set_thumbnail(url="attachment://thumbnail.png")
         else:
             embed.set_thumbnail(url=guild.icon.url)
@@ -44,7 +30,6 @@ def setup_utilities(bot):
             await ctx.respond(embed=embed)
         else:
             await ctx.respond(embed=embed, file=file)
-            os.remove("thumbnail.png")
     
     @bot.slash_command(name="user_info", description="Get information about a user")
     @commands.has_permissions(moderate_members=True)
@@ -149,28 +134,15 @@ def setup_utilities(bot):
     async def user_to_id(ctx, user: discord.User):
         await ctx.respond(user.id)
 
-async def findRolesByPermission(ctx, permission):
-    roles = []
-    for role in ctx.guild.roles:
-        if role.permissions.administrator:
-            roles.append(role)
-        elif getattr(role.permissions, permission):
-            roles.append(role)
-    return roles
-
 async def sendToModChannel(ctx, message, ping):
-    result = execute_db_query("SELECT * FROM mod_channels WHERE guild_id = ?", (ctx.guild.id,))
-    if not result:
+    route = await mod_routing.get(ctx.guild)
+    if route.channel_id is None:
         await ctx.respond("Mod log channel not set.")
         return
-    channel_id = result[0][1]
-    channel = await ctx.guild.fetch_channel(channel_id)
-    if channel is None:
+    if route.channel is None:
         await ctx.respond("Mod log channel not found.")
-        return          
-    modroles = await findRolesByPermission(ctx, "kick_members")  
-    modrolepings = " ".join([role.mention for role in modroles]) 
+        return
+    pings = route.pings if ping else ""
     if isinstance(message, discord.Embed):
-        await channel.send(modrolepings if ping else None, embed=message)
-    else:
-        await channel.send(message, modrolepings if ping else None)
\ No newline at end of file
+        return await route.channel.send(pings or None, embed=message)
+    return await route.channel.send(f"{pings}\n{message}" if pings else message)
@@ -1,7 +1,9 @@
 import discord
 from discord.ext import commands
 from discord.commands import Option
-from db_utils import execute_db_query
+from db_utils import db
+from guild_config import guild_configs
+from raid import raid_guard
 
 class VerificationView(discord.ui.View):
     def __init__(self, role_id):
@@ -10,6 +12,10 @@ class VerificationView(discord.ui.View):
 
     @discord.ui.button(style=discord.ButtonStyle.green, label="Verify", custom_id="verify")
     async def verify_button(self, button: discord.ui.Button, interaction: discord.Interaction):
+        config = await guild_configs.get(interaction.guild.id)
+        if raid_guard.holds(interaction.guild.id, interaction.user, config):
+            await interaction.response.send_message("Verification is paused for new accounts while the server is under a raid. Please try again later.", ephemeral=True)
+            return
         role = interaction.guild.get_role(self.role_id)
         if role:
             await interaction.user.add_roles(role)
@@ -18,9 +24,6 @@ class VerificationView(discord.ui.View):
             await interaction.response.send_message("The verification role could not be found. Please contact a server administrator.", ephemeral=True)
 
 def setup_verification(bot):
-    execute_db_query('''CREATE TABLE IF NOT EXISTS verification_messages
-                        (guild_id INTEGER, channel_id INTEGER, message_id INTEGER, role_id INTEGER)''')
-
     @bot.slash_command(name="set_verification", description="Set up a verification message with a button")
     @commands.has_permissions(manage_roles=True)
     async def set_verification(
@@ -72,7 +75,7 @@ def setup_verification(bot):
             await message.delete()
 
         # Delete old verification message if it exists
-        old_verification = execute_db_query("SELECT channel_id, message_id FROM verification_messages WHERE guild_id = ?", (ctx.guild.id,))
+        old_verification = await db.fetch("SELECT channel_id, message_id FROM verification_messages WHERE guild_id = ?", (ctx.guild.id,))
         if old_verification:
             old_channel_id, old_message_id = old_verification[0]
             old_channel = bot.get_channel(old_channel_id)
@@ -84,7 +87,7 @@ def setup_verification(bot):
                     pass
 
         # Update the database
-        execute_db_query("INSERT OR REPLACE INTO verification_messages VALUES (?, ?, ?, ?)", 
+        await db.execute("INSERT OR REPLACE INTO verification_messages VALUES (?, ?, ?, ?)", 
                          (ctx.guild.id, channel.id, new_message.id, role.id))
 
         await ctx.respond(f"Verification message set up successfully. Users can now verify by clicking the button to receive the {role.name} role.", ephemeral=True)
@@ -94,7 +97,7 @@ def setup_verification(bot):
     async def delete_verification(ctx):
         await ctx.defer()
 
-        verification = execute_db_query("SELECT channel_id, message_id FROM verification_messages WHERE guild_id = ?", (ctx.guild.id,))
+        verification = await db.fetch("SELECT channel_id, message_id FROM verification_messages WHERE guild_id = ?", (ctx.guild.id,))
         if not verification:
             await ctx.respond("There is no verification message set for this server.", ephemeral=True)
             return
@@ -108,5 +111,5 @@ def setup_verification(bot):
             except discord.NotFound:
                 pass
 
-        execute_db_query("DELETE FROM verification_messages WHERE guild_id = ?", (ctx.guild.id,))
+        await db.execute("DELETE FROM verification_messages WHERE guild_id = ?", (ctx.guild.id,))
         await ctx.respond("The verification message has been deleted.", ephemeral=True)
\ No newline at end of file
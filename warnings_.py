@@ -2,12 +2,9 @@ import discord
 from discord.commands import Option
 from discord.ext import commands
 from datetime import datetime
-from db_utils import execute_db_query
+from db_utils import db
 
 def setup_warnings(bot):
-    execute_db_query('''CREATE TABLE IF NOT EXISTS warnings
-                 (guild_id INTEGER, user_id INTEGER, moderator_id INTEGER, reason TEXT, timestamp TEXT, message_id INTEGER)''')
-
     class WarningPaginator(discord.ui.View):
         def __init__(self, warnings, user):
             super().__init__(timeout=60)
@@ -77,7 +74,7 @@ def setup_warnings(bot):
         except discord.Forbidden:
             message_id = None
         
-        execute_db_query("INSERT INTO warnings VALUES (?, ?, ?, ?, ?, ?)", (ctx.guild.id, member.id, ctx.author.id, reason, timestamp, message_id))
+        await db.execute("INSERT INTO warnings VALUES (?, ?, ?, ?, ?, ?)", (ctx.guild.id, member.id, ctx.author.id, reason, timestamp, message_id))
 
         embed = discord.Embed(title="User Warned", description=f"{member.mention} has been warned.", color=discord.Color.orange())
         embed.add_field(name="Reason", value=reason)
@@ -87,7 +84,7 @@ def setup_warnings(bot):
     @commands.has_permissions(manage_messages=True)
     async def warnings(ctx, member: Option(discord.Member, "The member to check warnings for")):
         await ctx.defer()
-        warnings = execute_db_query("SELECT * FROM warnings WHERE guild_id = ? AND user_id = ?", (ctx.guild.id, member.id))
+        warnings = await db.fetch("SELECT * FROM warnings WHERE guild_id = ? AND user_id = ?", (ctx.guild.id, member.id))
 
         if not warnings:
             await ctx.respond(f"{member.mention} has no warnings.")
@@ -101,7 +98,7 @@ def setup_warnings(bot):
     @commands.has_permissions(administrator=True)
     async def remove_warning(ctx, member: Option(discord.Member, "The member to remove a warning from"), warning_index: Option(int, "The index of the warning to remove")):
         await ctx.defer()
-        warnings = execute_db_query("SELECT * FROM warnings WHERE guild_id = ? AND user_id = ?", (ctx.guild.id, member.id))
+        warnings = await db.fetch("SELECT * FROM warnings WHERE guild_id = ? AND user_id = ?", (ctx.guild.id, member.id))
 
         if not warnings:
             await ctx.respond(f"{member.mention} has no warnings.")
@@ -112,7 +109,7 @@ def setup_warnings(bot):
             return
 
         warning = warnings[warning_index - 1]
-        execute_db_query("DELETE FROM warnings WHERE guild_id = ? AND user_id = ? AND moderator_id = ? AND reason = ? AND timestamp = ? AND message_id = ?", warning)
+        await db.execute("DELETE FROM warnings WHERE guild_id = ? AND user_id = ? AND moderator_id = ? AND reason = ? AND timestamp = ? AND message_id = ?", warning)
 
         embed = discord.Embed(title="Warning Removed", description=f"Warning {warning_index} has been removed from {member.mention}.", color=discord.Color.green())
         
@@ -133,10 +130,10 @@ def setup_warnings(bot):
     @commands.has_permissions(administrator=True)
     async def clear_warnings(ctx, member: Option(discord.Member, "The member to clear warnings for")):
         await ctx.defer()
-        warnings = execute_db_query("SELECT message_id FROM warnings WHERE guild_id = ? AND user_id = ?", (ctx.guild.id, member.id))
+        warnings = await db.fetch("SELECT message_id FROM warnings WHERE guild_id = ? AND user_id = ?", (ctx.guild.id, member.id))
         message_ids = [row[0] for row in warnings if row[0] is not None]
 
-        execute_db_query("DELETE FROM warnings WHERE guild_id = ? AND user_id = ?", (ctx.guild.id, member.id))
+        await db.execute("DELETE FROM warnings WHERE guild_id = ? AND user_id = ?", (ctx.guild.id, member.id))
 
         embed = discord.Embed(title="Warnings Cleared", description=f"All warnings have been cleared for {member.mention}.", color=discord.Color.green())
 
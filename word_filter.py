@@ -0,0 +1,187 @@
+from collections import deque
+
+# Lookalike characters folded onto the letter they imitate. Every character maps to a
+# single letter so the automaton stays deterministic.
+CONFUSABLES = {
+    "a": "@4аαá",
+    "b": "8в",
+    "c": "сϲ¢",
+    "e": "3еε€é",
+    "g": "9",
+    "h": "һ",
+    "i": "1!|іíι",
+    "k": "кκ",
+    "m": "м",
+    "n": "п",
+    "o": "0оοóø",
+    "p": "рρ",
+    "s": "5$ѕ",
+    "t": "7+т",
+    "u": "υú",
+    "x": "х×",
+    "y": "уý",
+}
+
+_CONFUSABLE_FOLD = {variant: letter for letter, variants in CONFUSABLES.items() for variant in variants}
+
+
+def _fold_char(ch, confusables):
+    lower = ch.lower()
+    if len(lower) != 1:
+        lower = ch
+    if confusables:
+        lower = _CONFUSABLE_FOLD.get(lower, lower)
+    return lower
+
+
+class WordFilter:
+    # Aho-Corasick automaton over the filtered words. Case folding and, optionally,
+    # lookalike folding are baked into the goto edges (every variant of a letter points
+    # at the same child), so matching walks the raw message once and the returned spans
+    # index straight into it.
+    def __init__(self, words=(), whole_words=False, confusables=False):
+        self.whole_words = whole_words
+        self.confusables = confusables
+        self.words = set()
+        self._variants = {}
+        self._reset()
+        for word in words:
+            self.add(word)
+
+    def _reset(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._own = [0]
+        self._out = [()]
+        self._dirty = False
+        self._stale = False
+
+    def _variants_of(self, letter):
+        variants = self._variants.get(letter)
+        if variants is None:
+            variants = {letter}
+            upper = letter.upper()
+            if len(upper) == 1:
+                variants.add(upper)
+            if self.confusables:
+                for variant in CONFUSABLES.get(letter, ""):
+                    variants.add(variant)
+                    if len(variant.upper()) == 1:
+                        variants.add(variant.upper())
+            self._variants[letter] = variants
+        return variants
+
+    def _insert(self, word):
+        node = 0
+        for ch in word:
+            letter = _fold_char(ch, self.confusables)
+            child = self._goto[node].get(letter)
+            if child is None:
+                child = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append(0)
+                self._out.append(())
+                for variant in self._variants_of(letter):
+                    self._goto[node][variant] = child
+            node = child
+        self._own[node] = len(word)
+        self._dirty = True
+
+    def _build(self):
+        if self._stale:
+            self._reset()
+            for word in self.words:
+                self._insert(word)
+        goto, fail, own, out = self._goto, self._fail, self._own, self._out
+        out[0] = ()
+        queue = deque()
+        seen = set()
+        for child in goto[0].values():
+            if child not in seen:
+                seen.add(child)
+                fail[child] = 0
+                out[child] = (own[child],) if own[child] else ()
+                queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                if child in seen:
+                    continue
+                seen.add(child)
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                target = goto[state].get(ch, 0)
+                fail[child] = target if target != child else 0
+                out[child] = ((own[child],) if own[child] else ()) + out[fail[child]]
+                queue.append(child)
+        self._dirty = False
+        self._stale = False
+
+    def add(self, word):
+        if not word or word in self.words:
+            return
+        self.words.add(word)
+        if not self._stale:
+            self._insert(word)
+
+    def remove(self, word):
+        if word in self.words:
+            self.words.discard(word)
+            # Tries can't drop a branch cheaply once failure links point into it, so the
+            # automaton is rebuilt from the remaining words on the next match
+            self._stale = True
+
+    def clear(self):
+        self.words.clear()
+        self._reset()
+
+    def configure(self, whole_words=None, confusables=None):
+        if whole_words is not None:
+            self.whole_words = whole_words
+        if confusables is not None and confusables != self.confusables:
+            self.confusables = confusables
+            self._variants.clear()
+            self._stale = True
+
+    def find_all(self, text):
+        if not self.words:
+            return []
+        if self._dirty or self._stale:
+            self._build()
+        goto, fail, out = self._goto, self._fail, self._out
+        spans = []
+        node = 0
+        for i, ch in enumerate(text):
+            edges = goto[node]
+            while node and ch not in edges:
+                node = fail[node]
+                edges = goto[node]
+            node = edges.get(ch, 0)
+            if out[node]:
+                end = i + 1
+                for length in out[node]:
+                    start = end - length
+                    if self.whole_words and ((start > 0 and text[start - 1].isalnum()) or (end < len(text) and text[end].isalnum())):
+                        continue
+                    spans.append((start, end))
+        return spans
+
+    def censor(self, text):
+        spans = self.find_all(text)
+        if not spans:
+            return None
+        spans.sort()
+        parts = []
+        last = 0
+        start, end = spans[0]
+        for next_start, next_end in spans[1:]:
+            if next_start <= end:
+                end = max(end, next_end)
+                continue
+            parts.append(f"{text[last:start]}||{text[start:end]}||")
+            last = end
+            start, end = next_start, next_end
+        parts.append(f"{text[last:start]}||{text[start:end]}||{text[end:]}")
+        return "".join(parts)